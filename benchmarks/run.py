@@ -0,0 +1,135 @@
+"""Benchmarks of the pipeline's hot paths, compared against stored JSON baselines.
+
+Usage: python -m benchmarks.run [--tier stub|real] [--only NAME ...] [--repeat N] [--threshold 0.25] [--save]
+
+The 'stub' tier runs offline on synthetic photos with deterministic stand-ins for SAM, BERT and Ollama (see
+benchmarks/stubs.py). The 'real' tier uses the real models, skipping the benchmarks whose weights (or Ollama server)
+are not available. Each benchmark is timed after a warm-up run and its fastest time, the least disturbed by other
+load on the machine, is compared with benchmarks/baselines/<tier>.json: more than --threshold and more than
+NOISE_FLOOR seconds per call slower fails the run (exit status 1). --save writes the results as the new baseline.
+
+A benchmark is timed with as many repetitions as its baseline was recorded with (--repeat, default 5, for new ones);
+an explicit --repeat that differs is reported but not compared, as the best of fewer runs is slower. Baselines are
+machine-specific: against a baseline recorded on another machine (platform, Python version or CPU count) the results
+are only reported, record one with --save on the machine that checks them. Benchmarks that are skipped or missing
+from the baseline are listed as not checked at the end. The committed stub.json comes from a machine without torch,
+so predict_categories and end_to_end are never checked against it.
+"""
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import tempfile
+import statistics
+from contextlib import ExitStack
+from benchmarks.stubs import make_images, stub_models
+from benchmarks.suite import BENCHMARKS, Context
+from model_loader import ModelLoader
+from utils.metrics import metrics
+
+BASELINE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baselines')
+REGRESSION_THRESHOLD = 0.25  # Fraction a benchmark may be slower than its baseline
+NOISE_FLOOR = 100e-6  # Seconds per call a benchmark may be slower regardless, scheduling noise on sub-100us paths
+DEFAULT_REPEAT = 5
+IMAGES = 8
+
+def time_benchmark(run, number: int, repeat: int) -> list:
+    """Seconds per call of each repetition, after one untimed warm-up repetition."""
+    times = []
+    for repetition in range(repeat + 1):
+        start = time.perf_counter()
+        for _ in range(number):
+            run()
+        if repetition:
+            times.append((time.perf_counter() - start) / number)
+    return times
+
+def available_models(model_loader, names) -> set:
+    available = set()
+    for name in names:
+        try:
+            model_loader.get(name)
+            available.add(name)
+        except Exception:
+            pass
+    return available
+
+def machine() -> dict:
+    return {'platform': platform.platform(), 'python': platform.python_version(), 'cpus': os.cpu_count()}
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the listing pipeline against stored baselines.")
+    parser.add_argument('--tier', choices=['stub', 'real'], default='stub')
+    parser.add_argument('--only', nargs='+', help="Run only these benchmarks")
+    parser.add_argument('--repeat', type=int, help="Timed repetitions per benchmark (default: the baseline's)")
+    parser.add_argument('--threshold', type=float, default=REGRESSION_THRESHOLD)
+    parser.add_argument('--save', action='store_true', help="Store the results as the tier's baseline")
+    args = parser.parse_args()
+    metrics.jsonl_path = None  # Keep benchmark runs out of the metrics log
+
+    baseline_path = os.path.join(BASELINE_DIR, f'{args.tier}.json')
+    baseline, same_machine = {}, True
+    if os.path.exists(baseline_path):
+        with open(baseline_path, encoding='utf-8') as f:
+            stored = json.load(f)
+        baseline, same_machine = stored['results'], stored.get('machine') == machine()
+
+    benchmarks = [bench for bench in BENCHMARKS if not args.only or bench.name in args.only]
+    results, regressions, unchecked = {}, [], []
+    with ExitStack() as stack, tempfile.TemporaryDirectory() as image_dir:
+        if args.tier == 'stub':
+            model_loader = stack.enter_context(stub_models())
+        else:
+            model_loader = ModelLoader()
+            model_loader.start()
+            stack.callback(model_loader.shutdown)
+        available = available_models(model_loader, {name for bench in benchmarks for name in bench.requires})
+        context = Context(model_loader, image_dir, make_images(image_dir, IMAGES))
+
+        print(f"{args.tier} tier")
+        if baseline and not same_machine:
+            print(f"Baseline {baseline_path} was recorded on another machine, results are not compared")
+        print(f"{'benchmark':<22} {'time':>10} {'baseline':>10} {'change':>8}  best of")
+        for bench in benchmarks:
+            missing = [name for name in bench.requires if name not in available]
+            if missing:
+                print(f"{bench.name:<22} skipped, no {', '.join(missing)}")
+                unchecked.append(f"{bench.name} (no {', '.join(missing)})")
+                continue
+            reference = baseline.get(bench.name)
+            repeat = args.repeat or (reference['repeat'] if reference else DEFAULT_REPEAT)
+            times = time_benchmark(bench.setup(context), bench.number, repeat)
+            results[bench.name] = {
+                'min': min(times), 'median': statistics.median(times), 'repeat': repeat, 'number': bench.number
+            }
+            line = f"{bench.name:<22} {min(times) * 1000:>8.3f}ms"
+            if reference is None:
+                unchecked.append(f"{bench.name} (no baseline)")
+            elif reference['repeat'] != repeat:
+                unchecked.append(f"{bench.name} (baseline is best of {reference['repeat']})")
+            elif same_machine:
+                change = min(times) / reference['min'] - 1
+                line += f" {reference['min'] * 1000:>8.3f}ms {change:>+8.1%}"
+                if change > args.threshold and min(times) - reference['min'] > NOISE_FLOOR:
+                    regressions.append(bench.name)
+                    line += "  REGRESSION"
+            print(f"{line:<53} {repeat}")
+
+    if args.save:
+        os.makedirs(BASELINE_DIR, exist_ok=True)
+        with open(baseline_path, 'w', encoding='utf-8') as f:
+            json.dump({
+                'machine': machine(),
+                'results': {**(baseline if same_machine else {}), **results},
+            }, f, indent=2, sort_keys=True)
+        print(f"Baseline saved to {baseline_path}")
+    if unchecked and not args.save:
+        print(f"Not checked against the baseline: {', '.join(unchecked)}")
+    if regressions and not args.save:
+        print(f"Slower than baseline by more than {args.threshold:.0%}: {', '.join(regressions)}")
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
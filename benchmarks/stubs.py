@@ -0,0 +1,165 @@
+"""Deterministic stand-ins for SAM, the BERT classifier and Ollama, so the benchmarks run offline without weights.
+
+The stubs only mimic the interfaces the pipeline calls, cheaply, so timings measure the code around the models.
+"""
+import os
+import zlib
+import numpy as np
+import cv2
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+import engine
+import image_processing
+import utils.listing_utils as listing_utils
+from utils.fake_ollama import FakeOllamaServer
+
+def make_images(directory: str, n: int, size=(3024, 4032), seed: int = 0) -> List[str]:
+    """n synthetic phone-sized JPEGs: a noisy background with a differently colored garment-like block."""
+    os.makedirs(directory, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    h, w = size
+    image_paths = []
+    for i in range(n):
+        image = rng.integers(0, 40, (h, w, 3), dtype=np.uint8) + rng.integers(0, 215, 3, dtype=np.uint8)
+        garment = image[h // 5:4 * h // 5, w // 4:3 * w // 4]
+        garment[:] = rng.integers(0, 40, garment.shape, dtype=np.uint8) + rng.integers(0, 215, 3, dtype=np.uint8)
+        image_path = os.path.join(directory, f'image_{i}.jpg')
+        cv2.imwrite(image_path, image)
+        image_paths.append(image_path)
+    return image_paths
+
+class _Array:
+    """Just enough of a torch tensor for image_processing: .cpu().numpy()."""
+    def __init__(self, array: np.ndarray):
+        self.array = array
+
+    def cpu(self):
+        return self
+
+    def numpy(self) -> np.ndarray:
+        return self.array
+
+    def __len__(self):
+        return len(self.array)
+
+    def __getitem__(self, index):
+        return _Array(self.array[index])
+
+class _Masks:
+    def __init__(self, mask: np.ndarray):
+        self.data = _Array(mask[None].astype(np.float32))
+
+class _Result:
+    def __init__(self, mask: np.ndarray):
+        self.masks = _Masks(mask)
+
+class StubSAM:
+    """Segments the central ellipse covering half of the image's width and height, whatever the prompt."""
+    def mask(self, image_rgb: np.ndarray) -> np.ndarray:
+        h, w = image_rgb.shape[:2]
+        y, x = np.ogrid[:h, :w]
+        return ((x - w / 2) / (w / 4)) ** 2 + ((y - h / 2) / (h / 4)) ** 2 <= 1
+
+    def __call__(self, image_rgb: np.ndarray, **kwargs) -> List[_Result]:
+        return [_Result(self.mask(image_rgb))]
+
+def stub_segment_images(images_rgb: List[np.ndarray], model: StubSAM, batch_size: int = 1, embedding_cache=None,
+                        keys: Optional[List[str]] = None) -> List[np.ndarray]:
+    """Drop-in for image_processing.segment_images, which drives SAM's predictor internals."""
+    return [model.mask(image_rgb) for image_rgb in images_rgb]
+
+class StubTokenizer:
+    """Lower-cased words hashed into a fixed vocabulary, with the call and pad interface of the fast tokenizer."""
+    VOCAB_SIZE = 4096
+
+    def __call__(self, texts: List[str], truncation: bool = True, max_length: int = 32) -> Dict[str, List[List[int]]]:
+        input_ids = []
+        for text in texts:
+            ids = [101] + [zlib.crc32(word.encode()) % (self.VOCAB_SIZE - 200) + 200 for word in text.lower().split()]
+            input_ids.append((ids[:max_length - 1] if truncation else ids) + [102])
+        return {'input_ids': input_ids, 'attention_mask': [[1] * len(ids) for ids in input_ids]}
+
+    def pad(self, encodings: Dict[str, List[List[int]]], return_tensors: str = 'pt'):
+        import torch
+
+        class Batch(dict):
+            def to(self, device):
+                return Batch({name: tensor.to(device) for name, tensor in self.items()}) if device else self
+
+        length = max(len(ids) for ids in encodings['input_ids'])
+        return Batch({
+            name: torch.tensor([ids + [0] * (length - len(ids)) for ids in encodings[name]])
+            for name in ('input_ids', 'attention_mask')
+        })
+
+def stub_bert(n_vinted: int, n_ebay: int, hidden: int = 256):
+    """A small two-head classifier with fixed random weights and the call signature of the fine-tuned model."""
+    import torch
+
+    class StubBert(torch.nn.Module):
+        def __init__(self):
+            super().__init__()
+            torch.manual_seed(0)
+            self.embeddings = torch.nn.Embedding(StubTokenizer.VOCAB_SIZE, hidden)
+            self.encoder = torch.nn.Sequential(
+                torch.nn.Linear(hidden, hidden), torch.nn.GELU(), torch.nn.Linear(hidden, hidden)
+            )
+            self.vinted_head = torch.nn.Linear(hidden, n_vinted)
+            self.ebay_head = torch.nn.Linear(hidden, n_ebay)
+
+        def forward(self, input_ids, attention_mask):
+            mask = attention_mask.unsqueeze(-1).float()
+            pooled = (self.encoder(self.embeddings(input_ids)) * mask).sum(1) / mask.sum(1)
+            return {'vinted_logits': self.vinted_head(pooled), 'ebay_logits': self.ebay_head(pooled)}
+
+    return StubBert().eval()
+
+class StubEncoder:
+    """LabelEncoder stand-in; only classes_ is used."""
+    def __init__(self, prefix: str, n: int):
+        self.classes_ = np.array([f'{prefix} category {i}' for i in range(n)])
+
+class StubModelLoader:
+    """ModelLoader with every model already loaded. The BERT stub is only built when torch is installed."""
+    def __init__(self):
+        self.device = None
+        self.models = {
+            'sam': StubSAM(),
+            'tokenizer': StubTokenizer(),
+            'vinted_encoder': StubEncoder('Vinted', 60),
+            'ebay_encoder': StubEncoder('eBay', 40),
+            'llm': True,
+        }
+        try:
+            self.models['bert'] = stub_bert(60, 40)
+        except ImportError:
+            pass
+
+    def is_ready(self, name: str) -> bool:
+        return name in self.models
+
+    def get(self, name: str, timeout: Optional[float] = None):
+        if name not in self.models:
+            raise RuntimeError(f"No stub for {name} (is torch installed?)")
+        return self.models[name]
+
+    def wait(self, names):
+        return [self.get(name) for name in names]
+
+    def shutdown(self):
+        pass
+
+@contextmanager
+def stub_models():
+    """Swaps SAM's batched segmentation for StubSAM and points the LLM clients at a FakeOllamaServer that
+    answers instantly. Yields the stub model loader."""
+    server = FakeOllamaServer(token_delay=0, first_token_delay=0).start()
+    saved = image_processing.segment_images, listing_utils.OLLAMA_HOST, engine.OLLAMA_HOST, listing_utils._client
+    image_processing.segment_images = stub_segment_images
+    listing_utils.OLLAMA_HOST = engine.OLLAMA_HOST = server.url
+    listing_utils._client = None
+    try:
+        yield StubModelLoader()
+    finally:
+        image_processing.segment_images, listing_utils.OLLAMA_HOST, engine.OLLAMA_HOST, listing_utils._client = saved
+        server.stop()
@@ -0,0 +1,125 @@
+"""The benchmarked hot paths. Each benchmark prepares its inputs once and returns the call to time."""
+import asyncio
+import numpy as np
+from collections import namedtuple
+from typing import Callable, Dict, List
+import image_processing
+from engine import ListingEngine, build_listing_attributes
+from utils.image_loader import image_buffers
+from utils.color_utils import color_map_ebay, color_map_vinted, find_closest_color
+from utils.listing_utils import PLATFORMS, create_chat_messages, parse_listing_text, merge_listing_text, agenerate_text
+from utils.fake_ollama import default_response
+
+# requires: the models the benchmark needs; number: calls per timed repetition, for sub-millisecond paths
+Benchmark = namedtuple('Benchmark', ['name', 'setup', 'requires', 'number'])
+BENCHMARKS: List[Benchmark] = []
+
+def benchmark(name: str, requires=(), number: int = 1):
+    def register(setup: Callable):
+        BENCHMARKS.append(Benchmark(name, setup, tuple(requires), number))
+        return setup
+    return register
+
+class Context:
+    """What the benchmarks share: the model loader of the tier and a directory of synthetic listing photos."""
+    def __init__(self, model_loader, image_dir: str, image_paths: List[str]):
+        self.model_loader = model_loader
+        self.image_dir = image_dir
+        self.image_paths = image_paths
+
+    def items(self, n: int, images_per_item: int = 2) -> List[Dict]:
+        descriptions = ["blue denim jacket", "black leather ankle boots", "floral summer dress", "grey wool jumper"]
+        return [{
+            'id': str(i),
+            'images': [self.image_paths[(i * images_per_item + j) % len(self.image_paths)] for j in range(images_per_item)],
+            'description': descriptions[i % len(descriptions)],
+            'gender': "Women" if i % 2 else "Men",
+            'size': "M",
+            'condition': "Very good",
+            'price': 20.0 + i,
+            'vinted': True,
+            'ebay': True,
+        } for i in range(n)]
+
+def _attributes(context: Context) -> Dict:
+    item = context.items(1)[0]
+    results = {'ebay_color': "Blue", 'vinted_color': "Blauw", 'vinted_category': "Jackets", 'ebay_category': "Coats, Jackets & Waistcoats"}
+    return build_listing_attributes(item, results)
+
+@benchmark('process_image', requires=['sam'])
+def process_image(context: Context):
+    """Decode, segmentation and dominant color of one photo, nothing cached."""
+    model = context.model_loader.get('sam')
+    image_path = context.image_paths[0]
+
+    def run():
+        image_buffers.clear()
+        image_processing.process_image(image_path, model)
+    return run
+
+@benchmark('find_closest_color', number=1000)
+def closest_color(context: Context):
+    """Palette lookup of one RGB color for both platforms."""
+    rgbs = iter(np.random.default_rng(0).integers(0, 256, (10 ** 6, 3)))
+
+    def run():
+        rgb = next(rgbs)
+        find_closest_color(rgb, color_map_ebay)
+        find_closest_color(rgb, color_map_vinted)
+    return run
+
+@benchmark('extract_colors', requires=['sam'])
+def extract_colors(context: Context):
+    """Colors of a listing of 8 photos through the batched, pipelined image processing."""
+    engine = ListingEngine(context.model_loader)
+    items = context.items(1, images_per_item=8)
+
+    def run():
+        image_buffers.clear()
+        engine.extract_colors(items)
+    return run
+
+@benchmark('predict_categories', requires=['bert', 'tokenizer', 'vinted_encoder', 'ebay_encoder'])
+def predict_categories(context: Context):
+    """Top-k categories of 64 items in length-bucketed batches."""
+    engine = ListingEngine(context.model_loader)
+    items = context.items(64)
+    return lambda: engine.predict_categories(items)
+
+@benchmark('create_chat_messages', number=1000)
+def chat_messages(context: Context):
+    """Prompt assembly of one listing, per platform and for both at once."""
+    attributes = _attributes(context)
+
+    def run():
+        create_chat_messages(attributes)
+        for platform in PLATFORMS:
+            create_chat_messages(attributes, platform)
+    return run
+
+@benchmark('parse_listing_text', number=1000)
+def parse_listing(context: Context):
+    """Parsing of a complete two-platform answer."""
+    listing_text = merge_listing_text({
+        platform: default_response([{'role': 'user', 'content': f"{platform} listing"}]) for platform in PLATFORMS
+    })
+    if not parse_listing_text(listing_text):
+        raise ValueError("The benchmark listing text does not parse")
+    return lambda: parse_listing_text(listing_text)
+
+@benchmark('generate_text', requires=['llm'])
+def generate_text(context: Context):
+    """Both platforms' listings of one item streamed concurrently, no listing cache."""
+    attributes = _attributes(context)
+    return lambda: asyncio.run(agenerate_text(attributes, PLATFORMS))
+
+@benchmark('end_to_end', requires=['sam', 'bert', 'tokenizer', 'vinted_encoder', 'ebay_encoder', 'llm'])
+def end_to_end(context: Context):
+    """ListingEngine.process of 4 items with 2 photos each: colors, categories and text, nothing cached."""
+    engine = ListingEngine(context.model_loader)
+    items = context.items(4)
+
+    def run():
+        image_buffers.clear()
+        engine.process(items, force=True)
+    return run
@@ -0,0 +1,122 @@
+"""Headless batch listing generation.
+
+Usage: python cli.py MANIFEST -o RESULTS.jsonl [--batch-size 64] [--resume] [--regenerate]
+
+MANIFEST is a .csv or .jsonl file with one item per row: 'images' (paths, ';'-separated in CSV), 'description',
+'gender', 'size', 'condition', 'price', 'platforms' ('vinted', 'ebay' or both, ';'-separated in CSV, default both)
+and optionally an 'id' (default: the row number). Each result is written as one JSON line as soon as its batch is
+done, so --resume can continue an interrupted run; it also retries the items whose last result was an error.
+"""
+import os
+import csv
+import sys
+import json
+import time
+import argparse
+from typing import Dict, Iterator, List
+from engine import ListingEngine
+from model_loader import ModelLoader
+from utils.disk_cache import DiskCache
+from utils.metrics import metrics
+from utils.config import (
+    CACHE_DB_PATH, COLOR_CACHE_MAX_ENTRIES, LISTING_CACHE_MAX_ENTRIES, LISTING_CACHE_TTL, CLI_BATCH_SIZE
+)
+
+def _split(value) -> List[str]:
+    if isinstance(value, list):
+        return value
+    return [part.strip() for part in str(value or '').split(';') if part.strip()]
+
+def read_manifest(path: str) -> Iterator[Dict]:
+    """Yields the manifest's items as the dicts the engine takes."""
+    with open(path, newline='', encoding='utf-8') as f:
+        if path.endswith('.jsonl'):
+            rows = (json.loads(line) for line in f if line.strip())
+        else:
+            rows = csv.DictReader(f)
+        for row_number, row in enumerate(rows):
+            platforms = [platform.lower() for platform in _split(row.get('platforms'))] or ['vinted', 'ebay']
+            yield {
+                'id': str(row.get('id') or row_number),
+                'images': _split(row['images']),
+                'description': row['description'].strip(),
+                'gender': row['gender'],
+                'size': row['size'],
+                'condition': row['condition'],
+                'price': float(row['price']),
+                'vinted': 'vinted' in platforms,
+                'ebay': 'ebay' in platforms,
+            }
+
+def _batches(items: Iterator[Dict], batch_size: int) -> Iterator[List[Dict]]:
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def _done_ids(path: str) -> set:
+    """Ids whose latest result in the output file succeeded; a retried item's newer line supersedes its error."""
+    if not os.path.exists(path):
+        return set()
+    succeeded = {}
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                result = json.loads(line)
+                succeeded[result['id']] = 'error' not in result
+    return {item_id for item_id, ok in succeeded.items() if ok}
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate listings for a manifest of items without the GUI.")
+    parser.add_argument('manifest', help="CSV or JSONL file of items")
+    parser.add_argument('-o', '--output', required=True, help="JSONL file to write the results to")
+    parser.add_argument('--batch-size', type=int, default=CLI_BATCH_SIZE, help="Items processed together")
+    parser.add_argument('--resume', action='store_true', help="Skip items already done successfully in the output file")
+    parser.add_argument('--regenerate', action='store_true', help="Ignore cached listing texts")
+    args = parser.parse_args()
+
+    done_ids = _done_ids(args.output) if args.resume else set()
+    items = (item for item in read_manifest(args.manifest) if item['id'] not in done_ids)
+
+    model_loader = ModelLoader()
+    model_loader.start()
+    engine = ListingEngine(
+        model_loader,
+        color_cache=DiskCache(CACHE_DB_PATH, 'color_results', COLOR_CACHE_MAX_ENTRIES),
+        listing_cache=DiskCache(CACHE_DB_PATH, 'listings', LISTING_CACHE_MAX_ENTRIES, LISTING_CACHE_TTL),
+    )
+
+    processed = failed = 0
+    start = time.perf_counter()
+    with open(args.output, 'a' if args.resume else 'w', encoding='utf-8') as out:
+        for batch in _batches(items, args.batch_size):
+            try:
+                results = engine.process(batch, force=args.regenerate)
+            except Exception as e:
+                # One bad item (e.g. an unreadable image) should not cost the whole batch
+                print(f"[cli] Batch failed ({e}), retrying its items one by one", file=sys.stderr)
+                results = []
+                for item in batch:
+                    try:
+                        results.extend(engine.process([item], force=args.regenerate))
+                    except Exception as item_error:
+                        results.append({'error': str(item_error)})
+
+            for item, result in zip(batch, results):
+                failed += 'error' in result
+                metrics.count('cli_items', outcome='failed' if 'error' in result else 'processed')
+                out.write(json.dumps({'id': item['id'], 'item': item, **result}, default=str) + '\n')
+            out.flush()
+            processed += len(batch)
+            minutes = (time.perf_counter() - start) / 60
+            print(f"[cli] {processed} items ({failed} failed) in {minutes:.1f} min, {processed / minutes:.1f} items/min")
+            metrics.write_prometheus()
+
+    model_loader.shutdown()
+
+if __name__ == '__main__':
+    main()
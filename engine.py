@@ -0,0 +1,150 @@
+import time
+import asyncio
+import ollama
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+from image_processing import process_images
+from model_loader import ModelLoader
+from utils.listing_utils import PLATFORMS, agenerate_text, parse_listing_text
+from utils.category_classifier import CategoryClassifier
+from utils.metrics import metrics
+from utils.config import SAM_BATCH_SIZE, LLM_CONCURRENCY, OLLAMA_HOST
+
+# An item is a dict with the keys the GUI form provides: 'images' (paths), 'gender', 'description', 'ebay' and
+# 'vinted' (platform selected), 'size', 'condition' and 'price'
+
+def item_platforms(item: Dict) -> List[str]:
+    return [platform for platform in PLATFORMS if item[platform.lower()]]
+
+def vote_colors(color_results: List[Optional[Dict]], item: Dict) -> Dict[str, str]:
+    """Most frequent eBay and Vinted color over an item's images, "Unknown" for unselected platforms."""
+    ebay_color_counts = {}
+    vinted_color_counts = {}
+    for color_result in color_results:
+        if color_result:
+            if item['ebay']:
+                ebay_color = color_result['ebay_color']
+                ebay_color_counts[ebay_color] = ebay_color_counts.get(ebay_color, 0) + 1
+            if item['vinted']:
+                vinted_color = color_result['vinted_color']
+                vinted_color_counts[vinted_color] = vinted_color_counts.get(vinted_color, 0) + 1
+    return {
+        'ebay_color': max(ebay_color_counts, key=ebay_color_counts.get, default="Unknown"),
+        'vinted_color': max(vinted_color_counts, key=vinted_color_counts.get, default="Unknown"),
+    }
+
+def build_listing_attributes(item: Dict, results: Dict) -> Dict:
+    """The attributes the LLM prompt is built from, out of an item and its color and category results."""
+    return {
+        "product": item['description'],
+        "gender": item['gender'],
+        "color": results['ebay_color'] if item['vinted'] else results['vinted_color'],
+        "category": {
+            "vinted": results['vinted_category'],
+            "ebay": results['ebay_category']
+        },
+        "size": item['size'],
+        "condition": item['condition'],
+        "price": item['price']
+    }
+
+class ListingEngine:
+    """The listing pipeline without any GUI: colors, categories and text for one or many items.
+
+    Work is batched across items: all images go through one segmentation pipeline, descriptions through
+    length-bucketed BERT batches and listings through concurrent LLM requests. Models come from a ModelLoader;
+    require (default: loader.get) lets callers wait on them their own way, e.g. cancellably.
+    """
+    def __init__(self, model_loader: ModelLoader, color_cache=None, embedding_cache=None, listing_cache=None,
+                 require: Optional[Callable[[str], object]] = None):
+        self.model_loader = model_loader
+        self.color_cache = color_cache
+        self.embedding_cache = embedding_cache
+        self.listing_cache = listing_cache
+        self.require = require or model_loader.get
+
+    def extract_colors(self, items: List[Dict], on_image_done: Optional[Callable[[int], None]] = None) -> List[Dict]:
+        """Per item: 'color_results' (one per image) and the voted 'ebay_color' and 'vinted_color'."""
+        image_paths = [image_path for item in items for image_path in item['images']]
+        model = self.require('sam')
+        color_results = process_images(
+            image_paths, model, SAM_BATCH_SIZE, on_image_done, self.color_cache, self.embedding_cache
+        )
+        results, start = [], 0
+        for item in items:
+            item_results = color_results[start:start + len(item['images'])]
+            start += len(item['images'])
+            results.append({'color_results': item_results, **vote_colors(item_results, item)})
+        return results
+
+    def predict_categories(self, items: List[Dict]) -> List[Dict]:
+        """Per item: 'vinted_category' and 'ebay_category' ("N/A" for unselected platforms), plus the top-k
+        'category_candidates' with their probabilities."""
+        # Only wait on the encoders of platforms some item is listed on
+        encoders = {
+            platform.lower(): self.require(f'{platform.lower()}_encoder')
+            for platform in PLATFORMS if any(item[platform.lower()] for item in items)
+        }
+        classifier = CategoryClassifier(
+            self.require('bert'), self.require('tokenizer'), encoders, self.model_loader.device
+        )
+        predictions = classifier.predict([(item['gender'], item['description']) for item in items])
+        return [
+            {
+                **{
+                    f'{head}_category': prediction[head][0][0] if item[head] else "N/A"
+                    for head in ('vinted', 'ebay')
+                },
+                'category_candidates': {head: prediction[head] for head in prediction if item[head]},
+            }
+            for item, prediction in zip(items, predictions)
+        ]
+
+    async def agenerate_texts(self, attributes_list: List[Dict], platforms_list: List[List[str]],
+                              concurrency: int = LLM_CONCURRENCY, force: bool = False) -> List:
+        """Listing texts for many items, at most concurrency items at a time. Failed items get their exception."""
+        client = ollama.AsyncClient(host=OLLAMA_HOST)
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def generate(attributes: Dict, platforms: List[str]) -> str:
+            async with semaphore:
+                return await agenerate_text(attributes, platforms, client=client, cache=self.listing_cache, force=force)
+
+        return await asyncio.gather(
+            *(generate(attributes, platforms) for attributes, platforms in zip(attributes_list, platforms_list)),
+            return_exceptions=True
+        )
+
+    def process(self, items: List[Dict], force: bool = False) -> List[Dict]:
+        """Runs the whole pipeline on a batch of items, returning one result dict per item."""
+        timings = {}
+
+        def timed(stage: str, function: Callable, *args):
+            start = time.perf_counter()
+            with metrics.span('engine_stage', stage=stage):
+                result = function(*args)
+            timings[stage] = time.perf_counter() - start
+            return result
+
+        # Colors and categories don't depend on each other, SAM and BERT run side by side
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            colors = executor.submit(timed, 'colors', self.extract_colors, items)
+            categories = executor.submit(timed, 'categories', self.predict_categories, items)
+            colors, categories = colors.result(), categories.result()
+
+        results = [{**item_colors, **item_categories} for item_colors, item_categories in zip(colors, categories)]
+        for item, result in zip(items, results):
+            result['listing_attributes'] = build_listing_attributes(item, result)
+
+        texts = timed('text', asyncio.run, self.agenerate_texts(
+            [result['listing_attributes'] for result in results], [item_platforms(item) for item in items], force=force
+        ))
+
+        for result, text in zip(results, texts):
+            if isinstance(text, Exception):
+                result['error'] = f"Text generation failed: {text}"
+                continue
+            result['listing_text'] = text
+            result['listings'] = parse_listing_text(text)
+        metrics.event('engine_batch', items=len(items), stage_seconds=timings)
+        return results
@@ -0,0 +1,111 @@
+"""Accuracy parity, latency and memory of the BERT classifier backends against fp32 PyTorch.
+
+Usage: python -m evaluation.bert_backends [--backends torch int8 onnx onnx-int8] [--split test] [--limit N]
+
+Every backend is measured in its own process, so resident memory is not shared between them. Exits with status 1
+if a backend agrees with fp32 on fewer than BERT_PARITY_MIN_AGREEMENT of the held-out texts, for use as a check
+before switching BERT_BACKEND.
+"""
+import sys
+import json
+import time
+import resource
+import argparse
+import subprocess
+import numpy as np
+from model_loader import ModelLoader
+from evaluation.bert_throughput import load_split
+from utils.bert_backends import BERT_BACKENDS
+from utils.category_classifier import CategoryClassifier
+from utils.config import BERT_PARITY_MIN_AGREEMENT
+
+LATENCY_SAMPLES = 200  # Texts classified one at a time for the per-item latency
+
+def resident_mb() -> float:
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # Peak, on platforms without /proc
+
+def measure(backend: str, texts):
+    """Loads one backend and classifies texts with it, returning its predictions and costs."""
+    import torch
+    torch.set_grad_enabled(False)
+    baseline_mb = resident_mb()
+    start = time.perf_counter()
+    loader = ModelLoader(bert_backend=backend)
+    loader.start(names=['bert', 'tokenizer', 'vinted_encoder', 'ebay_encoder'])
+    bert_model, tokenizer, vinted_encoder, ebay_encoder = loader.wait(['bert', 'tokenizer', 'vinted_encoder', 'ebay_encoder'])
+    load_seconds = time.perf_counter() - start
+    model_mb = resident_mb() - baseline_mb
+    classifier = CategoryClassifier(bert_model, tokenizer, {'vinted': vinted_encoder, 'ebay': ebay_encoder}, loader.device)
+
+    latencies = []
+    for text in texts[:LATENCY_SAMPLES]:
+        start = time.perf_counter()
+        classifier.predict_texts([text], top_k=1)
+        latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    predictions = classifier.predict_texts(texts, top_k=1)
+    batched_seconds = time.perf_counter() - start
+    loader.shutdown()
+    return {
+        'backend': backend,
+        'predictions': {head: [prediction[head][0][0] for prediction in predictions] for head in ('vinted', 'ebay')},
+        'load_seconds': load_seconds,
+        'model_mb': model_mb,
+        'latency_ms': float(np.median(latencies) * 1000),
+        'items_per_second': len(texts) / batched_seconds,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the BERT classifier backends with fp32 PyTorch.")
+    parser.add_argument('--backends', nargs='+', choices=BERT_BACKENDS, default=list(BERT_BACKENDS))
+    parser.add_argument('--data', default='bert_data.zip')
+    parser.add_argument('--split', choices=['test', 'val', 'all'], default='test')
+    parser.add_argument('--limit', type=int, default=None)
+    parser.add_argument('--measure', choices=BERT_BACKENDS, help=argparse.SUPPRESS)  # Child process mode
+    args = parser.parse_args()
+
+    data = load_split(args.data, args.split)[:args.limit]
+    texts = data['Item Description'].tolist()
+    if args.measure:
+        print(json.dumps(measure(args.measure, texts)))
+        return
+
+    reports = {}
+    for backend in dict.fromkeys(['torch'] + args.backends):
+        command = [sys.executable, '-m', 'evaluation.bert_backends', '--measure', backend, '--data', args.data, '--split', args.split]
+        if args.limit:
+            command += ['--limit', str(args.limit)]
+        output = subprocess.run(command, check=True, capture_output=True, text=True).stdout
+        reports[backend] = json.loads(output.strip().splitlines()[-1])
+
+    labels = {'vinted': data['Vinted Category'].tolist(), 'ebay': data['eBay Category'].tolist()}
+    reference = reports['torch']['predictions']
+    print(f"{len(texts)} texts ({args.split} split)")
+    print(f"{'backend':<10} {'agree V/E':>15} {'acc V/E':>15} {'ms/item':>8} {'items/s':>8} {'MB':>7} {'load s':>7}")
+    failed = []
+    for backend in args.backends:
+        report = reports[backend]
+        predictions = report['predictions']
+        agreement = {head: np.mean(np.array(predictions[head]) == np.array(reference[head])) for head in labels}
+        accuracy = {head: np.mean(np.array(predictions[head]) == np.array(labels[head])) for head in labels}
+        if min(agreement.values()) < BERT_PARITY_MIN_AGREEMENT:
+            failed.append(backend)
+        print(
+            f"{backend:<10} {agreement['vinted']:>7.2%}/{agreement['ebay']:<7.2%} {accuracy['vinted']:>7.2%}/{accuracy['ebay']:<7.2%} "
+            f"{report['latency_ms']:>8.1f} {report['items_per_second']:>8.1f} {report['model_mb']:>7.0f} {report['load_seconds']:>7.1f}"
+        )
+    if failed:
+        print(f"Parity check failed (< {BERT_PARITY_MIN_AGREEMENT:.0%} agreement with fp32): {', '.join(failed)}")
+        sys.exit(1)
+    print("Parity check passed")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+"""Throughput of batched category prediction against the original one-text-at-a-time path.
+
+Usage: python -m evaluation.bert_throughput [--data bert_data.zip] [--split test] [--limit 2000] [--batch-size 32]
+
+Both paths classify the same 'Item Description' texts of 'Item Text-Category.csv' (the held-out test split of the
+fine-tuning notebook by default). Reports items/second, the agreement of the two paths and their accuracy.
+"""
+import time
+import zipfile
+import argparse
+import pandas as pd
+from sklearn.model_selection import train_test_split
+from model_loader import ModelLoader
+from utils.category_classifier import CategoryClassifier
+from utils.config import RANDOM_SEED, BERT_MODEL_DIR, BERT_BATCH_SIZE
+
+def load_split(path: str, split: str) -> pd.DataFrame:
+    with zipfile.ZipFile(path) as archive:
+        with archive.open('Item Text-Category.csv') as f:
+            data = pd.read_csv(f, header=0)
+    if split == 'all':
+        return data
+    # The notebook's 80/10/10 split
+    _, val_test_data = train_test_split(data, test_size=0.2, random_state=RANDOM_SEED)
+    val_data, test_data = train_test_split(val_test_data, test_size=0.5, random_state=RANDOM_SEED)
+    return val_data if split == 'val' else test_data
+
+def predict_one_by_one(texts, bert_model, tokenizer, encoders, device):
+    """The original Processor.predict_categories path: slow tokenizer, one forward pass and lookup per text."""
+    import torch
+    predictions = []
+    for text in texts:
+        inputs = tokenizer(text, return_tensors="pt", truncation=True, padding=True).to(device)
+        if 'token_type_ids' in inputs:
+            del inputs['token_type_ids']
+        with torch.no_grad():
+            outputs = bert_model(**inputs)
+        predictions.append({
+            head: encoder.inverse_transform([torch.argmax(outputs[f'{head}_logits'], dim=1).cpu().numpy()[0]])[0]
+            for head, encoder in encoders.items()
+        })
+    return predictions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark batched BERT category prediction.")
+    parser.add_argument('--data', default='bert_data.zip')
+    parser.add_argument('--split', choices=['test', 'val', 'all'], default='test')
+    parser.add_argument('--limit', type=int, default=None, help="Classify only the first N texts")
+    parser.add_argument('--batch-size', type=int, default=BERT_BATCH_SIZE)
+    args = parser.parse_args()
+
+    from transformers import BertTokenizer
+    data = load_split(args.data, args.split)[:args.limit]
+    texts = data['Item Description'].tolist()
+    labels = {'vinted': data['Vinted Category'].tolist(), 'ebay': data['eBay Category'].tolist()}
+
+    loader = ModelLoader()
+    loader.start(names=['bert', 'tokenizer', 'vinted_encoder', 'ebay_encoder'])
+    bert_model, fast_tokenizer, vinted_encoder, ebay_encoder = loader.wait(['bert', 'tokenizer', 'vinted_encoder', 'ebay_encoder'])
+    slow_tokenizer = BertTokenizer.from_pretrained(f'{BERT_MODEL_DIR}/bert_category_classifier')
+    encoders = {'vinted': vinted_encoder, 'ebay': ebay_encoder}
+
+    start = time.perf_counter()
+    baseline = predict_one_by_one(texts, bert_model, slow_tokenizer, encoders, loader.device)
+    baseline_seconds = time.perf_counter() - start
+
+    classifier = CategoryClassifier(bert_model, fast_tokenizer, encoders, loader.device, batch_size=args.batch_size)
+    start = time.perf_counter()
+    batched = [{head: candidates[0][0] for head, candidates in prediction.items()}
+               for prediction in classifier.predict_texts(texts, top_k=1)]
+    batched_seconds = time.perf_counter() - start
+    loader.shutdown()
+
+    print(f"{len(texts)} texts ({args.split} split), batch size {args.batch_size}")
+    print(f"{'path':<14} {'items/s':>9} {'Vinted acc':>10} {'eBay acc':>9}")
+    for name, predictions, seconds in (('one-by-one', baseline, baseline_seconds), ('batched', batched, batched_seconds)):
+        accuracy = {
+            head: sum(prediction[head] == label for prediction, label in zip(predictions, labels[head])) / len(texts)
+            for head in encoders
+        }
+        print(f"{name:<14} {len(texts) / seconds:>9.1f} {accuracy['vinted']:>10.2%} {accuracy['ebay']:>9.2%}")
+    agreement = sum(a == b for a, b in zip(baseline, batched)) / len(texts)
+    print(f"Speedup {baseline_seconds / batched_seconds:.1f}x, top-1 agreement {agreement:.2%}")
+
+if __name__ == '__main__':
+    main()
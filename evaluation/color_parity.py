@@ -0,0 +1,24 @@
+"""Parity report of the dominant colour engine modes against full-resolution KMeans.
+
+Usage: python -m evaluation.color_parity IMAGE [IMAGE ...] [--modes subsample histogram]
+"""
+import argparse
+from ultralytics import SAM
+from image_processing import load_image, segment_images, masked_pixels
+from utils.config import SAM_WEIGHTS
+from utils.dominant_color import DOMINANT_COLOR_MODES, parity_report, format_parity_report
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare dominant colour modes with full KMeans on the same SAM masks.")
+    parser.add_argument('images', nargs='+', help="Image files to segment and compare on")
+    parser.add_argument('--modes', nargs='+', choices=DOMINANT_COLOR_MODES, default=list(DOMINANT_COLOR_MODES))
+    args = parser.parse_args()
+
+    model = SAM(SAM_WEIGHTS)
+    images_rgb = [load_image(image_path) for image_path in args.images]
+    # Segment once, so every mode clusters exactly the same pixels
+    pixel_sets = [masked_pixels(image_rgb, mask) for image_rgb, mask in zip(images_rgb, segment_images(images_rgb, model))]
+    print(format_parity_report(parity_report(pixel_sets, args.modes)))
+
+if __name__ == '__main__':
+    main()
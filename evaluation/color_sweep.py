@@ -0,0 +1,216 @@
+"""KMeans hyperparameter sweep of the dominant colour engine on cached garment pixels (CV_Evaluation.ipynb).
+
+Usage: python -m evaluation.color_sweep [--dataset styles|fashion] [--segmenter sam|yolo] [--samples 1000]
+                                        [--n-clusters 2 ... 10] [--max-iter 10 50 100 200] [--mode subsample]
+                                        [--data cv_data.zip] [--cache color_sweep_cache] [--output results.csv]
+
+'styles' and 'fashion' are the notebook's datasets 1 and 2, read straight from cv_data.zip. Segmentation does not
+depend on the clustering parameters, so each sampled image is segmented once and its garment pixels are stored as a
+compressed .npz in CACHE/<segmenter>/, keyed on the image bytes and the segmentation settings. Reruns, other grids and
+other modes reuse them. The grid then runs over the cached pixels in a process pool, one task per image covering every
+(n_clusters, max_iter) pair, and each pair is scored on eBay and Vinted colour names like the notebook's tune_kmeans.
+The best pair is the one to set as KMEANS_N_CLUSTERS and KMEANS_MAX_ITER in utils/config.py.
+"""
+import os
+import json
+import time
+import zipfile
+import hashlib
+import argparse
+import itertools
+import multiprocessing
+import cv2
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+from sklearn.metrics import accuracy_score, precision_recall_fscore_support
+from sklearn.model_selection import StratifiedShuffleSplit
+from image_processing import SEGMENTATION_SETTINGS, segment_images
+from utils.config import RANDOM_SEED, SAM_WEIGHTS, SAM_IMGSZ, SAM_BATCH_SIZE, DOMINANT_COLOR_MODE
+from utils.color_utils import palette_ebay, palette_vinted
+from utils.dominant_color import DOMINANT_COLOR_MODES, dominant_rgb
+from utils.image_loader import decode_image
+
+YOLO_WEIGHTS = 'yolo11x-seg.pt'
+DATASETS = {
+    'styles': {'csv': 'styles.csv', 'id': 'id', 'color': 'baseColour'},
+    'fashion': {'csv': 'fashion.csv', 'id': 'ProductId', 'color': 'Colour'},
+}
+# Ground-truth colour labels of both datasets ('fashion' uses a subset) as RGB
+LABEL_RGB = {
+    'Navy Blue': (0, 0, 128), 'Blue': (0, 0, 255), 'Silver': (192, 192, 192), 'Black': (0, 0, 0),
+    'Grey': (128, 128, 128), 'Green': (0, 128, 0), 'Purple': (128, 0, 128), 'White': (255, 255, 255),
+    'Beige': (245, 245, 220), 'Brown': (150, 75, 0), 'Bronze': (205, 127, 50), 'Teal': (0, 128, 128),
+    'Copper': (184, 115, 51), 'Pink': (255, 192, 203), 'Off White': (245, 245, 245), 'Maroon': (128, 0, 0),
+    'Red': (255, 0, 0), 'Khaki': (107, 142, 35), 'Orange': (255, 165, 0), 'Coffee Brown': (111, 78, 55),
+    'Yellow': (255, 255, 0), 'Charcoal': (54, 69, 79), 'Gold': (255, 215, 0), 'Steel': (112, 128, 144),
+    'Tan': (210, 180, 140), 'Magenta': (255, 0, 255), 'Lavender': (230, 230, 250), 'Sea Green': (46, 139, 87),
+    'Cream': (255, 255, 204), 'Peach': (255, 229, 180), 'Olive': (128, 128, 0), 'Skin': (255, 224, 189),
+    'Burgundy': (128, 0, 32), 'Grey Melange': (160, 160, 160), 'Rust': (183, 65, 14), 'Rose': (255, 0, 127),
+    'Lime Green': (50, 205, 50), 'Mauve': (224, 176, 255), 'Turquoise Blue': (0, 206, 209), 'Metallic': (192, 192, 192),
+    'Mustard': (255, 219, 88), 'Taupe': (72, 60, 50), 'Nude': (240, 220, 190), 'Mushroom Brown': (104, 80, 68),
+    'Fluorescent Green': (0, 255, 0)
+}
+# Masks with fewer garment pixels also store the whole image, which clustering falls back to (see masked_pixels).
+# Only masks this small keep the image, so the swept n_clusters must stay below it
+MIN_GARMENT_PIXELS = 256
+
+def load_dataset(path: str, dataset: str) -> pd.DataFrame:
+    spec = DATASETS[dataset]
+    with zipfile.ZipFile(path) as archive:
+        with archive.open(spec['csv']) as f:
+            data = pd.read_csv(f, on_bad_lines='skip')
+    if dataset == 'fashion':
+        data = data[data['Category'] == 'Apparel']  # Remove other category 'Footwear'
+        color_counts = data[spec['color']].value_counts()
+        data = data[data[spec['color']].isin(color_counts[color_counts >= 2].index)]  # Stratified sampling needs 2
+    data = data[(data[spec['color']] != 'Multi') & data[spec['color']].isin(LABEL_RGB)]
+    return data.assign(image_name=data[spec['id']].map(lambda x: f'images/{x}.jpg'), label=data[spec['color']])
+
+def sample(data: pd.DataFrame, samples: int) -> pd.DataFrame:
+    """Stratified on the colour label, like the notebook, so rare colours stay represented."""
+    if samples >= len(data):
+        return data
+    split = StratifiedShuffleSplit(n_splits=1, train_size=samples, random_state=RANDOM_SEED)
+    indices, _ = next(split.split(np.arange(len(data)), data['label'].values))
+    return data.iloc[indices]
+
+def segmentation_key(image_bytes: bytes, segmenter: str) -> str:
+    """Content address of an image's garment pixels: the bytes plus everything that decides the mask."""
+    settings = SEGMENTATION_SETTINGS if segmenter == 'sam' else {'segmentation': YOLO_WEIGHTS, 'imgsz': SAM_IMGSZ,
+                                                                 'decode': SEGMENTATION_SETTINGS['decode']}
+    return hashlib.sha256(image_bytes + json.dumps(settings, sort_keys=True).encode()).hexdigest()
+
+def yolo_masks(images_rgb: List[np.ndarray], model) -> List[Optional[np.ndarray]]:
+    """The first instance mask YOLO finds in each image, as in the notebook."""
+    masks = []
+    for image_rgb in images_rgb:
+        results = model.predict(image_rgb, imgsz=SAM_IMGSZ, verbose=False)
+        if results and results[0].masks:
+            mask = np.zeros(image_rgb.shape[:2], dtype=np.uint8)
+            cv2.fillPoly(mask, [np.array(results[0].masks.xy[0], dtype=np.int32).reshape(-1, 1, 2)], 1)
+            masks.append(mask.astype(bool))
+        else:
+            masks.append(None)
+    return masks
+
+def save_pixels(path: str, image_rgb: np.ndarray, mask: Optional[np.ndarray]):
+    pixels = image_rgb[mask] if mask is not None else np.empty((0, 3), np.uint8)
+    arrays = {'pixels': pixels}
+    if len(pixels) < MIN_GARMENT_PIXELS:
+        arrays['image'] = image_rgb.reshape(-1, 3)
+    np.savez_compressed(path + '.tmp.npz', **arrays)
+    os.replace(path + '.tmp.npz', path)  # Complete files only, so an interrupted run resumes cleanly
+
+def cache_pixels(data: pd.DataFrame, archive_path: str, segmenter: str, cache_dir: str) -> List[Optional[str]]:
+    """Path of the cached garment pixels of each row (None for images missing from the archive), segmenting the
+    images that are not cached yet in batches."""
+    os.makedirs(cache_dir, exist_ok=True)
+    paths, pending = [], []  # pending: (cache path, decoded image) awaiting segmentation
+    model = None
+    segmented = 0
+
+    def flush():
+        nonlocal model, segmented
+        if model is None:
+            from ultralytics import SAM, YOLO
+            model = SAM(SAM_WEIGHTS) if segmenter == 'sam' else YOLO(YOLO_WEIGHTS)
+        images_rgb = [image_rgb for _, image_rgb in pending]
+        masks = segment_images(images_rgb, model) if segmenter == 'sam' else yolo_masks(images_rgb, model)
+        for (path, image_rgb), mask in zip(pending, masks):
+            save_pixels(path, image_rgb, mask)
+        segmented += len(pending)
+        pending.clear()
+        print(f"[color_sweep] Segmented {segmented} images")
+
+    with zipfile.ZipFile(archive_path) as archive:
+        names = set(archive.namelist())
+        for image_name in data['image_name']:
+            if image_name not in names:
+                paths.append(None)
+                continue
+            image_bytes = archive.read(image_name)
+            path = os.path.join(cache_dir, segmentation_key(image_bytes, segmenter) + '.npz')
+            paths.append(path)
+            if not os.path.exists(path):
+                pending.append((path, decode_image(image_bytes)))
+                if len(pending) == SAM_BATCH_SIZE:
+                    flush()
+        if pending:
+            flush()
+    return paths
+
+def _init_worker():
+    from threadpoolctl import threadpool_limits
+    threadpool_limits(1)  # One core per process; the images are the parallelism
+
+def sweep_image(path: str, mode: str, grid: List[Tuple[int, int]]) -> np.ndarray:
+    """Dominant RGB of one cached image for every (n_clusters, max_iter) pair of the grid, as a (len(grid), 3) array."""
+    with np.load(path) as arrays:
+        pixels, image = arrays['pixels'], arrays['image'] if 'image' in arrays else None
+    return np.array([
+        dominant_rgb(pixels if len(pixels) > n_clusters else image, mode, n_clusters=n_clusters, max_iter=max_iter)
+        for n_clusters, max_iter in grid
+    ])
+
+def score(labels: List[str], pred_rgbs: np.ndarray) -> Dict[str, float]:
+    """Accuracy and weighted precision, recall and F1 of the predicted eBay and Vinted colour names."""
+    label_rgbs = np.array([LABEL_RGB[label] for label in labels])
+    scores = {}
+    for platform, palette in (('ebay', palette_ebay), ('vinted', palette_vinted)):
+        true, pred = palette.closest_batch(label_rgbs), palette.closest_batch(pred_rgbs)
+        precision, recall, f1, _ = precision_recall_fscore_support(true, pred, average='weighted', zero_division=0)
+        scores.update({f'{platform}_accuracy': accuracy_score(true, pred), f'{platform}_precision': precision,
+                       f'{platform}_recall': recall, f'{platform}_f1': f1})
+    # Combined eBay-Vinted score the best configuration is chosen on
+    scores['score'] = (scores['ebay_accuracy'] + scores['vinted_accuracy']) / 2
+    return scores
+
+def main():
+    parser = argparse.ArgumentParser(description="Sweep KMEANS_N_CLUSTERS and KMEANS_MAX_ITER on cached garment pixels.")
+    parser.add_argument('--dataset', choices=list(DATASETS), default='styles')
+    parser.add_argument('--segmenter', choices=['sam', 'yolo'], default='sam')
+    parser.add_argument('--samples', type=int, default=1000)
+    parser.add_argument('--n-clusters', type=int, nargs='+', default=list(range(2, 11)))
+    parser.add_argument('--max-iter', type=int, nargs='+', default=[10, 50, 100, 200])
+    parser.add_argument('--mode', choices=[mode for mode in DOMINANT_COLOR_MODES if mode != 'histogram'],
+                        default=DOMINANT_COLOR_MODE if DOMINANT_COLOR_MODE != 'histogram' else 'kmeans')
+    parser.add_argument('--data', default='cv_data.zip')
+    parser.add_argument('--cache', default='color_sweep_cache', help="Directory of the cached garment pixels")
+    parser.add_argument('--workers', type=int, default=None, help="Clustering processes (default: one per CPU)")
+    parser.add_argument('--output', help="CSV file for the scores of every configuration")
+    args = parser.parse_args()
+    if not all(0 < n_clusters < MIN_GARMENT_PIXELS for n_clusters in args.n_clusters):
+        parser.error(f"--n-clusters must be between 1 and {MIN_GARMENT_PIXELS - 1}, the cached masks' minimum size")
+
+    data = sample(load_dataset(args.data, args.dataset), args.samples)
+    start = time.perf_counter()
+    paths = cache_pixels(data, args.data, args.segmenter, os.path.join(args.cache, args.segmenter))
+    print(f"[color_sweep] {sum(path is not None for path in paths)} of {len(data)} images ready in "
+          f"{time.perf_counter() - start:.1f}s")
+    labels = [label for label, path in zip(data['label'], paths) if path is not None]
+    paths = [path for path in paths if path is not None]
+
+    grid = list(itertools.product(args.n_clusters, args.max_iter))
+    start = time.perf_counter()
+    # Spawned rather than forked, as torch has threads running once a segmenter was loaded
+    with ProcessPoolExecutor(max_workers=args.workers, mp_context=multiprocessing.get_context('spawn'),
+                             initializer=_init_worker) as pool:
+        pred_rgbs = np.stack(list(pool.map(sweep_image, paths, itertools.repeat(args.mode), itertools.repeat(grid))))
+    print(f"[color_sweep] {len(grid)} configurations x {len(paths)} images clustered in "
+          f"{time.perf_counter() - start:.1f}s ({args.mode})")
+
+    results = pd.DataFrame([
+        {'n_clusters': n_clusters, 'max_iter': max_iter, **score(labels, pred_rgbs[:, i])}
+        for i, (n_clusters, max_iter) in enumerate(grid)
+    ])
+    print(results.to_string(index=False, float_format='{:.4f}'.format))
+    best = results.loc[results['score'].idxmax()]
+    print(f"\nBest configuration ({args.dataset}, {args.segmenter.upper()}, {args.mode}): "
+          f"KMEANS_N_CLUSTERS = {int(best['n_clusters'])}, KMEANS_MAX_ITER = {int(best['max_iter'])}")
+    if args.output:
+        results.to_csv(args.output, index=False)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+"""Decode time and peak memory of a listing's images: the shared reduced decode against the original double decode.
+
+Usage: python -m evaluation.image_decode IMAGE [IMAGE ...]
+
+'original' decodes every file at full resolution twice, as upload_image (QPixmap) and process_image (cv2.imread)
+used to. 'shared' decodes it once at analysis resolution into the image buffer cache and derives the thumbnail
+from that buffer. Each path runs in its own process so their peak resident memory is not shared.
+"""
+import sys
+import json
+import time
+import resource
+import argparse
+import subprocess
+
+def peak_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def measure(path: str, image_paths):
+    from PyQt5.QtGui import QGuiApplication, QPixmap
+    app = QGuiApplication(['image_decode'])  # QPixmap needs one
+    baseline_mb = peak_mb()
+    start = time.perf_counter()
+    if path == 'original':
+        import cv2
+        kept = []  # The listing holds all of its pixmaps, and the pipeline a batch of decoded images
+        for image_path in image_paths:
+            kept.append(QPixmap(image_path))
+            kept.append(cv2.cvtColor(cv2.imread(image_path), cv2.COLOR_BGR2RGB))
+    else:
+        from ui.thumbnail_cache import ThumbnailCache
+        from utils.image_loader import image_buffers
+        thumbnails = ThumbnailCache()
+        for image_path in image_paths:
+            thumbnails.get(image_path)
+            image_buffers.load(image_path)
+    seconds = time.perf_counter() - start
+    return {'path': path, 'ms_per_image': seconds * 1000 / len(image_paths), 'peak_mb': peak_mb() - baseline_mb}
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the shared reduced image decode with the original one.")
+    parser.add_argument('images', nargs='+', help="Image files of one listing")
+    parser.add_argument('--measure', choices=['original', 'shared'], help=argparse.SUPPRESS)  # Child process mode
+    args = parser.parse_args()
+    if args.measure:
+        print(json.dumps(measure(args.measure, args.images)))
+        return
+
+    print(f"{len(args.images)} images")
+    print(f"{'path':<10} {'ms/image':>9} {'peak MB':>8}")
+    for path in ('original', 'shared'):
+        command = [sys.executable, '-m', 'evaluation.image_decode', '--measure', path] + args.images
+        report = json.loads(subprocess.run(command, check=True, capture_output=True, text=True).stdout.strip().splitlines()[-1])
+        print(f"{path:<10} {report['ms_per_image']:>9.1f} {report['peak_mb']:>8.0f}")
+
+if __name__ == '__main__':
+    main()
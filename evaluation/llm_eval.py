@@ -0,0 +1,216 @@
+"""ROUGE and BLEU of generated listing descriptions against catalog descriptions, per LLM (LLM_Evaluation.ipynb).
+
+Usage: python -m evaluation.llm_eval [--marketplace eBay|Vinted] [--models tinyllama smollm2 mistral phi4]
+                                     [--samples 100] [--concurrency 4] [--combined-prompt] [--output llm_eval]
+
+eBay is evaluated on the Myntra catalog (Men and Women only, prices converted from INR), Vinted on the custom Dutch
+catalog, both from llm_data.zip. Categories are predicted once with the batched BERT classifier and shared by every
+model. Models are evaluated one after the other, so Ollama keeps one of them loaded, with up to --concurrency rows
+generating at a time. Every generation is appended to OUTPUT/<marketplace>/<model>.jsonl as soon as it is done, so
+rerunning the same command resumes an interrupted run. Scores are computed in a process pool at the end.
+
+By default each row is generated the way the app does now, with the evaluated marketplace's own prompt;
+--combined-prompt asks for both listings in one answer, like the notebook.
+"""
+import os
+import re
+import json
+import time
+import asyncio
+import zipfile
+import argparse
+import multiprocessing
+import pandas as pd
+import ollama
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional
+from utils.config import OLLAMA_HOST, LLM_CONCURRENCY, LLM_KEEP_ALIVE
+from utils.category_classifier import CategoryClassifier, category_text
+from utils.listing_utils import PLATFORMS, create_chat_messages, merge_listing_text, parse_listing_text
+
+DATASETS = {'eBay': 'myntra_products_catalog.csv', 'Vinted': 'custom_products_catalog.csv'}
+INR_PER_EUR = 99.24
+SCORES = ['rouge1', 'rougeL', 'bleu_standard', 'bleu_unigram']
+
+def load_dataset(path: str, marketplace: str, samples: Optional[int] = None) -> pd.DataFrame:
+    with zipfile.ZipFile(path) as archive:
+        with archive.open(DATASETS[marketplace]) as f:
+            data = pd.read_csv(f, on_bad_lines='skip')
+    if marketplace == 'eBay':
+        data = data[data['Gender'].isin(['Men', 'Women'])]  # Filter Unisex
+        data['Price (EUR)'] = (data['Price (INR)'] / INR_PER_EUR).round(2)
+    return data.head(samples)
+
+def predict_categories(data: pd.DataFrame, cache_path: str) -> Dict[str, Dict[str, str]]:
+    """Top Vinted and eBay category per row, from the batched classifier, cached in cache_path for reruns."""
+    if os.path.exists(cache_path):
+        with open(cache_path, encoding='utf-8') as f:
+            categories = json.load(f)
+        if all(str(index) in categories for index in data.index):
+            return categories
+    from model_loader import ModelLoader
+    loader = ModelLoader()
+    loader.start(names=['bert', 'tokenizer', 'vinted_encoder', 'ebay_encoder'])
+    bert_model, tokenizer, vinted_encoder, ebay_encoder = loader.wait(['bert', 'tokenizer', 'vinted_encoder', 'ebay_encoder'])
+    classifier = CategoryClassifier(bert_model, tokenizer, {'vinted': vinted_encoder, 'ebay': ebay_encoder}, loader.device)
+    predictions = classifier.predict_texts(
+        [category_text(row['Gender'], row['ProductName']) for _, row in data.iterrows()], top_k=1
+    )
+    loader.shutdown()
+    categories = {
+        str(index): {head: candidates[0][0] for head, candidates in prediction.items()}
+        for index, prediction in zip(data.index, predictions)
+    }
+    with open(cache_path, 'w', encoding='utf-8') as f:
+        json.dump(categories, f)
+    return categories
+
+def row_attributes(row, category: Dict[str, str]) -> Dict:
+    return {
+        'product': row['ProductName'],
+        'gender': row['Gender'],
+        'color': row['PrimaryColor'],
+        'category': category,
+        'size': '',  # Placeholders since attributes are not in data
+        'condition': '',
+        'price': row['Price (EUR)'],
+    }
+
+def read_checkpoint(path: str) -> Dict[str, Dict]:
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding='utf-8') as f:
+        return {record['row']: record for record in map(json.loads, filter(str.strip, f))}
+
+async def generate_all(model: str, attributes: Dict[str, Dict], marketplace: Optional[str], checkpoint_path: str,
+                       concurrency: int) -> int:
+    """Generates the rows missing from the checkpoint, at most concurrency at a time. Returns the number of failed
+    requests, which are left out of the checkpoint and retried by the next run."""
+    client = ollama.AsyncClient(host=OLLAMA_HOST)
+    semaphore = asyncio.Semaphore(concurrency)
+    failed = 0
+
+    async def generate(row: str, out):
+        nonlocal failed
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                response = await client.chat(
+                    model=model, messages=create_chat_messages(attributes[row], marketplace), keep_alive=LLM_KEEP_ALIVE
+                )
+            except Exception as e:
+                failed += 1
+                print(f"[llm_eval] {model} row {row} failed: {e}")
+                return
+        listing_text = response['message']['content']
+        if marketplace is not None:
+            listing_text = merge_listing_text({marketplace: listing_text})
+        out.write(json.dumps({'row': row, 'llm_output': listing_text, 'seconds': time.perf_counter() - start}) + '\n')
+        out.flush()
+
+    done = read_checkpoint(checkpoint_path)
+    with open(checkpoint_path, 'a', encoding='utf-8') as out:
+        await asyncio.gather(*(generate(row, out) for row in attributes if row not in done))
+    return failed
+
+def _clean(text: str) -> str:
+    text = re.sub('<.*?>', '', text)  # Remove earlier created HTML tags
+    return ' '.join(text.split()).lower()  # Normalize whitespace and lowercase
+
+_scorer = None
+
+def score(reference: str, candidate: str) -> Dict[str, float]:
+    """ROUGE-1 and ROUGE-L F-measures and smoothed standard and unigram BLEU, as in the notebook."""
+    global _scorer
+    import nltk
+    from rouge_score import rouge_scorer
+    from nltk.translate.bleu_score import sentence_bleu, SmoothingFunction
+    if _scorer is None:
+        _scorer = rouge_scorer.RougeScorer(['rouge1', 'rougeL'], use_stemmer=True)
+    reference, candidate = _clean(reference), _clean(candidate)
+    rouge_scores = _scorer.score(reference, candidate)
+    smoothing_function = SmoothingFunction().method1
+    reference_tokens, candidate_tokens = nltk.word_tokenize(reference), nltk.word_tokenize(candidate)
+    return {
+        'rouge1': rouge_scores['rouge1'].fmeasure,
+        'rougeL': rouge_scores['rougeL'].fmeasure,
+        'bleu_standard': sentence_bleu([reference_tokens], candidate_tokens, smoothing_function=smoothing_function),
+        'bleu_unigram': sentence_bleu([reference_tokens], candidate_tokens, smoothing_function=smoothing_function,
+                                      weights=(1, 0, 0, 0)),
+    }
+
+def _score_pair(pair):
+    return score(*pair)
+
+def evaluate(data: pd.DataFrame, outputs: Dict[str, Dict], marketplace: str, required: List[str],
+             pool: ProcessPoolExecutor, workers: int):
+    """Per-row scores of one model's outputs, and the number of outputs missing one of the required platforms'
+    listings, which are left out of the scores."""
+    rows, pairs, failed = [], [], 0
+    for index, row in data.iterrows():
+        record = outputs.get(str(index))
+        if record is None:
+            continue
+        platform_listings = parse_listing_text(record['llm_output']) or {}
+        if not all(platform in platform_listings for platform in required):
+            failed += 1
+            continue
+        rows.append(row['ProductName'])
+        pairs.append((row['Description'], platform_listings[marketplace]['description']))
+    scores = list(pool.map(_score_pair, pairs, chunksize=max(1, len(pairs) // (4 * workers))))
+    return pd.DataFrame([{'ProductName': name, **row_scores} for name, row_scores in zip(rows, scores)],
+                        columns=['ProductName'] + SCORES), failed
+
+def main():
+    parser = argparse.ArgumentParser(description="Evaluate LLM listing descriptions with ROUGE and BLEU.")
+    parser.add_argument('--marketplace', choices=list(DATASETS), default='eBay')
+    parser.add_argument('--models', nargs='+', default=['tinyllama', 'smollm2', 'mistral', 'phi4'])
+    parser.add_argument('--data', default='llm_data.zip')
+    parser.add_argument('--samples', type=int, default=100, help="Rows of the catalog to evaluate")
+    parser.add_argument('--concurrency', type=int, default=LLM_CONCURRENCY, help="Generations in flight per model")
+    parser.add_argument('--workers', type=int, default=None, help="Scoring processes (default: one per CPU)")
+    parser.add_argument('--combined-prompt', action='store_true', help="Generate both listings in one answer")
+    parser.add_argument('--output', default='llm_eval', help="Directory of the checkpoints and scores")
+    args = parser.parse_args()
+
+    output_dir = os.path.join(args.output, args.marketplace + ('-combined' if args.combined_prompt else ''))
+    os.makedirs(output_dir, exist_ok=True)
+    data = load_dataset(args.data, args.marketplace, args.samples)
+    categories = predict_categories(data, os.path.join(args.output, f'{args.marketplace}_categories.json'))
+    attributes = {str(index): row_attributes(row, categories[str(index)]) for index, row in data.iterrows()}
+    prompt_platform = None if args.combined_prompt else args.marketplace
+    # The notebook counted a combined answer as failed unless both listings parsed
+    required = list(PLATFORMS) if args.combined_prompt else [args.marketplace]
+    workers = args.workers or os.cpu_count() or 1
+
+    import nltk
+    nltk.download('punkt_tab', quiet=True)  # Tokenizer data of word_tokenize, fetched before the pool needs it
+    summary = {}
+    # Spawned rather than forked, as torch has threads running once the categories were predicted
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+        for model in args.models:
+            checkpoint_path = os.path.join(output_dir, f'{model}.jsonl')
+            start = time.perf_counter()
+            errors = asyncio.run(generate_all(model, attributes, prompt_platform, checkpoint_path, args.concurrency))
+            seconds = time.perf_counter() - start
+            outputs = read_checkpoint(checkpoint_path)
+            results, failed = evaluate(data, outputs, args.marketplace, required, pool, workers)
+            results.to_csv(os.path.join(output_dir, f'{model}_scores.csv'), index=False)
+            summary[model] = {score_name: float(results[score_name].mean()) for score_name in SCORES} if len(results) else {}
+            summary[model].update({'generated': len(outputs), 'failed_to_parse': failed, 'request_errors': errors})
+
+            print(f"\nEvaluation Results {model} ({len(outputs)}/{len(data)} rows, generated in {seconds:.0f}s)")
+            if len(results):
+                print(f"Average ROUGE-1: {results['rouge1'].mean():.4f}")
+                print(f"Average ROUGE-L: {results['rougeL'].mean():.4f}")
+                print(f"Average BLEU (Standard): {results['bleu_standard'].mean():.4f}")
+                print(f"Average BLEU (Unigrams Only): {results['bleu_unigram'].mean():.4f}")
+            print(f"{model.upper()} failed to parse {failed} out of {len(outputs)} total entries.")
+            if errors:
+                print(f"{errors} requests failed, rerun to retry them")
+
+    with open(os.path.join(output_dir, 'summary.json'), 'w', encoding='utf-8') as f:
+        json.dump(summary, f, indent=2)
+
+if __name__ == '__main__':
+    main()
@@ -1,15 +1,69 @@
-import cv2
+import json
+import hashlib
+import threading
+import multiprocessing
 import numpy as np
-from typing import Dict
-from sklearn.cluster import KMeans
-from utils.config import RANDOM_SEED, KMEANS_N_CLUSTERS, KMEANS_MAX_ITER
-from utils.color_utils import color_map_ebay, color_map_vinted, find_closest_color
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+from utils.config import (
+    KMEANS_N_CLUSTERS, KMEANS_MAX_ITER, SAM_WEIGHTS, SAM_IMGSZ, SAM_BATCH_SIZE,
+    DOMINANT_COLOR_MODE, DOMINANT_COLOR_SAMPLE_BUDGET, HISTOGRAM_BINS, MINIBATCH_SIZE, SAM_RETRY_CENTER_POINT,
+    PIPELINE_WORKERS, PIPELINE_PREFETCH
+)
+from utils.disk_cache import DiskCache
+from utils.embedding_cache import EmbeddingCache
+from utils.image_loader import DECODE_SETTINGS, read_image, image_buffers
+from utils.metrics import metrics, traced_call
+from utils.dominant_color import dominant_rgb
+from utils.color_utils import palette_ebay, palette_vinted, color_map_ebay, color_map_vinted
 
-def process_image(image_path: str, model) -> Dict[str, str]:
-    image_bgr = cv2.imread(image_path)
-    image_rgb = cv2.cvtColor(image_bgr, cv2.COLOR_BGR2RGB)
-    pixels = None
-    h, w = image_rgb.shape[:2]
+# Everything besides the image bytes that decides a garment mask
+SEGMENTATION_SETTINGS = {
+    'decode': DECODE_SETTINGS,
+    'segmentation': SAM_WEIGHTS,
+    'imgsz': SAM_IMGSZ,
+    'prompt': 'center-square-4-points-10pct',
+    'retry_center_point': SAM_RETRY_CENTER_POINT,
+}
+def palette_digest(*color_maps) -> str:
+    """Hash of the color maps' entries, so editing a color name or RGB value changes the color cache key."""
+    entries = [sorted([list(rgb), name] for rgb, name in color_map.items()) for color_map in color_maps]
+    return hashlib.sha256(json.dumps(entries).encode()).hexdigest()
+
+# Everything besides the image bytes that decides a color result; part of the color cache key
+COLOR_SETTINGS = json.dumps({
+    **SEGMENTATION_SETTINGS,
+    'mode': DOMINANT_COLOR_MODE,
+    'n_clusters': KMEANS_N_CLUSTERS,
+    'max_iter': KMEANS_MAX_ITER,
+    'sample_budget': DOMINANT_COLOR_SAMPLE_BUDGET,
+    'histogram_bins': HISTOGRAM_BINS,
+    'minibatch_size': MINIBATCH_SIZE,
+    'palettes': palette_digest(color_map_ebay, color_map_vinted),
+}, sort_keys=True)
+
+# The SAM predictor and the embedding cache are shared by the worker and speculation threads, and a cancelled
+# worker may still be segmenting when the next run starts; SAM work runs one call at a time
+_sam_lock = threading.Lock()
+
+def read_image_bytes(image_path: str) -> bytes:
+    with open(image_path, 'rb') as f:
+        return f.read()
+
+def load_image(image_path: str) -> np.ndarray:
+    """The image at analysis resolution, decoded once and shared through the image buffer cache."""
+    return image_buffers.load(image_path)
+
+def color_cache_key(image_bytes: bytes) -> str:
+    """Content address of a color result: the image bytes plus the segmentation and clustering settings."""
+    return hashlib.sha256(image_bytes + COLOR_SETTINGS.encode()).hexdigest()
+
+def embedding_key(image_bytes: bytes) -> str:
+    """Content address of a SAM image embedding: the image bytes plus the decoding, model and input size."""
+    return hashlib.sha256(image_bytes + f'{DECODE_SETTINGS}:{SAM_WEIGHTS}@{SAM_IMGSZ}'.encode()).hexdigest()
+
+def center_prompt(h: int, w: int) -> Tuple[List[List[float]], List[int]]:
     side = min(w, h) * 0.1  # Side length is 10% of image dimension
     center_x, center_y = w / 2, h / 2
     point_coords = [
@@ -19,30 +73,236 @@ def process_image(image_path: str, model) -> Dict[str, str]:
         [center_x + side / 2, center_y + side / 2]   # Bottom-right
     ]
     point_labels = [1, 1, 1, 1] # Means that the above are'Focus points' (as oppposed to 'ignore' points; less attention)
-    results = model(image_rgb, points=point_coords, labels=point_labels, imgsz=640, verbose=False)
-    if results and results[0].masks is not None:
-        mask = results[0].masks.data[0].cpu().numpy()
-        binary_mask = (mask > 0.5).astype(np.uint8)
-        pixels = image_rgb[binary_mask == 1]
-
-        if len(pixels) <= KMEANS_N_CLUSTERS:
-            pixels = image_rgb.reshape(-1, 3) # Use whole image, as KMeans needs that minimum amount of pixels
-    else:
-        pixels = image_rgb.reshape(-1, 3)
-
-    # Apply KMeans clustering
-    kmeans = KMeans(n_clusters=KMEANS_N_CLUSTERS, n_init='auto', max_iter=KMEANS_MAX_ITER)
-    kmeans.fit(pixels)
-    labels = kmeans.labels_
-    cluster_sizes = np.bincount(labels)
-    dominant_cluster_idx = np.argmax(cluster_sizes)
-    pred_rgb = kmeans.cluster_centers_[dominant_cluster_idx].astype(int)
+    return point_coords, point_labels
+
+def _sam_predictor(model):
+    """Returns the SAM model's predictor, set up the way SAM.predict would, at a fixed square imgsz."""
+    predictor = model.predictor
+    if predictor is None:
+        args = {**model.overrides, 'conf': 0.25, 'task': 'segment', 'mode': 'predict', 'imgsz': SAM_IMGSZ, 'batch': 1, 'verbose': False}
+        predictor = model._smart_load('predictor')(overrides=args, _callbacks=model.callbacks)
+        predictor.setup_model(model=model.model, verbose=False)
+        model.predictor = predictor
+    predictor.imgsz = [SAM_IMGSZ, SAM_IMGSZ]
+    predictor.model.set_imgsz(predictor.imgsz)
+    predictor.setup_source(None)  # Only derives the feature map sizes from imgsz
+    return predictor
+
+def _split_features(features: Dict, n: int) -> List[Dict]:
+    """SAM2's get_im_features folds the batch into the channel axis; unfold it into one feature dict per image."""
+    unfold = lambda feat: feat.reshape(n, -1, *feat.shape[-2:])
+    image_embed = unfold(features['image_embed'])
+    high_res_feats = [unfold(feat) for feat in features['high_res_feats']]
+    return [
+        {'image_embed': image_embed[[i]], 'high_res_feats': [feat[[i]] for feat in high_res_feats]}
+        for i in range(n)
+    ]
+
+def _encode_images(predictor, images_rgb: List[np.ndarray]) -> List[Dict]:
+    """Runs the SAM2 image encoder once over a batch of images, returning one feature dict per image."""
+    import torch
+    from ultralytics.data.augment import LetterBox
+    letterbox = LetterBox(predictor.imgsz, auto=False, center=False)  # Pads bottom/right, like SAM's own preprocessing
+    with torch.inference_mode():
+        im = np.stack([letterbox(image=image_rgb) for image_rgb in images_rgb])
+        im = np.ascontiguousarray(im[..., ::-1].transpose((0, 3, 1, 2)))  # Same channel flip SAM applies in model(image_rgb)
+        im = torch.from_numpy(im).to(predictor.device)
+        im = (im - predictor.mean) / predictor.std
+        im = im.half() if predictor.model.fp16 else im.float()
+        return _split_features(predictor.get_im_features(im), len(images_rgb))
+
+def _decode_mask(predictor, features: Dict, shape: Tuple[int, int], point_coords, point_labels) -> Optional[np.ndarray]:
+    """Mask-decoder pass for one image. Prompts are scaled into the letterboxed frame and the mask mapped back to shape."""
+    pred_masks, pred_boxes = predictor.inference_features(
+        features, src_shape=shape, dst_shape=predictor.imgsz, points=point_coords, labels=point_labels
+    )
+    return _first_confident_mask(pred_masks, pred_boxes, predictor.args.conf)
+
+def _first_confident_mask(pred_masks, pred_boxes, conf: float) -> Optional[np.ndarray]:
+    """Mirrors the confidence filter SAM applies to results before masks.data[0] is taken."""
+    if pred_masks is None:
+        return None
+    keep = pred_boxes[:, 4] > conf
+    if not keep.any():
+        return None
+    return pred_masks[keep][0].cpu().numpy()
+
+def _usable(mask: Optional[np.ndarray]) -> bool:
+    return mask is not None and mask.sum() > KMEANS_N_CLUSTERS
+
+def segment_images(images_rgb: List[np.ndarray], model, batch_size: int = SAM_BATCH_SIZE,
+                   embedding_cache: Optional[EmbeddingCache] = None,
+                   keys: Optional[List[str]] = None) -> List[Optional[np.ndarray]]:
+    """Boolean garment masks (None where SAM found none): one image-encoder pass per batch of images, then a
+    mask-decoder pass per image with the centre-square prompt.
+
+    With an embedding cache, images whose key (see embedding_key) is cached skip the image encoder.
+    """
+    with _sam_lock:
+        predictor = _sam_predictor(model)
+        features = [None] * len(images_rgb)
+        if embedding_cache is not None:
+            features = [embedding_cache.get(key, predictor.device) for key in keys]
+        to_encode = [i for i, image_features in enumerate(features) if image_features is None]
+        if embedding_cache is not None:
+            metrics.count('cache_hits', len(features) - len(to_encode), cache='embedding')
+            metrics.count('cache_misses', len(to_encode), cache='embedding')
+        for start in range(0, len(to_encode), batch_size):
+            batch = to_encode[start:start + batch_size]
+            with metrics.span('sam_encode'):
+                batch_features = _encode_images(predictor, [images_rgb[i] for i in batch])
+            for i, image_features in zip(batch, batch_features):
+                features[i] = image_features
+                if embedding_cache is not None:
+                    embedding_cache.put(keys[i], image_features)
+
+        masks = []
+        for image_rgb, image_features in zip(images_rgb, features):
+            h, w = image_rgb.shape[:2]
+            with metrics.span('sam_decode'):
+                mask = _decode_mask(predictor, image_features, (h, w), *center_prompt(h, w))
+            if not _usable(mask) and SAM_RETRY_CENTER_POINT:
+                # Cheap second opinion from the same embedding before falling back to the whole image
+                metrics.count('fallbacks', kind='sam_center_point')
+                with metrics.span('sam_decode'):
+                    mask = _decode_mask(predictor, image_features, (h, w), [[w / 2, h / 2]], [1])
+            masks.append(mask)
+        return masks
+
+def masked_pixels(image_rgb: np.ndarray, mask: Optional[np.ndarray]) -> np.ndarray:
+    """Returns the (N, 3) garment pixels, or the whole image if the mask is missing or too small."""
+    if mask is not None:
+        pixels = image_rgb[mask]
+
+        if len(pixels) > KMEANS_N_CLUSTERS:
+            return pixels
+    metrics.count('fallbacks', kind='whole_image')
+    return image_rgb.reshape(-1, 3) # Use whole image, as KMeans needs that minimum amount of pixels
+
+def pixels_color(pixels: np.ndarray) -> Dict[str, str]:
+    """Finds the dominant color of (N, 3) pixels and maps it to eBay and Vinted colors."""
+    with metrics.span('dominant_color', mode=DOMINANT_COLOR_MODE):
+        pred_rgb = dominant_rgb(pixels)
 
     # Map predicted RGB to color names
-    ebay_color = find_closest_color(pred_rgb, color_map_ebay)
-    vinted_color = find_closest_color(pred_rgb, color_map_vinted)
+    with metrics.span('palette_lookup'):
+        ebay_color = palette_ebay.closest(pred_rgb)
+        vinted_color = palette_vinted.closest(pred_rgb)
 
     return {
         'ebay_color': ebay_color,
         'vinted_color': vinted_color,
-    }
\ No newline at end of file
+    }
+
+def dominant_color(image_rgb: np.ndarray, mask: Optional[np.ndarray]) -> Dict[str, str]:
+    """Finds the dominant color of the masked pixels (or the whole image) and maps it to eBay and Vinted colors."""
+    return pixels_color(masked_pixels(image_rgb, mask))
+
+def process_image(image_path: str, model) -> Dict[str, str]:
+    """The colors of a single image, the same way process_images finds them for a listing."""
+    return process_images([image_path], model, workers=1)[0]
+
+_pool = None
+_pool_workers = 0
+_pool_lock = threading.Lock()  # The worker and speculation threads both ask for the pool
+
+def _worker_pool(workers: int) -> ProcessPoolExecutor:
+    """Process pool for decoding and color clustering, kept alive across listings to avoid start-up costs."""
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is None or _pool_workers != workers:
+            if _pool is not None:
+                _pool.shutdown(wait=False, cancel_futures=True)
+            # Spawned rather than forked, as the GUI and torch have threads running
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+            _pool_workers = workers
+        return _pool
+
+def process_images(image_paths: List[str], model, batch_size: int = SAM_BATCH_SIZE,
+                   on_image_done: Optional[Callable[[int], None]] = None,
+                   cache: Optional[DiskCache] = None,
+                   embedding_cache: Optional[EmbeddingCache] = None,
+                   workers: int = PIPELINE_WORKERS) -> List[Dict[str, str]]:
+    """Dominant eBay and Vinted colors of each image of a listing.
+
+    Images whose bytes and settings are already in the cache are neither decoded nor segmented. With more
+    than one worker the remaining images are pipelined: decoding and color clustering run in a process pool
+    and overlap with segmentation, which is fed batches from a prefetch queue. The results are the same as
+    with workers=1, which runs everything serially holding only one batch of decoded images at a time.
+    """
+    results = [None] * len(image_paths)
+    misses = []  # (index, color cache key, embedding key) of the images that still have to be processed
+    done = 0
+
+    def finish(i: int, result: Dict[str, str], key: Optional[str] = None):
+        nonlocal done
+        results[i] = result
+        if cache is not None and key is not None:
+            cache.set(key, result)
+        done += 1
+        if on_image_done is not None:
+            on_image_done(done)
+
+    for i, image_path in enumerate(image_paths):
+        image_bytes = read_image_bytes(image_path)
+        key = color_cache_key(image_bytes)
+        cached = cache.get(key) if cache is not None else None
+        if cache is not None:
+            metrics.count('cache_misses' if cached is None else 'cache_hits', cache='color')
+        if cached is None:
+            misses.append((i, key, embedding_key(image_bytes)))
+        else:
+            finish(i, cached)
+
+    batches = [misses[start:start + batch_size] for start in range(0, len(misses), batch_size)]
+    if workers <= 1 or not batches:
+        for batch in batches:
+            images_rgb = [load_image(image_paths[i]) for i, _, _ in batch]
+            masks = segment_images(images_rgb, model, batch_size, embedding_cache, [key for _, _, key in batch])
+            for (i, key, _), image_rgb, mask in zip(batch, images_rgb, masks):
+                finish(i, dominant_color(image_rgb, mask), key)
+        return results
+
+    pool = _worker_pool(workers)
+
+    def decode(batch):
+        """Futures of a batch's images: already decoded ones (e.g. for the thumbnail) from the buffer cache."""
+        futures = []
+        for i, _, _ in batch:
+            image_rgb = image_buffers.get(image_paths[i])
+            if image_rgb is None:
+                futures.append(pool.submit(traced_call, read_image, image_paths[i]))
+            else:
+                futures.append(Future())
+                futures[-1].set_result((image_rgb, []))
+        return futures
+
+    def merged(future):
+        """Result of a traced_call in the pool, merging the metrics it recorded."""
+        value, events = future.result()
+        metrics.merge(events)
+        return value
+
+    prefetched = deque(decode(batch) for batch in batches[:PIPELINE_PREFETCH])
+    clustering = []  # (index, color cache key, future) in submission order
+    try:
+        for b, batch in enumerate(batches):
+            images_rgb = [merged(future) for future in prefetched.popleft()]
+            for (i, _, _), image_rgb in zip(batch, images_rgb):
+                image_buffers.put(image_paths[i], image_rgb)
+            if b + PIPELINE_PREFETCH < len(batches):
+                prefetched.append(decode(batches[b + PIPELINE_PREFETCH]))
+            masks = segment_images(images_rgb, model, batch_size, embedding_cache, [key for _, _, key in batch])
+            for (i, key, _), image_rgb, mask in zip(batch, images_rgb, masks):
+                # Only the garment pixels are sent to the pool, not the whole image
+                clustering.append((i, key, pool.submit(traced_call, pixels_color, masked_pixels(image_rgb, mask))))
+            del images_rgb
+            while clustering and clustering[0][2].done():
+                i, key, future = clustering.pop(0)
+                finish(i, merged(future), key)
+        for i, key, future in clustering:
+            finish(i, merged(future), key)
+    finally:
+        for future in [f for batch in prefetched for f in batch] + [f for _, _, f in clustering]:
+            future.cancel()
+    return results
@@ -1,8 +1,11 @@
 import sys
+import time
+launch_time = time.perf_counter()  # Taken before the imports below, which are part of the cold start
+
 from ui.main_window import MainWindow
 from PyQt5.QtWidgets import QApplication
 
 if __name__ == '__main__':
     app = QApplication(sys.argv)
-    window = MainWindow()
+    window = MainWindow(launch_time)
     sys.exit(app.exec_())
\ No newline at end of file
@@ -0,0 +1,109 @@
+import os
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import Callable, Dict, Iterable, Optional
+from utils.config import SAM_WEIGHTS, BERT_MODEL_DIR, BERT_BACKEND, MODEL_LOADER_WORKERS
+
+# Display names of every model the pipeline uses, in load order
+MODEL_LABELS = {
+    'sam': "SAM",
+    'bert': "BERT",
+    'tokenizer': "Tokenizer",
+    'vinted_encoder': "Vinted encoder",
+    'ebay_encoder': "eBay encoder",
+    'llm': "LLM",
+}
+
+class ModelLoader:
+    """Loads the models concurrently in the background, so callers only block on the ones they need."""
+    def __init__(self, max_workers: int = MODEL_LOADER_WORKERS, bert_backend: str = BERT_BACKEND):
+        self.bert_backend = bert_backend
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='model-loader')
+        self._futures: Dict[str, Future] = {}
+        self.load_times: Dict[str, float] = {}  # Seconds each model took to load
+        self.device = None
+
+    def start(self, on_loaded: Optional[Callable[[str, Optional[BaseException]], None]] = None,
+              names: Optional[Iterable[str]] = None):
+        """Submits the loaders of names (default: all). on_loaded(name, error) is called from a loader thread once
+        a model is done."""
+        loaders = {
+            'sam': self._load_sam,
+            'bert': self._load_bert,
+            'tokenizer': self._load_tokenizer,
+            'vinted_encoder': lambda: self._load_encoder('vinted_encoder.pkl'),
+            'ebay_encoder': lambda: self._load_encoder('ebay_encoder.pkl'),
+            'llm': self._load_llm,
+        }
+        for name in (names or loaders):
+            self._futures[name] = self._executor.submit(self._timed, name, loaders[name])
+        if on_loaded is not None:
+            # Registered once every future exists, as callbacks of already finished loads run immediately
+            for name, future in self._futures.items():
+                future.add_done_callback(lambda f, name=name: on_loaded(name, f.exception()))
+
+    def _timed(self, name: str, loader: Callable):
+        start = time.perf_counter()
+        model = loader()
+        self.load_times[name] = time.perf_counter() - start
+        return model
+
+    def status(self, name: str) -> str:
+        """Returns 'loading', 'ready' or 'failed'."""
+        future = self._futures[name]
+        if not future.done():
+            return 'loading'
+        return 'failed' if future.exception() is not None else 'ready'
+
+    def is_ready(self, name: str) -> bool:
+        return self.status(name) == 'ready'
+
+    def get(self, name: str, timeout: Optional[float] = None):
+        """Returns the loaded model, blocking until it is available. Re-raises loading errors."""
+        return self._futures[name].result(timeout=timeout)
+
+    def wait(self, names: Iterable[str]):
+        return [self.get(name) for name in names]
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    # Heavy libraries are imported inside the loaders, keeping them off the startup path
+    def _load_sam(self):
+        from ultralytics import SAM
+        return SAM(SAM_WEIGHTS)
+
+    def _load_bert(self):
+        import torch
+        from utils.bert_backends import load_backend
+        # Only the fp32 PyTorch backend may use a GPU
+        self.device = torch.device('cuda' if self.bert_backend == 'torch' and torch.cuda.is_available() else 'cpu')
+        return load_backend(self.bert_backend, self._load_bert_fp32)
+
+    def _load_bert_fp32(self):
+        import torch
+        from models.bert_classifier_model import BertForMultiTaskClassification
+        with open(os.path.join(BERT_MODEL_DIR, 'model_config.json'), 'r') as f:
+            config = json.load(f)
+        num_vinted_classes = config['num_vinted_classes']
+        num_ebay_classes = config['num_ebay_classes']
+        bert_model = BertForMultiTaskClassification(num_vinted_classes, num_ebay_classes)
+        bert_model.to(self.device)
+        bert_model.load_state_dict(torch.load(os.path.join(BERT_MODEL_DIR, 'best_bert_category_classifier.pth'), map_location=self.device))
+        bert_model.eval()
+        return bert_model
+
+    def _load_tokenizer(self):
+        # The Rust tokenizer, built from the saved vocabulary; same tokens as the BertTokenizer used in training
+        from transformers import BertTokenizerFast
+        return BertTokenizerFast.from_pretrained(os.path.join(BERT_MODEL_DIR, 'bert_category_classifier'))
+
+    def _load_encoder(self, file_name: str):
+        import joblib
+        return joblib.load(os.path.join(BERT_MODEL_DIR, file_name))
+
+    def _load_llm(self):
+        # Ollama holds the model itself, this loads it and caches the evaluated few-shot prompt prefix
+        from utils.listing_utils import warm_up
+        return warm_up()
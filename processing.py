@@ -1,127 +1,388 @@
-import torch
+import json
+import threading
 from enum import Enum
 from collections import namedtuple
-from typing import Dict
-from PyQt5.QtCore import QTimer
-from image_processing import process_image
-from utils.listing_utils import generate_text
+from typing import Dict, List, Optional
+from concurrent.futures import Future, TimeoutError, CancelledError
+from PyQt5.QtCore import QObject, QThread, pyqtSignal, pyqtSlot
+from PyQt5.QtWidgets import QMessageBox
+from engine import ListingEngine, item_platforms, build_listing_attributes
+from utils.stage_scheduler import run_stages, critical_path
+from utils.listing_utils import PLATFORMS, generate_text, parse_listing_text, prefill_report
+from utils.metrics import metrics
+from utils.image_loader import file_identity
+from model_loader import MODEL_LABELS
 
 class ProcessingState(Enum):
     INIT = 0
     EXTRACT_COLORS = 1
-    GENERATE_TITLE = 2
-    PREDICT_CATEGORIES = 3
+    PREDICT_CATEGORIES = 2
+    ASSEMBLE_ATTRIBUTES = 3
     GENERATE_TEXT = 4
     DONE = 5
 
-Task = namedtuple('Task', ['state', 'progress', 'label'])
+# 'weight' is the share of the progress bar a task accounts for (weights sum to 100). 'inputs' and 'outputs' name
+# the form inputs and results a task reads and writes; a task starts as soon as all of its inputs exist. Inputs
+# must be complete, a task is skipped when they are unchanged since its last run (see stage_key). 'memoizable',
+# if given, decides from a run's results whether they may be replayed that way
+Task = namedtuple('Task', ['state', 'weight', 'label', 'inputs', 'outputs', 'memoizable'], defaults=(None,))
 
 PROCESSING_TASKS = [
-    Task(ProcessingState.EXTRACT_COLORS, 25, "Extracting colors from images..."),
-    Task(ProcessingState.GENERATE_TITLE, 50, "Generating title..."),
-    Task(ProcessingState.PREDICT_CATEGORIES, 75, "Predicting categories with BERT..."),
-    Task(ProcessingState.GENERATE_TEXT, 100, "Generating text with LLM..."),
+    Task(ProcessingState.EXTRACT_COLORS, 60, "Extracting colors from images...",
+         ('images', 'ebay', 'vinted'), ('color_results', 'ebay_color', 'vinted_color')),
+    Task(ProcessingState.PREDICT_CATEGORIES, 10, "Predicting categories with BERT...",
+         ('gender', 'description', 'ebay', 'vinted'), ('vinted_category', 'ebay_category', 'category_candidates')),
+    Task(ProcessingState.ASSEMBLE_ATTRIBUTES, 0, "Assembling listing attributes...",
+         ('ebay_color', 'vinted_color', 'vinted_category', 'ebay_category',
+          'description', 'gender', 'size', 'condition', 'price', 'vinted'), ('listing_attributes',)),
+    Task(ProcessingState.GENERATE_TEXT, 30, "Generating text with LLM...",
+         ('listing_attributes', 'ebay', 'vinted'), ('listing_text', 'generation_stats'),
+         # Like the listing cache, only well-formed answers, a malformed one is generated again
+         lambda results: bool(parse_listing_text(results['listing_text']))),
 ]
 
-class Processor:
-    def __init__(self, main_window):
+# How an input enters the memo key of the tasks reading it, where its value alone does not decide their results:
+# images by file identity, as files can be edited in place, and listing attributes without the price, which the
+# prompt leaves out
+MEMO_KEY_VALUES = {
+    'images': lambda image_paths: [file_identity(image_path) for image_path in image_paths],
+    'listing_attributes': lambda attributes: {name: value for name, value in attributes.items() if name != 'price'},
+}
+
+def stage_key(task: Task, values: Dict) -> str:
+    """The inputs that decide a task's results, serialized. Equal keys mean the task's last results still hold."""
+    return json.dumps(
+        {name: MEMO_KEY_VALUES[name](values[name]) if name in MEMO_KEY_VALUES else values[name] for name in task.inputs},
+        sort_keys=True, default=str
+    )
+
+class ProcessingCancelled(Exception):
+    pass
+
+class ProcessingWorker(QObject):
+    """Runs the processing tasks on a background thread, reporting back through signals."""
+    progress = pyqtSignal(int)  # Overall completed work, 0-100
+    task_started = pyqtSignal(str)  # Labels of the tasks now running
+    text_started = pyqtSignal(dict)  # Results so far, sent before the LLM starts streaming
+    text_progress = pyqtSignal(dict)  # Listings parsed from the text streamed so far, see ListingParser.sections
+    finished = pyqtSignal(dict)
+    failed = pyqtSignal(str)
+    cancelled = pyqtSignal()
+
+    def __init__(self, main_window, inputs: Dict, tasks: List[Task] = PROCESSING_TASKS, results: Optional[Dict] = None,
+                 memo: Optional[Dict] = None):
+        super().__init__()
         self.main_window = main_window
-        self.current_task_index = 0
+        self.inputs = inputs  # Snapshot of the form, widgets must not be read off the GUI thread
+        self.tasks = tasks
+        self.results = dict(results or {})  # Results of earlier tasks, when only running the later ones
+        self.memo = memo if memo is not None else {}  # Task state -> (stage_key, outputs) of the task's last run
+        self.engine = ListingEngine(
+            main_window.model_loader, main_window.color_cache, main_window.embedding_cache, main_window.listing_cache,
+            require=self._require
+        )
+        self._cancel_event = threading.Event()
+        self._fractions = {}  # Task state -> completed fraction of the task
+        self._running = {}  # Task state -> label shown while it runs, in start order
+        self._lock = threading.Lock()
 
-    def start(self):
-        """Starts the processing pipeline, switching to the loading page."""
-        self.main_window.stacked_widget.setCurrentWidget(self.main_window.loading_page)
-        self.main_window.submit_button.setEnabled(False)
-        self.main_window.progress = 0
-        self.main_window.color_results = []
-        self.main_window.timer = QTimer()
-        self.main_window.timer.timeout.connect(self.update)
-        self.main_window.timer.start(100)
-
-    def update(self):
-        """Updates the progress bar and executes the current task."""
-        if self.current_task_index >= len(PROCESSING_TASKS):
-            self.main_window.timer.stop()
-            self.main_window.stacked_widget.setCurrentWidget(self.main_window.review_page)
-            self.main_window.submit_button.setEnabled(True)
-            self.main_window.current_review_image_index = 0
-            self.main_window.update_review_image_display()
-            self.main_window.generate_listing()
-            return
+    def cancel(self):
+        self._cancel_event.set()
+
+    def _check_cancelled(self):
+        if self._cancel_event.is_set():
+            raise ProcessingCancelled()
+
+    def _require(self, name: str, task: Optional[Task] = None):
+        """Returns a model from the background loader, waiting (cancellably) if it is still loading."""
+        loader = self.main_window.model_loader
+        if not loader.is_ready(name) and task is not None:
+            self._announce(task, f"Waiting for {MODEL_LABELS[name]} to load...")
+        while True:
+            self._check_cancelled()
+            try:
+                return loader.get(name, timeout=0.1)
+            except TimeoutError:
+                continue
+
+    def _wait(self, future: Future):
+        """Result of a speculative job, waiting cancellably. None if it failed or was cancelled."""
+        while True:
+            self._check_cancelled()
+            try:
+                return future.result(timeout=0.1)
+            except TimeoutError:
+                continue
+            except (Exception, CancelledError):
+                return None
 
-        task = PROCESSING_TASKS[self.current_task_index]
-        self.main_window.progress_bar.setValue(task.progress)
-        self.main_window.loading_label.setText(task.label)
+    def _report(self, task: Task, fraction: float):
+        """Progress summed over all tasks, so concurrently running tasks both move the bar."""
+        with self._lock:
+            self._fractions[task.state] = fraction
+            self.progress.emit(int(sum(task.weight * self._fractions.get(task.state, 0.0) for task in self.tasks)))
 
-        if task.state == ProcessingState.EXTRACT_COLORS:
-            self.extract_colors()
-        elif task.state == ProcessingState.GENERATE_TITLE:
-            pass  
-        elif task.state == ProcessingState.PREDICT_CATEGORIES:
-            self.predict_categories()
-        elif task.state == ProcessingState.GENERATE_TEXT:
-            self.generate_text()
+    def _announce(self, task: Task, label: Optional[str] = None):
+        """Shows label (default: the task's) for a running task, next to the labels of the other running ones."""
+        with self._lock:
+            self._running[task.state] = label or task.label
+            self.task_started.emit(" | ".join(self._running.values()))
 
-        self.current_task_index += 1
+    def _run_task(self, task: Task):
+        self._check_cancelled()
+        self._announce(task)
+        self._report(task, 0.0)
+        stage = {
+            ProcessingState.EXTRACT_COLORS: self.extract_colors,
+            ProcessingState.PREDICT_CATEGORIES: self.predict_categories,
+            ProcessingState.ASSEMBLE_ATTRIBUTES: self.assemble_attributes,
+            ProcessingState.GENERATE_TEXT: self.generate_text,
+        }[task.state]
+        key = stage_key(task, {**self.inputs, **self.results})
+        memoized = self.memo.get(task.state)
+        if memoized is not None and memoized[0] == key and not self.inputs.get('regenerate', False):
+            # Resubmitted after Redo without changing what this task reads
+            metrics.count('cache_hits', cache='stage_memo')
+            self.results.update(memoized[1])
+        else:
+            metrics.count('cache_misses', cache='stage_memo')
+            with metrics.span('stage', stage=task.state.name):
+                stage(task)
+            if task.memoizable is None or task.memoizable(self.results):
+                self.memo[task.state] = (key, {name: self.results[name] for name in task.outputs})
+            else:
+                self.memo.pop(task.state, None)
+        self._report(task, 1.0)
+        with self._lock:
+            self._running.pop(task.state, None)
 
-    def extract_colors(self):
+    @pyqtSlot()
+    def run(self):
+        try:
+            with metrics.span('listing'):
+                timings = run_stages(self.tasks, list(self.inputs) + list(self.results), self._run_task)
+            self._check_cancelled()
+        except ProcessingCancelled:
+            metrics.count('listings', outcome='cancelled')
+            metrics.write_prometheus()
+            self.cancelled.emit()
+            return
+        except Exception as e:
+            metrics.count('listings', outcome='failed')
+            metrics.write_prometheus()
+            self.failed.emit(str(e))
+            return
+        self.results['stage_timings'] = {task.state.name: end - start for task, (start, end) in timings.items()}
+        path = critical_path(timings)
+        metrics.record('critical_path', timings[path[-1]][1])
+        metrics.event('stage_timings', stages={task.state.name: [start, end] for task, (start, end) in timings.items()},
+                      critical_path=[task.state.name for task in path])
+        metrics.count('listings', outcome='finished')
+        metrics.write_prometheus()
+        self.finished.emit(self.results)
+
+    def extract_colors(self, task: Task):
         """Extracts dominant colors from images using SAM and KMeans."""
-        for _, file_path in self.main_window.images:
-            color_result = process_image(file_path, self.main_window.model)
-            self.main_window.color_results.append(color_result)
-        ebay_color_counts = {}
-        vinted_color_counts = {}
-        for color_result in self.main_window.color_results:
-            if color_result:
-                if self.main_window.checkbox1.isChecked():
-                    ebay_color = color_result['ebay_color']
-                    ebay_color_counts[ebay_color] = ebay_color_counts.get(ebay_color, 0) + 1
-                if self.main_window.checkbox2.isChecked():
-                    vinted_color = color_result['vinted_color']
-                    vinted_color_counts[vinted_color] = vinted_color_counts.get(vinted_color, 0) + 1
-        self.main_window.ebay_color = max(ebay_color_counts, key=ebay_color_counts.get, default="Unknown")
-        self.main_window.vinted_color = max(vinted_color_counts, key=vinted_color_counts.get, default="Unknown")
-
-    def predict_categories(self):
+        image_paths = self.inputs['images']
+        self._require('sam', task)
+        self._announce(task)
+        # Images extracted speculatively since their upload are color cache hits, SAM must not run twice at once
+        for future in self.inputs['speculation']['colors']:
+            self._wait(future)
+
+        def on_image_done(done: int):
+            self._announce(task, f"{task.label} ({done}/{len(image_paths)})")
+            self._report(task, done / len(image_paths))
+            self._check_cancelled()
+
+        self.results.update(self.engine.extract_colors([self.inputs], on_image_done)[0])
+
+    def predict_categories(self, task: Task):
         """Predicts Vinted and eBay categories using the BERT model."""
-        gender = self.main_window.gender_combo.currentText()
-        description = self.main_window.description_input.text().strip()
-        inputs = self.main_window.tokenizer(
-            f'{gender}\'s {description}', return_tensors="pt", truncation=True, padding=True
-        ).to(self.main_window.device)
-        if 'token_type_ids' in inputs:
-            del inputs['token_type_ids']
-        with torch.no_grad():
-            outputs = self.main_window.bert_model(**inputs)
-        self.main_window.vinted_category = (
-            self.main_window.vinted_encoder.inverse_transform(
-                [torch.argmax(outputs['vinted_logits'], dim=1).cpu().numpy()[0]]
-            )[0] if self.main_window.checkbox2.isChecked() else "N/A"
-        )
-        self.main_window.ebay_category = (
-            self.main_window.ebay_encoder.inverse_transform(
-                [torch.argmax(outputs['ebay_logits'], dim=1).cpu().numpy()[0]]
-            )[0] if self.main_window.checkbox1.isChecked() else "N/A"
+        future = self.inputs['speculation']['categories']
+        categories = self._wait(future) if future is not None else None
+        metrics.count('cache_misses' if categories is None else 'cache_hits', cache='speculated_categories')
+        if categories is not None:
+            # Predicted for both platforms while the description was typed, keep only the selected ones
+            platforms = [platform.lower() for platform in PLATFORMS]
+            self.results.update({f'{head}_category': categories[f'{head}_category'] if self.inputs[head] else "N/A"
+                                 for head in platforms})
+            self.results['category_candidates'] = {
+                head: candidates for head, candidates in categories['category_candidates'].items() if self.inputs[head]
+            }
+            return
+        # Only wait on the encoders of the selected platforms
+        for name in ['bert', 'tokenizer'] + [f'{platform.lower()}_encoder' for platform in item_platforms(self.inputs)]:
+            self._require(name, task)
+        self._announce(task)
+        self.results.update(self.engine.predict_categories([self.inputs])[0])
+
+    def assemble_attributes(self, task: Task):
+        """Combines the colors and categories with the form inputs into the attributes the LLM prompt uses."""
+        self.results['listing_attributes'] = build_listing_attributes(self.inputs, self.results)
+
+    def generate_text(self, task: Task):
+        """Generates listing text using the LLM, streaming it to the review page as it arrives.
+
+        Each selected platform gets its own prompt, generated concurrently.
+        """
+        self.text_started.emit(dict(self.results))
+        platforms = item_platforms(self.inputs)
+        stats = {}
+
+        def on_text(platform_listings: Dict):
+            self._check_cancelled()  # Raising here stops all generations and closes their connections
+            self.text_progress.emit(platform_listings)
+
+        self.results['listing_text'] = generate_text(
+            self.results['listing_attributes'], platforms, on_text, stats,
+            cache=self.main_window.listing_cache, force=self.inputs.get('regenerate', False)
         )
+        self.results['generation_stats'] = stats
+        for platform, platform_stats in stats.items():
+            if not platform_stats.get('cached'):
+                metrics.record('llm_ttft', platform_stats['ttft'], platform=platform)
+        metrics.event('generation_stats', platforms=stats, prefill=prefill_report())
+        metrics.event('listing_attributes', attributes=self.results['listing_attributes'])
 
-        self.main_window.listing_attributes = {
-            "product": description,
+class Processor(QObject):
+    """Owns the background worker thread and applies its results to the main window."""
+    def __init__(self, main_window):
+        super().__init__(main_window)
+        self.main_window = main_window
+        self.worker = None
+        self._runs = []  # (thread, worker) pairs kept alive until their thread has finished
+        # Each task's latest inputs and results, so a resubmission only re-runs the tasks whose inputs changed
+        self.stage_memo = {}
+
+    def _collect_inputs(self) -> Dict:
+        """Reads the form widgets on the GUI thread, so the worker never touches them."""
+        image_paths = [file_path for _, file_path in self.main_window.images]
+        gender = self.main_window.gender_combo.currentText()
+        description = self.main_window.description_input.text().strip()
+        speculator = self.main_window.speculator
+        return {
+            "images": image_paths,
             "gender": gender,
-            "color": self.main_window.ebay_color if self.main_window.checkbox2.isChecked() else self.main_window.vinted_color,
-            "category": {
-                "vinted": self.main_window.vinted_category,
-                "ebay": self.main_window.ebay_category
-            },
+            "description": description,
+            "ebay": self.main_window.checkbox1.isChecked(),
+            "vinted": self.main_window.checkbox2.isChecked(),
             "size": self.main_window.size,
             "condition": (
                 "Fair" if self.main_window.radio1.isChecked() else
                 "Good" if self.main_window.radio2.isChecked() else
                 "Excellent"
             ),
-            "price": self.main_window.price
+            "price": self.main_window.price,
+            # Background work started while the form was filled in, see Speculator
+            "speculation": {
+                "colors": speculator.color_futures(image_paths),
+                "categories": speculator.categories_future(gender, description)
+            }
         }
 
-    def generate_text(self):
-        """Generates listing text using the LLM."""
-        self.main_window.listing_text = generate_text(self.main_window.listing_attributes)
-        print('/', self.main_window.listing_attributes, '/')
\ No newline at end of file
+    def start(self):
+        """Starts the processing pipeline on a worker thread, switching to the loading page."""
+        self.main_window.stacked_widget.setCurrentWidget(self.main_window.loading_page)
+        self.main_window.submit_button.setEnabled(False)
+        self.main_window.progress_bar.setValue(0)
+        self.main_window.color_results = []
+        self._run(ProcessingWorker(self.main_window, self._collect_inputs(), memo=self.stage_memo))
+
+    def regenerate(self):
+        """Generates the listing text of the reviewed item again, bypassing the listing cache."""
+        if self.worker is not None:
+            return
+        self.main_window.submit_button.setEnabled(False)
+        inputs = self._collect_inputs()
+        inputs['regenerate'] = True
+        results = {'listing_attributes': self.main_window.listing_attributes}
+        tasks = [task for task in PROCESSING_TASKS if task.state == ProcessingState.GENERATE_TEXT]
+        self._run(ProcessingWorker(self.main_window, inputs, tasks, results, self.stage_memo))
+
+    def _run(self, worker: ProcessingWorker):
+        thread = QThread()
+        worker.moveToThread(thread)
+        thread.started.connect(worker.run)
+        worker.progress.connect(self.on_progress)
+        worker.task_started.connect(self.on_task_started)
+        worker.text_started.connect(self.on_text_started)
+        worker.text_progress.connect(self.on_text_progress)
+        worker.finished.connect(self.on_finished)
+        worker.failed.connect(self.on_failed)
+        for signal in (worker.finished, worker.failed, worker.cancelled):
+            signal.connect(thread.quit)
+        thread.finished.connect(lambda: self._runs.remove((thread, worker)))
+
+        self._runs.append((thread, worker))
+        self.worker = worker
+        thread.start()
+
+    def cancel(self):
+        """Cancels the running pipeline. Results the worker still produces are discarded."""
+        if self.worker is not None:
+            self.worker.cancel()
+            self.worker = None
+        self.main_window.submit_button.setEnabled(True)
+        self._set_review_buttons_enabled(True)
+        self.main_window.return_to_main()
+
+    def _set_review_buttons_enabled(self, enabled: bool):
+        self.main_window.list_button.setEnabled(enabled)
+        self.main_window.regenerate_button.setEnabled(enabled)
+
+    def _apply_results(self, results: Dict):
+        for name, value in results.items():
+            setattr(self.main_window, name, value)
+
+    @pyqtSlot(int)
+    def on_progress(self, value: int):
+        if self.sender() is self.worker:
+            self.main_window.progress_bar.setValue(value)
+
+    @pyqtSlot(str)
+    def on_task_started(self, label: str):
+        if self.sender() is self.worker:
+            self.main_window.loading_label.setText(label)
+
+    @pyqtSlot(dict)
+    def on_text_started(self, results: Dict):
+        """Switches to the review page as soon as colors and categories are known, to show the text as it streams."""
+        if self.sender() is not self.worker:
+            return
+        self._apply_results(results)
+        self.main_window.listing_text = ""
+        self._set_review_buttons_enabled(False)
+        self.main_window.stacked_widget.setCurrentWidget(self.main_window.review_page)
+        self.main_window.current_review_image_index = 0
+        self.main_window.update_review_image_display()
+        self.main_window.generate_listing(streamed_listings={})
+
+    @pyqtSlot(dict)
+    def on_text_progress(self, platform_listings: Dict):
+        if self.sender() is self.worker:
+            self.main_window.generate_listing(streamed_listings=platform_listings)
+
+    @pyqtSlot(dict)
+    def on_finished(self, results: Dict):
+        if self.sender() is not self.worker:
+            return  # Stale result of a cancelled run
+        self.worker = None
+        self._apply_results(results)
+        self.main_window.stacked_widget.setCurrentWidget(self.main_window.review_page)
+        self.main_window.submit_button.setEnabled(True)
+        self._set_review_buttons_enabled(True)
+        self.main_window.current_review_image_index = 0
+        self.main_window.update_review_image_display()
+        self.main_window.generate_listing()
+        self.main_window.on_listing_completed()
+
+    @pyqtSlot(str)
+    def on_failed(self, message: str):
+        if self.sender() is not self.worker:
+            return
+        self.worker = None
+        self.main_window.submit_button.setEnabled(True)
+        self._set_review_buttons_enabled(True)
+        self.main_window.return_to_main()
+        QMessageBox.warning(self.main_window, "Processing Failed", f"Failed to generate listing: {message}")
@@ -0,0 +1,97 @@
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import Dict, List, Optional
+from PyQt5.QtCore import QObject, QTimer
+from engine import ListingEngine
+from image_processing import process_images
+from utils.config import SAM_BATCH_SIZE, SPECULATION_DEBOUNCE_MS, SPECULATED_CATEGORIES_MAX_ENTRIES
+
+class SpeculationCancelled(Exception):
+    pass
+
+class Speculator(QObject):
+    """Starts pipeline work while the user is still filling in the form, so Generate mostly waits on the LLM.
+
+    Colors of uploaded images are extracted into the (content-addressed) color cache in the background, and
+    categories are predicted for the description and gender once the user pauses typing. Results are only ever
+    looked up by what they were computed from, so a changed description or a replaced image file can't get a
+    stale answer. Jobs run one at a time per model, the processing worker waits on the ones it needs. All methods
+    are called on the GUI thread.
+    """
+    def __init__(self, main_window):
+        super().__init__(main_window)
+        self.main_window = main_window
+        self.engine = ListingEngine(main_window.model_loader)
+        self._color_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='speculate-colors')
+        self._category_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='speculate-categories')
+        self._color_jobs: Dict[str, tuple] = {}  # Image path -> (future, cancel event) of the job extracting it
+        self._categories: OrderedDict = OrderedDict()  # (gender, description) -> future of the categories
+        self._debounce = QTimer(self)
+        self._debounce.setSingleShot(True)
+        self._debounce.setInterval(SPECULATION_DEBOUNCE_MS)
+        self._debounce.timeout.connect(self._predict_categories)
+
+    # Colors
+    def images_added(self, image_paths: List[str]):
+        image_paths = [image_path for image_path in dict.fromkeys(image_paths) if image_path not in self._color_jobs]
+        if not image_paths:
+            return
+        cancel_event = threading.Event()
+        future = self._color_executor.submit(self._extract_colors, image_paths, cancel_event)
+        for image_path in image_paths:
+            self._color_jobs[image_path] = (future, cancel_event)
+
+    def images_removed(self, remaining_paths: List[str]):
+        """Cancels the extraction of images no longer in the listing, once nothing else in their job is needed."""
+        remaining_paths = set(remaining_paths)
+        for image_path in [image_path for image_path in self._color_jobs if image_path not in remaining_paths]:
+            future, cancel_event = self._color_jobs.pop(image_path)
+            if not any(job[0] is future for job in self._color_jobs.values()):
+                future.cancel()
+                cancel_event.set()
+
+    def _extract_colors(self, image_paths: List[str], cancel_event: threading.Event):
+        def on_image_done(done: int):
+            if cancel_event.is_set():
+                raise SpeculationCancelled()
+
+        model = self.main_window.model_loader.get('sam')
+        # Only the cache entries matter, the processing worker reads them back
+        process_images(
+            image_paths, model, SAM_BATCH_SIZE, on_image_done,
+            self.main_window.color_cache, self.main_window.embedding_cache
+        )
+
+    def color_futures(self, image_paths: List[str]) -> List[Future]:
+        """Speculative jobs covering image_paths, to wait for before running SAM on them again."""
+        return list({id(job[0]): job[0] for path, job in self._color_jobs.items() if path in image_paths}.values())
+
+    # Categories
+    def text_edited(self):
+        """Restarts the debounce timer, categories are predicted once the form has been still for a moment."""
+        self._debounce.start()
+
+    def _predict_categories(self):
+        key = (self.main_window.gender_combo.currentText(), self.main_window.description_input.text().strip())
+        if not key[1] or key in self._categories:
+            return
+        item = {'gender': key[0], 'description': key[1], 'vinted': True, 'ebay': True}
+        self._categories[key] = self._category_executor.submit(lambda: self.engine.predict_categories([item])[0])
+        while len(self._categories) > SPECULATED_CATEGORIES_MAX_ENTRIES:
+            self._categories.popitem(last=False)[1].cancel()
+
+    def categories_future(self, gender: str, description: str) -> Optional[Future]:
+        """Future of the categories predicted for exactly this gender and description, if any. An edit still
+        waiting out the debounce delay is predicted right away."""
+        if self._debounce.isActive():
+            self._debounce.stop()
+            self._predict_categories()
+        return self._categories.get((gender, description))
+
+    def shutdown(self):
+        self._debounce.stop()
+        for cancel_event in {id(job[1]): job[1] for job in self._color_jobs.values()}.values():
+            cancel_event.set()
+        self._color_executor.shutdown(wait=False, cancel_futures=True)
+        self._category_executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,49 @@
+from utils.listing_parser import ListingParser
+from utils.listing_utils import parse_listing_text
+
+ANSWER = (
+    "=== Vinted ===\nTitle: Blauw <b>T-shirt</b>\nDescripion: Mooi blauw T-shirt, maat M. =====\n\n"
+    "=== eBay ===\nTitle: Women's Blue T-Shirt\nDescription: Blue cotton T-shirt, size M. =====\n"
+)
+LISTINGS = {
+    'Vinted': {'title': 'Blauw &lt;b&gt;T-shirt&lt;/b&gt;', 'description': 'Mooi blauw T-shirt, maat M.'},
+    'eBay': {'title': 'Women&#x27;s Blue T-Shirt', 'description': 'Blue cotton T-shirt, size M.'},
+}
+
+def feed_in_pieces(text, size):
+    parser = ListingParser()
+    for start in range(0, len(text), size):
+        parser.feed(text[start:start + size])
+    return parser
+
+def test_complete_answer():
+    assert parse_listing_text(ANSWER) == LISTINGS
+
+def test_pieces_parse_like_the_whole_answer():
+    for size in range(1, 12):
+        assert feed_in_pieces(ANSWER, size).result() == LISTINGS
+
+def test_answer_cut_off_inside_a_header_is_malformed():
+    first = ANSWER[:ANSWER.index('=== eBay')]
+    for truncated in (first + "=== e", first + "=== ", first + "=== eBay ===\n", ANSWER + "=== "):
+        assert parse_listing_text(truncated) is None, truncated
+        assert feed_in_pieces(truncated, 3).result() is None, truncated
+
+def test_answer_cut_off_inside_a_section_is_malformed():
+    for end in (ANSWER.index('Title: Women'), ANSWER.index('Description: Blue'), len(ANSWER) - 8):
+        assert parse_listing_text(ANSWER[:end]) is None
+
+def test_missing_terminator_before_the_next_header_is_malformed():
+    assert parse_listing_text(ANSWER.replace(" =====\n\n=== eBay", "\n=== eBay", 1)) is None
+
+def test_single_platform_answer_completes_at_its_terminator():
+    parser = ListingParser('eBay', ['eBay'])
+    closed = [parser.feed(piece) for piece in ("Sure!\nTitle: Warm", " coat\nDescrip", "tion: Wool ==", "===\nTitle: more")]
+    assert closed == [[], [], [], ['eBay']]
+    assert parser.complete
+    assert parser.result() == {'eBay': {'title': 'Warm coat', 'description': 'Wool'}}
+
+def test_sections_while_streaming():
+    parser = ListingParser()
+    parser.feed("=== Vinted ===\nTitle: Blauw\nDescription: Mooi ==")
+    assert parser.sections() == {'Vinted': {'title': 'Blauw', 'description': 'Mooi'}}
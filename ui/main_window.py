@@ -1,19 +1,22 @@
 import sys
-import json
-import torch
-import joblib
+import time
 from html import escape
-from ultralytics import SAM
 from processing import Processor
+from speculation import Speculator
 from ui.validator import Validator
-from PyQt5.QtCore import Qt, QTimer
+from model_loader import ModelLoader, MODEL_LABELS
+from utils.disk_cache import DiskCache
+from utils.metrics import metrics
+from utils.embedding_cache import EmbeddingCache
+from ui.thumbnail_cache import ThumbnailCache
+from utils.listing_utils import parse_listing_text
+from PyQt5.QtCore import QObject, QTimer, pyqtSignal
 from PyQt5.QtGui import QPixmap, QFont
-from transformers import BertTokenizer
 from utils.config import (
     MAX_IMAGES, PROGRESS_INCREMENT, DEFAULT_STYLE, RED_BORDER_STYLE,
-    IMAGE_LABEL_STYLE, SUBMIT_BUTTON_STYLE
+    IMAGE_LABEL_STYLE, SUBMIT_BUTTON_STYLE, CACHE_DB_PATH, COLOR_CACHE_MAX_ENTRIES,
+    LISTING_CACHE_MAX_ENTRIES, LISTING_CACHE_TTL
 )
-from models.bert_classifier_model import BertForMultiTaskClassification
 from ui.pages import setup_main_page, setup_loading_page, setup_review_page
 from PyQt5.QtWidgets import (
     QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, QPushButton,
@@ -21,10 +24,17 @@ from PyQt5.QtWidgets import (
     QProgressBar, QStackedWidget, QScrollArea, QTextEdit, QMessageBox
 )
 
+class ModelLoaderSignals(QObject):
+    """Relays model loader callbacks from its worker threads to the GUI thread."""
+    model_loaded = pyqtSignal(str, str)  # (model name, error message or "")
+
 class MainWindow(QMainWindow):
-    def __init__(self):
+    def __init__(self, launch_time=None):
         super().__init__()
-        self.images = []  # Store tuples of (pixmap, file_path)
+        self.launch_time = launch_time if launch_time is not None else time.perf_counter()
+        self.first_listing_time = None
+        self.images = []  # Store tuples of (thumbnail pixmap, file_path), full resolution is only read for processing
+        self.thumbnail_cache = ThumbnailCache() # Display thumbnails, decoded once per image file
         # Keep track of current image for visualisation the image frame
         self.current_image_index = 0
         self.current_review_image_index = 0
@@ -32,27 +42,26 @@ class MainWindow(QMainWindow):
         # Store most frequently counted colors
         self.vinted_color = ""
         self.ebay_color = ""
-        self.model = SAM('sam2_b.pt')  # Initialize SAM2 model
         self.size = None # Garment size
         self.processor = Processor(self) # Managing pipeline order and progressbar
         self.validator = Validator(self) # Validate user input
-
-        # Load Fine-tuned BERT model
-        with open('bert_category_classifier_complete/model_config.json', 'r') as f:
-            config = json.load(f)
-        num_vinted_classes = config['num_vinted_classes']
-        num_ebay_classes = config['num_ebay_classes']
-        self.bert_model = BertForMultiTaskClassification(num_vinted_classes, num_ebay_classes)
-        self.device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
-        self.bert_model.to(self.device)
-        self.bert_model.load_state_dict(torch.load('bert_category_classifier_complete/best_bert_category_classifier.pth', map_location=torch.device(self.device)))
-        self.bert_model.eval()
-        self.tokenizer = BertTokenizer.from_pretrained('bert_category_classifier_complete/bert_category_classifier')
-        self.vinted_encoder = joblib.load('bert_category_classifier_complete/vinted_encoder.pkl')
-        self.ebay_encoder = joblib.load('bert_category_classifier_complete/ebay_encoder.pkl')
+        self.color_cache = DiskCache(CACHE_DB_PATH, 'color_results', COLOR_CACHE_MAX_ENTRIES) # Per-image colors, survives restarts
+        self.embedding_cache = EmbeddingCache() # SAM image embeddings of recent images, for cheap re-prompting
+        self.listing_cache = DiskCache(CACHE_DB_PATH, 'listings', LISTING_CACHE_MAX_ENTRIES, LISTING_CACHE_TTL) # Generated listing texts per platform
 
         self.initUI()
 
+        # Load SAM2, the fine-tuned BERT model, its tokenizer and the label encoders in the background
+        self.model_loader = ModelLoader()
+        self.model_loader_signals = ModelLoaderSignals()
+        self.model_loader_signals.model_loaded.connect(self.on_model_loaded)
+        self.model_loader.start(
+            lambda name, error: self.model_loader_signals.model_loaded.emit(name, str(error) if error else "")
+        )
+        self.speculator = Speculator(self) # Colors and categories worked out while the form is filled in
+        self.update_model_status()
+        QTimer.singleShot(0, self.on_first_frame)
+
     def initUI(self):
         self.setWindowTitle('AI Listing Tool')
         self.resize(800, 650)
@@ -64,6 +73,33 @@ class MainWindow(QMainWindow):
         self.center()
         self.show()
 
+    def on_first_frame(self):
+        metrics.record('startup_first_frame', time.perf_counter() - self.launch_time)
+
+    def on_listing_completed(self):
+        if self.first_listing_time is None:
+            self.first_listing_time = time.perf_counter() - self.launch_time
+            metrics.record('startup_first_listing', self.first_listing_time)
+
+    def on_model_loaded(self, name, error):
+        if error:
+            metrics.count('model_load_failures', model=name)
+            metrics.event('model_load_failed', model=name, error=str(error))
+        else:
+            metrics.record('model_load', self.model_loader.load_times[name], model=name)
+        self.update_model_status()
+
+    def update_model_status(self):
+        symbols = {'loading': "…", 'ready': "✓", 'failed': "✗"}
+        self.model_status_label.setText("Models: " + "  ".join(
+            f"{label} {symbols[self.model_loader.status(name)]}" for name, label in MODEL_LABELS.items()
+        ))
+
+    def closeEvent(self, event):
+        self.speculator.shutdown()
+        self.model_loader.shutdown()
+        super().closeEvent(event)
+
     def start_processing(self):
         if not self.validator.validate_inputs():
             return
@@ -73,8 +109,14 @@ class MainWindow(QMainWindow):
 
         self.processor.start()
 
-    def update_progress(self):
-        self.processor.update()
+    def cancel_processing(self):
+        self.processor.cancel()
+
+    def regenerate_listing(self):
+        self.processor.regenerate()
+
+    def on_form_edited(self):
+        self.speculator.text_edited()
 
     def upload_image(self, event):
         file_names, _ = QFileDialog.getOpenFileNames(
@@ -91,44 +133,32 @@ class MainWindow(QMainWindow):
                 file_names = file_names[:remaining_slots]
             
             if file_names:
+                images_count = len(self.images)
                 for file_name in file_names:
-                    pixmap = QPixmap(file_name)
-                    if not pixmap.isNull():
-                        self.images.append((pixmap, file_name))  # Store image and file path
+                    pixmap = self.thumbnail_cache.get(file_name)
+                    if pixmap is not None:
+                        self.images.append((pixmap, file_name))  # Store thumbnail and file path
                     else:
                         QMessageBox.warning(
                             self, "Invalid Image",
                             f"Failed to load image: {file_name}"
                         )
                 
+                self.speculator.images_added([file_path for _, file_path in self.images[images_count:]])
                 if self.images:
                     self.current_image_index = len(self.images) - 1
                     self.update_image_display()
                     self.update_navigation()
 
-    # Helper
-    def _parse_listing_text(self, listing_text):
-        try:
-            platform_listings = {}
-            sections = listing_text.split('=== ')[1:]
-            for section in sections:
-                platform, content = section.split(' ===\n', 1) # Exctract platform name and its title/description content
-                title_start = content.index('Title: ') + len('Title: ')
-                description_start = content.index('ion:') + len('ion:') # Tinyllama often outputs "Descripion:", instead of "Description:". We will permit only such slack.
-                title_end = content.index('Descrip')
-                description_end = content.index('=====')
-                title = content[title_start:title_end].strip() # Exctract title with found indices and remove trailing whitespaces
-                description = content[description_start:description_end].strip() # Same for description part of this platform's content
-                platform_listings[platform] = {'title': escape(title), 'description': description}
-        except:
-            return None
-
-        return platform_listings
-
-    def generate_listing(self):
-        """Generate a structured HTML listing for the review page."""
+    def generate_listing(self, streamed_listings=None):
+        """Generate a structured HTML listing for the review page. While streaming, render streamed_listings, the
+        listings parsed from what has arrived so far."""
+        streaming = streamed_listings is not None
         # Parse LLM-generated text
-        platform_listings = self._parse_listing_text(self.listing_text)
+        if streaming:
+            platform_listings = streamed_listings
+        else:
+            platform_listings = parse_listing_text(self.listing_text) or {}
         
         # Determine selected platforms
         platforms = []
@@ -161,6 +191,8 @@ class MainWindow(QMainWindow):
                 html += f'<b>Primary color:</b> {color}.<br>'
                 html += f'<b>Category:</b> {category}.<br>'
                 html += '</div>'
+            elif streaming:
+                html += f'<div style="color: gray;">Generating {platform} listing...</div><br>'
             else:
                 html += f'<div style="color: red;">No listing generated for {platform}</div><br>'
         
@@ -168,14 +200,17 @@ class MainWindow(QMainWindow):
         
         # Set the HTML content
         self.listing_content.setHtml(html)
-        self.current_review_image_index = 0
-        self.update_review_image_display()
+        if not streaming:
+            self.current_review_image_index = 0
+            self.update_review_image_display()
 
     def return_to_main(self):
         self.stacked_widget.setCurrentWidget(self.main_page)
 
     def finalize_listing(self):
         print("Listing finalized!")
+        metrics.count('listings_finalized')
+        metrics.write_prometheus()
         self.return_to_main()
 
     def confirm_remove_image(self):
@@ -196,17 +231,13 @@ class MainWindow(QMainWindow):
                     self.current_image_index = len(self.images) - 1
             else:
                 self.current_image_index = 0
+            self.speculator.images_removed([file_path for _, file_path in self.images])
             self.update_image_display()
             self.update_navigation()
 
     def update_image_display(self):
         if self.images:
-            scaled_pixmap = self.images[self.current_image_index][0].scaled(
-                self.image_label.size(),
-                Qt.KeepAspectRatio,
-                Qt.SmoothTransformation
-            )
-            self.image_label.setPixmap(scaled_pixmap)
+            self.image_label.setPixmap(self.images[self.current_image_index][0])
             self.image_label.setText("")
         else:
             self.image_label.setPixmap(QPixmap())
@@ -214,12 +245,7 @@ class MainWindow(QMainWindow):
 
     def update_review_image_display(self):
         if self.images:
-            scaled_pixmap = self.images[self.current_review_image_index][0].scaled(
-                self.review_image_label.size(),
-                Qt.KeepAspectRatio,
-                Qt.SmoothTransformation
-            )
-            self.review_image_label.setPixmap(scaled_pixmap)
+            self.review_image_label.setPixmap(self.images[self.current_review_image_index][0])
         else:
             self.review_image_label.setPixmap(QPixmap())
         self.update_review_navigation()
@@ -1,6 +1,6 @@
 from PyQt5.QtCore import Qt
 from PyQt5.QtGui import QFont
-from utils.config import DEFAULT_STYLE, IMAGE_LABEL_STYLE, SUBMIT_BUTTON_STYLE
+from utils.config import DEFAULT_STYLE, IMAGE_LABEL_STYLE, SUBMIT_BUTTON_STYLE, THUMBNAIL_SIZE
 from PyQt5.QtWidgets import (
     QWidget, QVBoxLayout, QHBoxLayout, QPushButton, QLabel, QComboBox, QLineEdit,
     QRadioButton, QCheckBox, QProgressBar, QStackedWidget, QScrollArea, QTextEdit, 
@@ -24,7 +24,7 @@ def setup_main_page(main_window):
     image_layout.addWidget(main_window.prev_button)
 
     main_window.image_label = QLabel("Click to upload an image")
-    main_window.image_label.setFixedSize(200, 200)
+    main_window.image_label.setFixedSize(THUMBNAIL_SIZE, THUMBNAIL_SIZE)
     main_window.image_label.setStyleSheet(IMAGE_LABEL_STYLE)
     main_window.image_label.setAlignment(Qt.AlignCenter)
     main_window.image_label.setCursor(Qt.PointingHandCursor)
@@ -66,6 +66,7 @@ def setup_main_page(main_window):
     main_window.gender_combo = QComboBox()
     main_window.gender_combo.addItems(["Men", "Women"])
     main_window.gender_combo.setStyleSheet(DEFAULT_STYLE)
+    main_window.gender_combo.currentTextChanged.connect(main_window.on_form_edited)
     main_layout.addWidget(main_window.gender_combo)
 
     # Price input
@@ -86,6 +87,7 @@ def setup_main_page(main_window):
     main_window.description_input = QLineEdit()
     main_window.description_input.setPlaceholderText("Enter short description")
     main_window.description_input.setStyleSheet(DEFAULT_STYLE)
+    main_window.description_input.textChanged.connect(main_window.on_form_edited)
     main_layout.addWidget(main_window.description_input)
 
     radio_label = QLabel("Quality Rating:")
@@ -126,6 +128,11 @@ def setup_main_page(main_window):
 
     main_layout.addStretch()
 
+    main_window.model_status_label = QLabel()
+    main_window.model_status_label.setFont(QFont("Arial", 9))
+    main_window.model_status_label.setStyleSheet("color: gray;")
+    main_layout.addWidget(main_window.model_status_label)
+
     button_container = QWidget()
     button_layout = QHBoxLayout(button_container)
     button_layout.addStretch()
@@ -149,6 +156,10 @@ def setup_loading_page(main_window):
     main_window.progress_bar.setMaximum(100)
     main_window.progress_bar.setValue(0)
     loading_layout.addWidget(main_window.progress_bar)
+    main_window.cancel_button = QPushButton("Cancel")
+    main_window.cancel_button.setFixedWidth(100)
+    main_window.cancel_button.clicked.connect(main_window.cancel_processing)
+    loading_layout.addWidget(main_window.cancel_button, alignment=Qt.AlignCenter)
     loading_layout.addStretch()
     main_window.stacked_widget.addWidget(main_window.loading_page)
 
@@ -167,7 +178,7 @@ def setup_review_page(main_window):
     review_image_layout.addWidget(main_window.review_prev_button)
 
     main_window.review_image_label = QLabel()
-    main_window.review_image_label.setFixedSize(200, 200)
+    main_window.review_image_label.setFixedSize(THUMBNAIL_SIZE, THUMBNAIL_SIZE)
     main_window.review_image_label.setStyleSheet("border: 2px solid gray;")
     main_window.review_image_label.setAlignment(Qt.AlignCenter)
     review_image_layout.addWidget(main_window.review_image_label)
@@ -204,8 +215,12 @@ def setup_review_page(main_window):
     review_button_layout.addStretch()
     main_window.redo_button = QPushButton("Redo")
     main_window.redo_button.setFixedWidth(100)
-    main_window.redo_button.clicked.connect(main_window.return_to_main)
+    main_window.redo_button.clicked.connect(main_window.cancel_processing) # Also stops a listing still streaming in
     review_button_layout.addWidget(main_window.redo_button)
+    main_window.regenerate_button = QPushButton("Regenerate")
+    main_window.regenerate_button.setFixedWidth(100)
+    main_window.regenerate_button.clicked.connect(main_window.regenerate_listing) # New text, ignoring the listing cache
+    review_button_layout.addWidget(main_window.regenerate_button)
     main_window.list_button = QPushButton("List")
     main_window.list_button.setFixedWidth(100)
     main_window.list_button.clicked.connect(main_window.finalize_listing)
@@ -0,0 +1,52 @@
+import cv2
+from collections import OrderedDict
+from typing import Optional
+from PyQt5.QtGui import QImage, QPixmap
+from utils.config import THUMBNAIL_SIZE, THUMBNAIL_CACHE_MAX_ENTRIES
+from utils.image_loader import image_buffers, file_identity
+
+class ThumbnailCache:
+    """Bounded LRU of display thumbnails, decoded once per image file at THUMBNAIL_SIZE.
+
+    Thumbnails are downscaled from the shared image buffer (see utils.image_loader), decoded at the reduced
+    resolution the analysis needs, so the pipeline reuses that decode and a phone photo never exists in memory at
+    full resolution. Entries are keyed on the file's path, size and modification time, so a replaced file is decoded again.
+    """
+    def __init__(self, size: int = THUMBNAIL_SIZE, max_entries: int = THUMBNAIL_CACHE_MAX_ENTRIES):
+        self.size = size
+        self.max_entries = max_entries
+        self.error = ""  # Reason the last get() returned None
+        self._entries = OrderedDict()  # key -> QPixmap, most recently used last
+
+    def get(self, file_path: str) -> Optional[QPixmap]:
+        """The thumbnail of file_path, decoding it on a miss. None if the file can't be read as an image."""
+        try:
+            key = file_identity(file_path)
+        except OSError as e:
+            self.error = str(e)
+            return None
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            return self._entries[key]
+        pixmap = self._decode(file_path)
+        if pixmap is None:
+            return None
+        self._entries[key] = pixmap
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return pixmap
+
+    def _decode(self, file_path: str) -> Optional[QPixmap]:
+        try:
+            image_rgb = image_buffers.load(file_path)
+        except (OSError, ValueError, cv2.error) as e:
+            self.error = str(e)
+            return None
+        h, w = image_rgb.shape[:2]
+        scale = self.size / max(h, w)
+        thumbnail = cv2.resize(
+            image_rgb, (max(round(w * scale), 1), max(round(h * scale), 1)),
+            interpolation=cv2.INTER_AREA if scale < 1 else cv2.INTER_LINEAR
+        )
+        h, w = thumbnail.shape[:2]
+        return QPixmap.fromImage(QImage(thumbnail.data, w, h, 3 * w, QImage.Format_RGB888))
@@ -0,0 +1,77 @@
+import os
+from typing import Callable
+from utils.config import BERT_ONNX_PATH, BERT_ONNX_THREADS
+
+# 'torch': fp32 eager PyTorch (GPU if available). The others run on CPU: 'int8' is the torch model with dynamically
+# quantized Linear layers, 'onnx' and 'onnx-int8' an ONNX Runtime session of the fp32 or int8 exported model
+BERT_BACKENDS = ('torch', 'int8', 'onnx', 'onnx-int8')
+
+def quantize_int8(model):
+    """Dynamic int8 quantization of every Linear layer: int8 weights, activations quantized on the fly."""
+    import torch
+    return torch.ao.quantization.quantize_dynamic(model.to('cpu'), {torch.nn.Linear}, dtype=torch.qint8)
+
+def onnx_path(quantized: bool = False) -> str:
+    return BERT_ONNX_PATH.replace('.onnx', '.int8.onnx') if quantized else BERT_ONNX_PATH
+
+def export_onnx(model, quantized: bool = False) -> str:
+    """Exports the two-head classifier to ONNX, batch size and sequence length dynamic, optionally followed by
+    ONNX Runtime's dynamic int8 quantization. Returns the path of the model to load."""
+    import torch
+
+    class LogitsOnly(torch.nn.Module):
+        def __init__(self, model):
+            super().__init__()
+            self.model = model
+
+        def forward(self, input_ids, attention_mask):
+            outputs = self.model(input_ids=input_ids, attention_mask=attention_mask)
+            return outputs['vinted_logits'], outputs['ebay_logits']
+
+    dummy = torch.ones(2, 8, dtype=torch.long)
+    torch.onnx.export(
+        LogitsOnly(model.to('cpu').eval()), (dummy, dummy), onnx_path(),
+        input_names=['input_ids', 'attention_mask'], output_names=['vinted_logits', 'ebay_logits'],
+        dynamic_axes={
+            'input_ids': {0: 'batch', 1: 'sequence'}, 'attention_mask': {0: 'batch', 1: 'sequence'},
+            'vinted_logits': {0: 'batch'}, 'ebay_logits': {0: 'batch'},
+        },
+        opset_version=17
+    )
+    if not quantized:
+        return onnx_path()
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+    quantize_dynamic(onnx_path(), onnx_path(quantized=True), weight_type=QuantType.QInt8)
+    return onnx_path(quantized=True)
+
+class OnnxBertModel:
+    """ONNX Runtime session with the call signature and outputs of BertForMultiTaskClassification."""
+    def __init__(self, path: str, threads: int = BERT_ONNX_THREADS):
+        import onnxruntime as ort
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(path, options, providers=['CPUExecutionProvider'])
+
+    def __call__(self, input_ids, attention_mask):
+        import torch
+        vinted_logits, ebay_logits = self.session.run(
+            None, {'input_ids': input_ids.cpu().numpy(), 'attention_mask': attention_mask.cpu().numpy()}
+        )
+        return {'vinted_logits': torch.from_numpy(vinted_logits), 'ebay_logits': torch.from_numpy(ebay_logits)}
+
+def load_backend(backend: str, load_torch_model: Callable):
+    """The classifier for backend. load_torch_model() gives the fp32 model, only called when the backend needs
+    it (an ONNX backend exports it once, then loads the saved file without touching PyTorch weights)."""
+    if backend not in BERT_BACKENDS:
+        raise ValueError(f"Unknown BERT backend '{backend}', expected one of {BERT_BACKENDS}")
+    if backend == 'torch':
+        return load_torch_model()
+    if backend == 'int8':
+        return quantize_int8(load_torch_model())
+    quantized = backend == 'onnx-int8'
+    path = onnx_path(quantized)
+    if not os.path.exists(path):
+        path = export_onnx(load_torch_model(), quantized)
+    return OnnxBertModel(path)
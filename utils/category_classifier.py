@@ -0,0 +1,60 @@
+import numpy as np
+from typing import Dict, List, Sequence, Tuple
+from utils.config import BERT_BATCH_SIZE, BERT_MAX_LENGTH, CATEGORY_TOP_K
+from utils.metrics import metrics
+
+# Per platform head ('vinted', 'ebay'): the top-k (category, probability) pairs, most likely first
+CategoryPrediction = Dict[str, List[Tuple[str, float]]]
+
+def category_text(gender: str, description: str) -> str:
+    """The text the classifier is given for an item, e.g. "Women's red summer dress"."""
+    return f'{gender}\'s {description}'
+
+class CategoryClassifier:
+    """Batched Vinted and eBay category prediction with the fine-tuned two-head BERT model.
+
+    Texts are tokenized in one call by the fast tokenizer, sorted by length and cut into batches that are only
+    padded to their own longest text, so short descriptions don't pay for long ones. encoders maps each head to
+    predict ('vinted', 'ebay') to its fitted LabelEncoder; heads without one are skipped.
+    """
+    def __init__(self, model, tokenizer, encoders: Dict, device=None, batch_size: int = BERT_BATCH_SIZE,
+                 max_length: int = BERT_MAX_LENGTH):
+        self.model = model
+        self.tokenizer = tokenizer
+        self.encoders = encoders
+        self.device = device
+        self.batch_size = batch_size
+        self.max_length = max_length
+
+    def predict_texts(self, texts: Sequence[str], top_k: int = CATEGORY_TOP_K) -> List[CategoryPrediction]:
+        import torch
+        if not len(texts):
+            return []
+        with metrics.span('tokenize'):
+            encodings = self.tokenizer(list(texts), truncation=True, max_length=self.max_length)
+        order = np.argsort([len(input_ids) for input_ids in encodings['input_ids']], kind='stable')
+        predictions = [{} for _ in texts]
+
+        with torch.inference_mode():
+            for start in range(0, len(order), self.batch_size):
+                batch_indices = order[start:start + self.batch_size]
+                batch = self.tokenizer.pad(
+                    {name: [encodings[name][i] for i in batch_indices] for name in ('input_ids', 'attention_mask')},
+                    return_tensors='pt'
+                ).to(self.device)
+                with metrics.span('bert_forward'):
+                    outputs = self.model(input_ids=batch['input_ids'], attention_mask=batch['attention_mask'])
+                for head, encoder in self.encoders.items():
+                    probabilities = torch.softmax(outputs[f'{head}_logits'], dim=1)
+                    top = torch.topk(probabilities, min(top_k, probabilities.shape[1]), dim=1)
+                    top_probabilities, top_classes = top.values.cpu().numpy(), top.indices.cpu().numpy()
+                    for row, i in enumerate(batch_indices):
+                        predictions[i][head] = [
+                            (str(encoder.classes_[label]), float(probability))
+                            for label, probability in zip(top_classes[row], top_probabilities[row])
+                        ]
+        return predictions
+
+    def predict(self, items: Sequence[Tuple[str, str]], top_k: int = CATEGORY_TOP_K) -> List[CategoryPrediction]:
+        """Top-k categories of each (gender, description) pair, in input order."""
+        return self.predict_texts([category_text(gender, description) for gender, description in items], top_k)
@@ -1,3 +1,4 @@
+import cv2
 import numpy as np
 from typing import Dict, Tuple
 
@@ -49,13 +50,82 @@ color_map_vinted = {
     (152, 255, 152): "Mintgroen"
 }
 
-def find_closest_color(rgb: np.ndarray, color_map: Dict[Tuple[int, int, int], str]) -> str:
-    rgb = np.array(rgb)
-    min_distance = float('inf')
-    closest_color = "Unknown"
-    for color_rgb, color_name in color_map.items():
-        distance = np.sqrt(np.sum((rgb - np.array(color_rgb)) ** 2))
-        if distance < min_distance:
-            min_distance = distance
-            closest_color = color_name
-    return closest_color
\ No newline at end of file
+class ColorPalette:
+    """A color map compiled once into arrays, answering nearest-color queries for many colors in one call.
+
+    Distances are Euclidean in RGB or, with space='lab', in OpenCV's 8-bit CIELAB. Ties resolve to the
+    color listed first, like the original loop did.
+    """
+    LUT_BITS = 5  # Bits per channel of the optional lookup table (32^3 cells)
+
+    def __init__(self, color_map: Dict[Tuple[int, int, int], str], space: str = 'rgb'):
+        if space not in ('rgb', 'lab'):
+            raise ValueError(f"Unknown color space '{space}', expected 'rgb' or 'lab'")
+        self.space = space
+        self.names = np.array(list(color_map.values()))
+        self.rgb = np.array(list(color_map.keys()), dtype=np.float64)
+        self.points = rgb_to_lab(self.rgb) if space == 'lab' else self.rgb
+        self._squared_norms = (self.points ** 2).sum(axis=1)
+        self._lut = None
+
+    def _to_space(self, rgbs: np.ndarray) -> np.ndarray:
+        rgbs = np.asarray(rgbs, dtype=np.float64).reshape(-1, 3)
+        return rgb_to_lab(rgbs) if self.space == 'lab' else rgbs
+
+    def nearest_indices(self, rgbs: np.ndarray) -> np.ndarray:
+        """Palette index of the nearest color for each of the (N, 3) query colors."""
+        points = self._to_space(rgbs)
+        # |p - c|^2 without the |p|^2 term, which is constant per query
+        distances = self._squared_norms[None, :] - 2 * points @ self.points.T
+        return np.argmin(distances, axis=1)
+
+    def closest_batch(self, rgbs: np.ndarray, use_lut: bool = False) -> np.ndarray:
+        """Names of the nearest palette colors for (N, 3) query colors.
+
+        use_lut answers from a precomputed table over 5-bit channels instead, which is O(1) per query but
+        approximate for colors right on the border between two palette entries.
+        """
+        if use_lut:
+            return self.names[self.lut_indices(rgbs)]
+        return self.names[self.nearest_indices(rgbs)]
+
+    def closest(self, rgb: np.ndarray) -> str:
+        return str(self.closest_batch(rgb)[0])
+
+    def build_lut(self) -> np.ndarray:
+        """Computes (once) the nearest palette index for the centre of every 5-bit-per-channel RGB cell."""
+        if self._lut is None:
+            step = 1 << (8 - self.LUT_BITS)
+            centres = np.arange(1 << self.LUT_BITS) * step + step // 2
+            grid = np.stack(np.meshgrid(centres, centres, centres, indexing='ij'), axis=-1).reshape(-1, 3)
+            self._lut = self.nearest_indices(grid).astype(np.uint8)
+        return self._lut
+
+    def lut_indices(self, rgbs: np.ndarray) -> np.ndarray:
+        quantized = np.clip(np.asarray(rgbs), 0, 255).astype(np.int64).reshape(-1, 3) >> (8 - self.LUT_BITS)
+        cells = (quantized[:, 0] << (2 * self.LUT_BITS)) | (quantized[:, 1] << self.LUT_BITS) | quantized[:, 2]
+        return self.build_lut()[cells]
+
+def rgb_to_lab(rgbs: np.ndarray) -> np.ndarray:
+    """Converts (N, 3) RGB colors to OpenCV's 8-bit CIELAB in a single cvtColor call."""
+    pixels = np.clip(np.rint(np.asarray(rgbs, dtype=np.float64)), 0, 255).astype(np.uint8).reshape(-1, 1, 3)
+    return cv2.cvtColor(pixels, cv2.COLOR_RGB2LAB).reshape(-1, 3).astype(np.float64)
+
+palette_ebay = ColorPalette(color_map_ebay)
+palette_vinted = ColorPalette(color_map_vinted)
+
+# (id(color_map), space) -> (color_map, palette); the map is kept so its id is never reused
+_palettes = {
+    (id(color_map_ebay), 'rgb'): (color_map_ebay, palette_ebay),
+    (id(color_map_vinted), 'rgb'): (color_map_vinted, palette_vinted),
+}
+
+def get_palette(color_map: Dict[Tuple[int, int, int], str], space: str = 'rgb') -> ColorPalette:
+    """Returns the compiled palette of a color map, compiling it on first use."""
+    key = (id(color_map), space)
+    if key not in _palettes or len(_palettes[key][1].names) != len(color_map):
+        _palettes[key] = (color_map, ColorPalette(color_map, space))
+    return _palettes[key][1]
+
+def find_closest_color(rgb: np.ndarray, color_map: Dict[Tuple[int, int, int], str], space: str = 'rgb') -> str:
+    return get_palette(color_map, space).closest(rgb)
@@ -1,11 +1,53 @@
+import os
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))  # Repository root, where main.py lives
 MAX_IMAGES = 15
+THUMBNAIL_SIZE = 200  # Pixels, the side of the image frames on the main and review pages
+THUMBNAIL_CACHE_MAX_ENTRIES = 64  # Decoded thumbnails kept, a few listings' worth
 PROGRESS_INCREMENT = 5
 DEFAULT_STYLE = ""
 RED_BORDER_STYLE = "border: 2px solid red;"
 RANDOM_SEED = 115
 KMEANS_N_CLUSTERS = 10
 KMEANS_MAX_ITER = 50
+# Dominant colour engine: 'kmeans' (every masked pixel, slowest), 'subsample' (KMeans on a stratified sample),
+# 'histogram' (quantized colour histogram mode) or 'minibatch' (vectorized mini-batch k-means)
+DOMINANT_COLOR_MODE = "subsample"
+DOMINANT_COLOR_SAMPLE_BUDGET = 20000  # Pixels clustered per image by 'subsample'
+HISTOGRAM_BINS = 16  # Bins per channel for 'histogram'
+MINIBATCH_SIZE = 2048  # Pixels per update step for 'minibatch'
+SAM_IMGSZ = 640
+SAM_BATCH_SIZE = 4  # Images per batched SAM image-encoder pass
+SAM_RETRY_CENTER_POINT = False  # Re-decode with a single centre point before falling back to the whole image (changes colors, off by default)
+EMBEDDING_CACHE_MAX_ENTRIES = 15  # SAM image embeddings kept in memory, one listing's worth
+EMBEDDING_SPILL_DIR = None  # Directory for memory-mapped embeddings evicted from memory, None to disable
+EMBEDDING_SPILL_MAX_ENTRIES = 200
+PIPELINE_WORKERS = min(4, os.cpu_count() or 1)  # Processes decoding and clustering images alongside segmentation, 1 runs them serially
+PIPELINE_PREFETCH = 2  # Decoded batches queued ahead of segmentation
+IMAGE_BUFFER_CACHE_MB = 256  # Decoded images (at about SAM_IMGSZ) kept in memory for the thumbnails and the pipeline
 LLM_MODEL = "tinyllama"
+LLM_CONCURRENCY = 4  # Items whose listings are generated at once in batch runs
+BERT_BATCH_SIZE = 32  # Descriptions per BERT forward pass
+BERT_MAX_LENGTH = 32  # Tokens per description, the length the classifier was fine-tuned on
+CATEGORY_TOP_K = 3  # Category candidates kept per platform
+CLI_BATCH_SIZE = 64  # Manifest items per engine batch in cli.py
+OLLAMA_HOST = None  # e.g. "http://127.0.0.1:11435" for utils.fake_ollama, None uses $OLLAMA_HOST or the local default
+LLM_KEEP_ALIVE = "30m"  # Keeps the LLM and its evaluated prompt prefix loaded in Ollama between listings
+SAM_WEIGHTS = "sam2_b.pt"
+BERT_MODEL_DIR = "bert_category_classifier_complete"
+# Category classifier runtime: 'torch' (fp32), 'int8' (dynamically quantized PyTorch), 'onnx' or 'onnx-int8' (ONNX Runtime)
+BERT_BACKEND = "torch"
+BERT_ONNX_PATH = os.path.join(BERT_MODEL_DIR, "bert_category_classifier.onnx")  # Exported on first use
+BERT_ONNX_THREADS = 0  # ONNX Runtime intra-op threads, 0 lets it choose
+BERT_PARITY_MIN_AGREEMENT = 0.98  # Minimum top-1 agreement with fp32 for a backend to pass the parity check
+MODEL_LOADER_WORKERS = 3
+CACHE_DB_PATH = os.path.join(APP_DIR, "listing_cache.sqlite3")  # SQLite file next to the app holding the persistent caches
+COLOR_CACHE_MAX_ENTRIES = 20000  # Per-image color results, least recently used evicted first
+LISTING_CACHE_MAX_ENTRIES = 5000  # Generated listings per platform, least recently used evicted first
+LISTING_CACHE_TTL = 30 * 24 * 3600  # Seconds before a cached listing is generated afresh
+METRICS_JSONL_PATH = os.path.join(APP_DIR, "metrics.jsonl")  # Every span, counter and event as a JSON line, None disables
+METRICS_PROMETHEUS_PATH = os.path.join(APP_DIR, "metrics.prom")  # Span histograms and counters in Prometheus text format, None disables
+SPECULATION_DEBOUNCE_MS = 600  # Typing pause after which categories are predicted ahead of Generate
+SPECULATED_CATEGORIES_MAX_ENTRIES = 8  # Recent (gender, description) predictions kept for Generate to pick up
 IMAGE_LABEL_STYLE = """
     QLabel {
         border: 2px dashed gray;
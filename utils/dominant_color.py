@@ -0,0 +1,118 @@
+import time
+import numpy as np
+from typing import Dict, List, Optional
+from sklearn.cluster import KMeans
+from utils.config import (
+    RANDOM_SEED, KMEANS_N_CLUSTERS, KMEANS_MAX_ITER,
+    DOMINANT_COLOR_MODE, DOMINANT_COLOR_SAMPLE_BUDGET, HISTOGRAM_BINS, MINIBATCH_SIZE
+)
+from utils.color_utils import palette_ebay, palette_vinted
+
+DOMINANT_COLOR_MODES = ('kmeans', 'subsample', 'histogram', 'minibatch')
+
+def kmeans_rgb(pixels: np.ndarray, n_clusters: int = KMEANS_N_CLUSTERS, max_iter: int = KMEANS_MAX_ITER) -> np.ndarray:
+    """Largest KMeans cluster centre over every pixel. The reference mode, and the slowest."""
+    kmeans = KMeans(n_clusters=n_clusters, random_state=RANDOM_SEED, n_init='auto', max_iter=max_iter)
+    kmeans.fit(pixels)
+    cluster_sizes = np.bincount(kmeans.labels_)
+    return kmeans.cluster_centers_[np.argmax(cluster_sizes)]
+
+def stratified_sample(pixels: np.ndarray, sample_budget: int) -> np.ndarray:
+    """Draws one random pixel from each of sample_budget equal, consecutive strata.
+
+    Masked pixels come in row-major order, so the strata spread the sample evenly over the garment.
+    """
+    if len(pixels) <= sample_budget:
+        return pixels
+    rng = np.random.default_rng(RANDOM_SEED)
+    bounds = np.linspace(0, len(pixels), sample_budget + 1).astype(np.int64)
+    offsets = (rng.random(sample_budget) * (bounds[1:] - bounds[:-1])).astype(np.int64)
+    return pixels[bounds[:-1] + offsets]
+
+def subsample_rgb(pixels: np.ndarray, sample_budget: int = DOMINANT_COLOR_SAMPLE_BUDGET,
+                  n_clusters: int = KMEANS_N_CLUSTERS, max_iter: int = KMEANS_MAX_ITER) -> np.ndarray:
+    """KMeans on a stratified sample of at most sample_budget pixels."""
+    return kmeans_rgb(stratified_sample(pixels, sample_budget), n_clusters, max_iter)
+
+def histogram_rgb(pixels: np.ndarray, bins: int = HISTOGRAM_BINS) -> np.ndarray:
+    """Mean colour of the most populated cell of a bins^3 quantized RGB histogram."""
+    pixels = np.asarray(pixels)
+    quantized = (pixels.astype(np.int64) * bins) // 256
+    cells = (quantized[:, 0] * bins + quantized[:, 1]) * bins + quantized[:, 2]
+    mode_cell = np.argmax(np.bincount(cells, minlength=bins ** 3))
+    return pixels[cells == mode_cell].mean(axis=0)
+
+def _nearest_center(pixels: np.ndarray, centers: np.ndarray) -> np.ndarray:
+    distances = (pixels * pixels).sum(axis=1)[:, None] - 2 * pixels @ centers.T + (centers * centers).sum(axis=1)[None]
+    return np.argmin(distances, axis=1)
+
+def minibatch_rgb(pixels: np.ndarray, batch_size: int = MINIBATCH_SIZE,
+                  n_clusters: int = KMEANS_N_CLUSTERS, max_iter: int = KMEANS_MAX_ITER) -> np.ndarray:
+    """Vectorized mini-batch k-means (Sculley, 2010): max_iter updates on random batches, one full assignment."""
+    rng = np.random.default_rng(RANDOM_SEED)
+    pixels = np.asarray(pixels, dtype=np.float32)
+    centers = pixels[rng.choice(len(pixels), n_clusters, replace=len(pixels) < n_clusters)]
+    counts = np.zeros(n_clusters)
+    for _ in range(max_iter):
+        batch = pixels[rng.integers(0, len(pixels), batch_size)]
+        labels = _nearest_center(batch, centers)
+        for cluster in np.unique(labels):
+            members = batch[labels == cluster]
+            counts[cluster] += len(members)
+            # Per-centre learning rate of 1 / (pixels assigned so far)
+            centers[cluster] += (members.sum(axis=0) - len(members) * centers[cluster]) / counts[cluster]
+    cluster_sizes = np.bincount(_nearest_center(pixels, centers), minlength=n_clusters)
+    return centers[np.argmax(cluster_sizes)]
+
+_ENGINES = {
+    'kmeans': kmeans_rgb,
+    'subsample': subsample_rgb,
+    'histogram': histogram_rgb,
+    'minibatch': minibatch_rgb,
+}
+
+def dominant_rgb(pixels: np.ndarray, mode: str = DOMINANT_COLOR_MODE, **params) -> np.ndarray:
+    """Returns the dominant colour of an (N, 3) RGB pixel array as integers, using the configured engine.
+
+    params override the engine's settings, e.g. n_clusters and max_iter of the KMeans-based modes.
+    """
+    if mode not in _ENGINES:
+        raise ValueError(f"Unknown dominant color mode '{mode}', expected one of {DOMINANT_COLOR_MODES}")
+    return _ENGINES[mode](pixels, **params).astype(int)
+
+def parity_report(pixel_sets: List[np.ndarray], modes: Optional[List[str]] = None) -> Dict[str, Dict[str, float]]:
+    """Compares each mode with full KMeans ('kmeans') on the same pixel sets.
+
+    Per mode: the share of pixel sets mapped to the same eBay and Vinted colour names, the mean RGB distance
+    between the dominant colours, and the mean latency per pixel set.
+    """
+    modes = modes or list(DOMINANT_COLOR_MODES)
+    dominant, latency = {}, {}
+    for mode in dict.fromkeys(['kmeans'] + modes):
+        start = time.perf_counter()
+        dominant[mode] = [dominant_rgb(pixels, mode) for pixels in pixel_sets]
+        latency[mode] = (time.perf_counter() - start) / max(len(pixel_sets), 1)
+
+    reference = np.array(dominant['kmeans'])
+    reference_ebay = palette_ebay.closest_batch(reference)
+    reference_vinted = palette_vinted.closest_batch(reference)
+    report = {}
+    for mode in modes:
+        rgbs = np.array(dominant[mode])
+        report[mode] = {
+            'ebay_agreement': float(np.mean(palette_ebay.closest_batch(rgbs) == reference_ebay)),
+            'vinted_agreement': float(np.mean(palette_vinted.closest_batch(rgbs) == reference_vinted)),
+            'mean_rgb_distance': float(np.mean(np.linalg.norm(rgbs - reference, axis=1))),
+            'latency_ms': latency[mode] * 1000,
+            'speedup': latency['kmeans'] / latency[mode] if latency[mode] else float('inf'),
+        }
+    return report
+
+def format_parity_report(report: Dict[str, Dict[str, float]]) -> str:
+    lines = [f"{'mode':<10} {'eBay agree':>10} {'Vinted agree':>12} {'RGB dist':>9} {'ms/image':>9} {'speedup':>8}"]
+    for mode, row in report.items():
+        lines.append(
+            f"{mode:<10} {row['ebay_agreement']:>10.1%} {row['vinted_agreement']:>12.1%} "
+            f"{row['mean_rgb_distance']:>9.1f} {row['latency_ms']:>9.1f} {row['speedup']:>7.1f}x"
+        )
+    return '\n'.join(lines)
@@ -0,0 +1,89 @@
+import os
+import atexit
+import shutil
+import tempfile
+import numpy as np
+from collections import OrderedDict
+from typing import Dict, List, Optional
+from utils.config import EMBEDDING_CACHE_MAX_ENTRIES, EMBEDDING_SPILL_DIR, EMBEDDING_SPILL_MAX_ENTRIES
+
+class EmbeddingCache:
+    """Bounded in-memory LRU of SAM2 image features ({'image_embed': tensor, 'high_res_feats': [tensors]}).
+
+    Re-prompting a cached image only costs a mask-decoder pass instead of another image-encoder pass. With a
+    spill_dir, entries evicted from memory are written as .npy files to a directory of this process inside it and served
+    memory-mapped afterwards. That directory is removed when the process exits.
+    """
+    def __init__(self, max_entries: int = EMBEDDING_CACHE_MAX_ENTRIES, spill_dir: Optional[str] = EMBEDDING_SPILL_DIR,
+                 max_spilled: int = EMBEDDING_SPILL_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.spill_dir = spill_dir
+        self.max_spilled = max_spilled
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key -> features, most recently used last
+        self._spilled = OrderedDict()  # key -> number of high_res_feats levels, oldest first
+        if spill_dir:
+            os.makedirs(spill_dir, exist_ok=True)
+            # Per process, so concurrent instances never share files and each one only deletes its own
+            self._spill_path = tempfile.mkdtemp(prefix=f'{os.getpid()}_', dir=spill_dir)
+            atexit.register(shutil.rmtree, self._spill_path, ignore_errors=True)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._entries or key in self._spilled
+
+    def get(self, key: str, device=None) -> Optional[Dict]:
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return self._entries[key]
+        if key in self._spilled:
+            # Served straight from the memory maps; the files are content-addressed so never rewritten
+            self._spilled.move_to_end(key)
+            self.hits += 1
+            return self._load(key, self._spilled[key], device)
+        self.misses += 1
+        return None
+
+    def put(self, key: str, features: Dict):
+        self._entries[key] = features
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            evicted_key, evicted = self._entries.popitem(last=False)
+            if self.spill_dir and evicted_key not in self._spilled:
+                self._spill(evicted_key, evicted)
+
+    def clear(self):
+        self._entries.clear()
+        for key in list(self._spilled):
+            self._remove_spilled(key)
+
+    def _path(self, key: str, name: str) -> str:
+        return os.path.join(self._spill_path, f'{key}_{name}.npy')
+
+    def _names(self, levels: int) -> List[str]:
+        return ['image_embed'] + [f'high_res_{i}' for i in range(levels)]
+
+    def _spill(self, key: str, features: Dict):
+        tensors = [features['image_embed']] + list(features['high_res_feats'])
+        for name, tensor in zip(self._names(len(features['high_res_feats'])), tensors):
+            np.save(self._path(key, name), tensor.detach().cpu().numpy())
+        self._spilled[key] = len(features['high_res_feats'])
+        while len(self._spilled) > self.max_spilled:
+            self._remove_spilled(next(iter(self._spilled)))
+
+    def _load(self, key: str, levels: int, device=None) -> Dict:
+        import torch
+        # Copy-on-write maps keep the arrays writable for torch without reading them eagerly
+        tensors = [
+            torch.from_numpy(np.load(self._path(key, name), mmap_mode='c')).to(device)
+            for name in self._names(levels)
+        ]
+        return {'image_embed': tensors[0], 'high_res_feats': tensors[1:]}
+
+    def _remove_spilled(self, key: str):
+        for name in self._names(self._spilled.pop(key)):
+            try:
+                os.remove(self._path(key, name))
+            except FileNotFoundError:
+                pass
@@ -0,0 +1,183 @@
+"""Local stand-in for the Ollama HTTP API that replays canned listings token by token.
+
+Usage: python -m utils.fake_ollama [--port 11435] [--token-delay 0.03] [--first-token-delay 0.5] [RESPONSE_FILE ...]
+
+Point OLLAMA_HOST (config or environment) at it, e.g. http://127.0.0.1:11435, to exercise streaming without a model.
+Responses are served round-robin, the built-in one follows the listing format the prompt asks for. Like Ollama,
+the leading messages a request shares with a recent one count as cached and are not prefilled again.
+"""
+import re
+import json
+import time
+import argparse
+import threading
+from typing import List, Optional, Tuple
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_RESPONSE = """=== Vinted ===
+Title: Blauw Katoenen T-shirt
+Description: Mooi blauw T-shirt, maat M, amper gedragen, goede staat. =====
+
+=== eBay ===
+Title: Women's Blue Cotton T-Shirt Short Sleeve Size M Good Condition
+Description: Women's blue cotton T-shirt, size M, in good condition. Soft, breathable fabric with short sleeves, perfect for casual wear. Machine washable, no stains or tears. =====
+"""
+
+def default_response(messages: List[dict]) -> str:
+    """The canned listing, cut down to one platform when the last message asks for a single platform's listing."""
+    request = messages[-1].get('content', '') if messages else ''
+    for platform in ('Vinted', 'eBay'):
+        if f'{platform} listing' in request:
+            section = DEFAULT_RESPONSE.split(f'=== {platform} ===\n', 1)[1]
+            return section[:section.index('=====') + len('=====')] + '\n'
+    return DEFAULT_RESPONSE
+
+def tokenize(text: str) -> List[str]:
+    """Splits text into word-sized pieces that concatenate back to the original, roughly like LLM tokens."""
+    return re.findall(r'\s*\S+|\s+', text)
+
+def _common_prefix(messages: List[dict], previous: List[dict]) -> int:
+    shared = 0
+    while shared < min(len(messages), len(previous)) and messages[shared] == previous[shared]:
+        shared += 1
+    return shared
+
+class FakeOllamaServer:
+    """Threaded HTTP server answering /api/chat with canned responses, streamed or whole."""
+    def __init__(self, responses: Optional[List[str]] = None, host: str = '127.0.0.1', port: int = 0,
+                 token_delay: float = 0.03, first_token_delay: float = 0.5):
+        self.responses = responses  # None or empty replies with default_response()
+        self.token_delay = token_delay
+        self.first_token_delay = first_token_delay
+        self.requests = []  # Parsed request bodies, for inspection
+        self._next = 0
+        self.slots = 4  # Like OLLAMA_NUM_PARALLEL, the number of prompts whose KV cache is kept
+        self._cached_messages = []  # Message lists of the latest requests, one per slot
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self) -> 'FakeOllamaServer':
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def serve_forever(self):
+        self._server.serve_forever()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _take_response(self, body: dict) -> Tuple[str, int, int]:
+        """Returns the next response with the request's total and not yet cached prompt token counts."""
+        messages = body.get('messages', [])
+        with self._lock:
+            self.requests.append(body)
+            if self.responses:
+                response = self.responses[self._next % len(self.responses)]
+            else:
+                response = default_response(messages)
+            self._next += 1
+            cached = max((_common_prefix(messages, previous) for previous in self._cached_messages), default=0)
+            self._cached_messages = (self._cached_messages + [messages])[-self.slots:]
+        prompt_tokens = [len(tokenize(message.get('content', ''))) for message in messages]
+        return response, sum(prompt_tokens), sum(prompt_tokens[cached:])
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def _send_json(self, payload: dict, status: int = 200):
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                if self.path == '/api/tags':
+                    self._send_json({'models': []})
+                else:
+                    self._send_json({'status': 'Ollama is running'})
+
+            def do_POST(self):
+                if self.path != '/api/chat':
+                    self._send_json({'error': f'{self.path} not supported by the fake server'}, 404)
+                    return
+                body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+                response, prompt_tokens, prefill_tokens = server._take_response(body)
+                tokens = tokenize(response)
+                num_predict = body.get('options', {}).get('num_predict')
+                if num_predict is not None and num_predict >= 0:
+                    tokens = tokens[:num_predict]
+                # Prefill time scales with the part of the prompt that was not cached
+                prefill_delay = server.first_token_delay * prefill_tokens / max(prompt_tokens, 1)
+                start = time.perf_counter()
+                final = {
+                    'model': body.get('model', ''), 'done': True, 'done_reason': 'stop',
+                    'prompt_eval_count': prefill_tokens, 'eval_count': len(tokens),
+                }
+
+                if not body.get('stream', True):
+                    time.sleep(prefill_delay + server.token_delay * len(tokens))
+                    final['message'] = {'role': 'assistant', 'content': ''.join(tokens)}
+                    final['total_duration'] = int((time.perf_counter() - start) * 1e9)
+                    self._send_json(final)
+                    return
+
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/x-ndjson')
+                self.send_header('Connection', 'close')
+                self.end_headers()
+                try:
+                    time.sleep(prefill_delay)
+                    eval_start = time.perf_counter()
+                    for token in tokens:
+                        chunk = {'model': body.get('model', ''), 'done': False,
+                                 'message': {'role': 'assistant', 'content': token}}
+                        self.wfile.write((json.dumps(chunk) + '\n').encode())
+                        self.wfile.flush()
+                        time.sleep(server.token_delay)
+                    final['message'] = {'role': 'assistant', 'content': ''}
+                    final['eval_duration'] = int((time.perf_counter() - eval_start) * 1e9)
+                    final['total_duration'] = int((time.perf_counter() - start) * 1e9)
+                    self.wfile.write((json.dumps(final) + '\n').encode())
+                except (BrokenPipeError, ConnectionResetError):
+                    pass  # Client stopped reading, like a cancelled generation
+                self.close_connection = True
+
+        return Handler
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve canned LLM listings over the Ollama chat API.")
+    parser.add_argument('responses', nargs='*', help="Text files with responses to replay, in turn")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=11435)
+    parser.add_argument('--token-delay', type=float, default=0.03, help="Seconds between streamed tokens")
+    parser.add_argument('--first-token-delay', type=float, default=0.5, help="Seconds to prefill a fully uncached prompt")
+    args = parser.parse_args()
+
+    responses = []
+    for path in args.responses:
+        with open(path, encoding='utf-8') as f:
+            responses.append(f.read())
+    server = FakeOllamaServer(responses, args.host, args.port, args.token_delay, args.first_token_delay)
+    print(f"Fake Ollama listening on {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
+
+if __name__ == '__main__':
+    main()
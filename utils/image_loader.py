@@ -0,0 +1,111 @@
+import os
+import struct
+import threading
+import cv2
+import numpy as np
+from collections import OrderedDict
+from typing import Optional, Tuple
+from utils.config import SAM_IMGSZ, IMAGE_BUFFER_CACHE_MB
+from utils.metrics import metrics
+
+# Reduction factors OpenCV can decode at directly (JPEG scales its DCT, other formats are resized after decoding)
+REDUCED_DECODE_FLAGS = ((8, cv2.IMREAD_REDUCED_COLOR_8), (4, cv2.IMREAD_REDUCED_COLOR_4), (2, cv2.IMREAD_REDUCED_COLOR_2))
+# Part of the color and embedding cache keys, as the decoded pixels depend on it
+DECODE_SETTINGS = f'reduced-to-{SAM_IMGSZ}'
+
+def file_identity(file_path: str) -> tuple:
+    """(absolute path, size, modification time) of a file, which changes when the file is replaced or edited."""
+    stat = os.stat(file_path)
+    return os.path.abspath(file_path), stat.st_size, stat.st_mtime_ns
+
+def image_size(image_bytes: bytes) -> Optional[Tuple[int, int]]:
+    """(width, height) read from a PNG or JPEG header without decoding, None for other formats."""
+    if image_bytes[:8] == b'\x89PNG\r\n\x1a\n' and image_bytes[12:16] == b'IHDR':
+        return struct.unpack('>II', image_bytes[16:24])
+    if image_bytes[:2] != b'\xff\xd8':
+        return None
+    i = 2
+    while i + 9 <= len(image_bytes):
+        if image_bytes[i] != 0xFF:
+            return None
+        marker = image_bytes[i + 1]
+        if marker == 0xFF:  # Fill byte
+            i += 1
+        elif marker == 0x01 or 0xD0 <= marker <= 0xD8:  # Markers without a length
+            i += 2
+        elif 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):  # Start of frame
+            height, width = struct.unpack('>HH', image_bytes[i + 5:i + 9])
+            return width, height
+        else:
+            i += 2 + struct.unpack('>H', image_bytes[i + 2:i + 4])[0]
+    return None
+
+def decode_flag(size: Optional[Tuple[int, int]], target: int = SAM_IMGSZ) -> int:
+    """The most reduced decode whose longer side still reaches target, so the analysis never upscales."""
+    if size is not None:
+        for factor, flag in REDUCED_DECODE_FLAGS:
+            if max(size) // factor >= target:
+                return flag
+    return cv2.IMREAD_COLOR
+
+def decode_image(image_bytes: bytes, target: int = SAM_IMGSZ) -> np.ndarray:
+    """RGB pixels at about target on the longer side, with the EXIF orientation applied (OpenCV's default)."""
+    with metrics.span('image_decode'):
+        image_bgr = cv2.imdecode(np.frombuffer(image_bytes, np.uint8), decode_flag(image_size(image_bytes), target))
+    if image_bgr is None:
+        raise ValueError("Unsupported or corrupt image")
+    return cv2.cvtColor(image_bgr, cv2.COLOR_BGR2RGB, dst=image_bgr)  # In place, no second buffer
+
+def read_image(image_path: str, target: int = SAM_IMGSZ) -> np.ndarray:
+    """decode_image of a file, bypassing the buffer cache (for worker processes)."""
+    with open(image_path, 'rb') as f:
+        return decode_image(f.read(), target)
+
+class ImageBufferCache:
+    """Bounded LRU of decoded images by file, so one decode serves the thumbnail, segmentation and color sampling.
+
+    Buffers are shared rather than copied, so they are handed out read-only. Entries are keyed on the file's path,
+    size and modification time and evicted least recently used first once max_bytes is exceeded. Thread-safe.
+    """
+    def __init__(self, max_bytes: int = IMAGE_BUFFER_CACHE_MB * 1024 * 1024, target: int = SAM_IMGSZ):
+        self.max_bytes = max_bytes
+        self.target = target
+        self.nbytes = 0
+        self._entries = OrderedDict()  # key -> RGB array, most recently used last
+        self._lock = threading.Lock()
+
+    def get(self, image_path: str) -> Optional[np.ndarray]:
+        key = file_identity(image_path)
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return self._entries[key]
+        return None
+
+    def put(self, image_path: str, image_rgb: np.ndarray):
+        key = file_identity(image_path)
+        image_rgb.setflags(write=False)
+        with self._lock:
+            if key in self._entries:
+                self.nbytes -= self._entries.pop(key).nbytes
+            self._entries[key] = image_rgb
+            self.nbytes += image_rgb.nbytes
+            while self.nbytes > self.max_bytes and len(self._entries) > 1:
+                self.nbytes -= self._entries.popitem(last=False)[1].nbytes
+
+    def load(self, image_path: str) -> np.ndarray:
+        """The decoded image, decoding and caching it on a miss."""
+        image_rgb = self.get(image_path)
+        metrics.count('cache_misses' if image_rgb is None else 'cache_hits', cache='image_buffer')
+        if image_rgb is None:
+            image_rgb = read_image(image_path, self.target)
+            self.put(image_path, image_rgb)
+        return image_rgb
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+
+# Shared by the GUI thumbnails, speculative extraction and the processing worker of this process
+image_buffers = ImageBufferCache()
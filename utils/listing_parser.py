@@ -0,0 +1,134 @@
+from html import escape
+from typing import Dict, Iterable, List, Optional
+
+HEADER_START, HEADER_END = '=== ', ' ===\n'
+TITLE = 'Title:'
+DESCRIPTION = 'Descrip'  # Tinyllama often outputs "Descripion:" instead of "Description:", the label ends at the ':'
+TERMINATOR = '====='
+
+class ListingParser:
+    """Incremental parser of the '=== Platform ===' / 'Title:' / 'Description: ... =====' listing format.
+
+    Text is fed as it streams in. Each piece is scanned once for the next marker; what is scanned becomes part of a
+    field or is skipped, only a possible cut-off marker at its end is carried over to the next piece, so neither
+    the text so far nor a growing description is copied again per piece. A section is emitted as soon as its
+    '=====' arrives; anything the model writes after the last requested section does not matter, so the caller
+    can stop generating there.
+
+    With platform given, the text is a single-platform answer without a header (see PLATFORM_SYSTEM_PROMPT), any
+    text before 'Title:' is skipped. Otherwise sections start with a '=== Platform ===' header line.
+    """
+    def __init__(self, platform: Optional[str] = None, platforms: Optional[Iterable[str]] = None):
+        self.platforms = list(platforms) if platforms is not None else [platform] if platform else None
+        self.listings: Dict[str, Dict[str, str]] = {}
+        self._platform = platform
+        self._state = 'title' if platform else 'header'
+        self._pending = ""  # End of the text so far that may be the start of a marker, scanned again with the next piece
+        self._field: List[str] = []  # Pieces of the platform name, title or description being read
+        self._title = None
+
+    def _collected(self, piece: str) -> str:
+        """The field being read, ending with piece."""
+        self._field.append(piece)
+        field, self._field = ''.join(self._field), []
+        return field
+
+    def feed(self, text: str) -> List[str]:
+        """Consumes the next piece of text and returns the platforms whose section it closed."""
+        text = self._pending + text
+        find = text.find
+        state, pos, closed = self._state, 0, []
+        while True:  # One pass per section, each step falls through to the next once its marker is found
+            if state == 'header':
+                index = find(HEADER_START, pos)
+                if index < 0:
+                    keep, collect = len(HEADER_START) - 1, False
+                    break
+                pos, state = index + len(HEADER_START), 'platform'
+            if state == 'platform':
+                index = find(HEADER_END, pos)
+                if index < 0:
+                    keep, collect = len(HEADER_END) - 1, True
+                    break
+                platform = self._collected(text[pos:index]) if self._field else text[pos:index]
+                if HEADER_START in platform:  # Take the last header start, should '=' run on after a terminator
+                    platform = platform.rpartition(HEADER_START)[2]
+                self._platform = platform.strip()
+                pos, state = index + len(HEADER_END), 'title'
+            if state == 'title':
+                index = find(TITLE, pos)
+                if index < 0:
+                    keep, collect = len(TITLE) - 1, False
+                    break
+                pos, state = index + len(TITLE), 'title_text'
+            if state == 'title_text':
+                index = find(DESCRIPTION, pos)
+                if index < 0:
+                    keep, collect = len(DESCRIPTION) - 1, True
+                    break
+                self._title = self._collected(text[pos:index]) if self._field else text[pos:index]
+                pos, state = index + len(DESCRIPTION), 'label'
+            if state == 'label':
+                index = find(':', pos)
+                if index < 0:
+                    keep, collect = 0, False
+                    break
+                pos, state = index + 1, 'description'
+            if state == 'description':
+                index = find(TERMINATOR, pos)
+                description = text[pos:index] if index >= 0 else text[pos:]
+                if HEADER_START in description:
+                    state = 'broken'  # The next section started without this one's '====='
+                elif index < 0:
+                    keep, collect = max(len(TERMINATOR), len(HEADER_START)) - 1, True
+                    break
+                else:
+                    if self._field:
+                        description = self._collected(description)
+                    self.listings[self._platform] = {'title': escape(self._title.strip()), 'description': description.strip()}
+                    closed.append(self._platform)
+                    pos, state = index + len(TERMINATOR), 'header'
+                    if self.complete:
+                        state = 'done'
+            if state == 'done' or state == 'broken':  # The rest is ignored
+                keep, collect, pos = 0, False, len(text)
+                break
+        end = max(pos, len(text) - keep)
+        if collect and end > pos:
+            self._field.append(text[pos:end])
+        self._pending = text[end:]
+        self._state = state
+        return closed
+
+    @property
+    def complete(self) -> bool:
+        """Whether every requested platform's section has closed (only known when platforms were given)."""
+        return self.platforms is not None and all(platform in self.listings for platform in self.platforms)
+
+    @property
+    def in_section(self) -> bool:
+        """Whether a section has started but not closed yet."""
+        return self._state in ('title', 'title_text', 'label', 'description')
+
+    def sections(self) -> Dict[str, Dict[str, str]]:
+        """The listings so far, for display while streaming: the closed sections and whatever part of the open
+        section's title and description has arrived. A field that has not started yet is an empty string."""
+        sections = dict(self.listings)
+        if self.in_section:
+            streamed = ''.join(self._field) + self._pending
+            title, description = "", ""
+            if self._state == 'title_text':
+                title = streamed
+            elif self._state != 'title':
+                title = self._title
+                if self._state == 'description':
+                    description = streamed.rstrip('= \n')  # Also drop a closing marker that is half-streamed
+            sections[self._platform] = {'title': escape(title.strip()), 'description': description.strip()}
+        return sections
+
+    def result(self) -> Optional[Dict[str, Dict[str, str]]]:
+        """The parsed listings of a finished answer, None if a section is malformed or broke off, the next section's
+        header included."""
+        if self.in_section or self._state in ('platform', 'broken'):
+            return None
+        return self.listings
@@ -1,120 +1,124 @@
+import re
+import json
+import time
+import asyncio
+import hashlib
 import ollama
-from typing import List, Dict
-from utils.config import LLM_MODEL
-
-def create_chat_messages(attributes: Dict) -> List[Dict[str, str]]:
-    examples = [
-        {
-            "attributes": {
-                "product": "Basic T-Shirt Cotton Short Sleeve",
-                "gender": "Women",
-                "color": "Blue",
-                "category": {
-                    "vinted": "Women > Clothing > Tops & t-shirts > T-shirts",
-                    "ebay": "Clothing, Shoes & Accessories > Women > Women's Clothing > Tops"
-                },
-                "size": "M",
-                "condition": "2"
-            },
-            "vinted": {
-                "title": "Blauw Bershka T-shirt",
-                "description": "Mooi blauw T-shirt, maat M, amper gedragen, goede staat."
+from functools import lru_cache
+from typing import AsyncIterator, Callable, Dict, Iterable, List, Optional, Tuple
+from utils.config import LLM_MODEL, OLLAMA_HOST, LLM_KEEP_ALIVE
+from utils.metrics import metrics
+from utils.listing_parser import ListingParser
+
+FEW_SHOT_EXAMPLES = [
+    {
+        "attributes": {
+            "product": "Basic T-Shirt Cotton Short Sleeve",
+            "gender": "Women",
+            "color": "Blue",
+            "category": {
+                "vinted": "Women > Clothing > Tops & t-shirts > T-shirts",
+                "ebay": "Clothing, Shoes & Accessories > Women > Women's Clothing > Tops"
             },
-            "ebay": {
-                "title": "Women's Blue Cotton T-Shirt Short Sleeve Size M Good Condition",
-                "description": "Premium women's blue cotton T-shirt, size M, in good condition. Slim fit, stretchy fabric, scoop neck, short sleeves. Perfect for casual wear or layering. Machine washable, no stains or tears. True to size, ideal for everyday comfort."
-            }
+            "size": "M",
+            "condition": "2"
         },
-        {
-            "attributes": {
-                "product": "Sundress Summer Sleeveless",
-                "gender": "Women",
-                "color": "Red",
-                "category": {
-                    "vinted": "Women > Clothing > Dresses > Midi dresses",
-                    "ebay": "Clothing, Shoes & Accessories > Women > Women's Clothing > Dresses"
-                },
-                "size": "S",
-                "condition": "3"
-            },
-            "vinted": {
-                "title": "Rode Zomerjurk",
-                "description": "Prachtige rode jurk, maat S, zo goed als nieuw, perfect voor de zomer."
-            },
-            "ebay": {
-                "title": "Women's Red Sleeveless Sundress Size S Like New",
-                "description": "Stunning red sleeveless sundress, size S, in excellent condition. Lightweight, breathable fabric, ideal for summer outings or parties. Midi length, flattering fit. No damage or wear, machine washable. Perfect for vacations or special occasions."
-            }
+        "vinted": {
+            "title": "Blauw Bershka T-shirt",
+            "description": "Mooi blauw T-shirt, maat M, amper gedragen, goede staat."
         },
-        {
-            "attributes": {
-                "product": "H&M Denim Jeans",
-                "gender": "Men",
-                "color": "Blue",
-                "category": {
-                    "vinted": "Men > Clothing > Jeans > Slim jeans",
-                    "ebay": "Clothing, Shoes & Accessories > Men > Men's Clothing > Jeans"
-                },
-                "size": "L",
-                "condition": "3"
-            },
-            "vinted": {
-                "title": "H&M Slim Jeans Blauw",
-                "description": "Blauwe H&M jeans, maat L, zo goed als nieuw, comfortabele pasvorm."
+        "ebay": {
+            "title": "Women's Blue Cotton T-Shirt Short Sleeve Size M Good Condition",
+            "description": "Premium women's blue cotton T-shirt, size M, in good condition. Slim fit, stretchy fabric, scoop neck, short sleeves. Perfect for casual wear or layering. Machine washable, no stains or tears. True to size, ideal for everyday comfort."
+        }
+    },
+    {
+        "attributes": {
+            "product": "Sundress Summer Sleeveless",
+            "gender": "Women",
+            "color": "Red",
+            "category": {
+                "vinted": "Women > Clothing > Dresses > Midi dresses",
+                "ebay": "Clothing, Shoes & Accessories > Women > Women's Clothing > Dresses"
             },
-            "ebay": {
-                "title": "Men's H&M Blue Denim Slim Fit Jeans Size L Like New",
-                "description": "High-quality H&M men's blue denim jeans, size L, in excellent condition. Slim fit, durable fabric, perfect for casual or semi-formal settings. Five-pocket style, machine washable, no signs of wear. Ideal for everyday wear or dressing up."
-            }
+            "size": "S",
+            "condition": "3"
         },
-        {
-            "attributes": {
-                "product": "Zara Wool Coat",
-                "gender": "Women",
-                "color": "Black",
-                "category": {
-                    "vinted": "Women > Clothing > Outerwear > Coats > Long coats",
-                    "ebay": "Clothing, Shoes & Accessories > Women > Women's Clothing > Coats, Jackets & Vests"
-                },
-                "size": "XS",
-                "condition": "1"
-            },
-            "vinted": {
-                "title": "Zwart Zara Wollen Jas",
-                "description": "Zwarte wollen jas, maat XS, in redelijke staat, warm en stijlvol."
+        "vinted": {
+            "title": "Rode Zomerjurk",
+            "description": "Prachtige rode jurk, maat S, zo goed als nieuw, perfect voor de zomer."
+        },
+        "ebay": {
+            "title": "Women's Red Sleeveless Sundress Size S Like New",
+            "description": "Stunning red sleeveless sundress, size S, in excellent condition. Lightweight, breathable fabric, ideal for summer outings or parties. Midi length, flattering fit. No damage or wear, machine washable. Perfect for vacations or special occasions."
+        }
+    },
+    {
+        "attributes": {
+            "product": "H&M Denim Jeans",
+            "gender": "Men",
+            "color": "Blue",
+            "category": {
+                "vinted": "Men > Clothing > Jeans > Slim jeans",
+                "ebay": "Clothing, Shoes & Accessories > Men > Men's Clothing > Jeans"
             },
-            "ebay": {
-                "title": "Women's Zara Black Wool Coat Size XS Fair Condition",
-                "description": "Elegant Zara women's black wool coat, size XS, in fair condition. Warm, stylish design with button closure, perfect for winter. Minor signs of wear, fully functional. Dry clean recommended. Ideal for professional or casual outfits."
-            }
+            "size": "L",
+            "condition": "3"
+        },
+        "vinted": {
+            "title": "H&M Slim Jeans Blauw",
+            "description": "Blauwe H&M jeans, maat L, zo goed als nieuw, comfortabele pasvorm."
         },
-        {
-            "attributes": {
-                "product": "Nike Running Shoes",
-                "gender": "Men",
-                "color": "Grey",
-                "category": {
-                    "vinted": "Men > Shoes > Sneakers > Running sneakers",
-                    "ebay": "Clothing, Shoes & Accessories > Men > Men's Shoes > Athletic Shoes"
-                },
-                "size": "XL",
-                "condition": "2"
+        "ebay": {
+            "title": "Men's H&M Blue Denim Slim Fit Jeans Size L Like New",
+            "description": "High-quality H&M men's blue denim jeans, size L, in excellent condition. Slim fit, durable fabric, perfect for casual or semi-formal settings. Five-pocket style, machine washable, no signs of wear. Ideal for everyday wear or dressing up."
+        }
+    },
+    {
+        "attributes": {
+            "product": "Zara Wool Coat",
+            "gender": "Women",
+            "color": "Black",
+            "category": {
+                "vinted": "Women > Clothing > Outerwear > Coats > Long coats",
+                "ebay": "Clothing, Shoes & Accessories > Women > Women's Clothing > Coats, Jackets & Vests"
             },
-            "vinted": {
-                "title": "Grijze Nike Schoenen",
-                "description": "Nike hardloopschoenen, maat XL, goede staat, ideaal voor sporten."
+            "size": "XS",
+            "condition": "1"
+        },
+        "vinted": {
+            "title": "Zwart Zara Wollen Jas",
+            "description": "Zwarte wollen jas, maat XS, in redelijke staat, warm en stijlvol."
+        },
+        "ebay": {
+            "title": "Women's Zara Black Wool Coat Size XS Fair Condition",
+            "description": "Elegant Zara women's black wool coat, size XS, in fair condition. Warm, stylish design with button closure, perfect for winter. Minor signs of wear, fully functional. Dry clean recommended. Ideal for professional or casual outfits."
+        }
+    },
+    {
+        "attributes": {
+            "product": "Nike Running Shoes",
+            "gender": "Men",
+            "color": "Grey",
+            "category": {
+                "vinted": "Men > Shoes > Sneakers > Running sneakers",
+                "ebay": "Clothing, Shoes & Accessories > Men > Men's Shoes > Athletic Shoes"
             },
-            "ebay": {
-                "title": "Men's Nike Grey Running Shoes Size XL Good Condition",
-                "description": "Men's Nike grey running shoes, size XL, in good condition. Lightweight, breathable mesh upper, cushioned sole for comfort. Perfect for running, gym, or casual wear. Minor wear on soles, cleaned and ready to use. True to size."
-            }
+            "size": "XL",
+            "condition": "2"
+        },
+        "vinted": {
+            "title": "Grijze Nike Schoenen",
+            "description": "Nike hardloopschoenen, maat XL, goede staat, ideaal voor sporten."
+        },
+        "ebay": {
+            "title": "Men's Nike Grey Running Shoes Size XL Good Condition",
+            "description": "Men's Nike grey running shoes, size XL, in good condition. Lightweight, breathable mesh upper, cushioned sole for comfort. Perfect for running, gym, or casual wear. Minor wear on soles, cleaned and ready to use. True to size."
         }
-    ]
+    }
+]
 
-    messages = []
-
-    # System Role Message
-    system_content = """You are an expert at generating clothing and accessory listings for second-hand marketplaces Vinted and eBay.
+SYSTEM_PROMPT = """You are an expert at generating clothing and accessory listings for second-hand marketplaces Vinted and eBay.
     Given attributes (product (short item description), gender (Men or Women), color, Vinted category, eBay category, size (XS, S, M, L, XL), condition (1-3 stars, where 3=excellent, 2=good, 1=fair)), create concise, platform-specific listings.
 
     For Vinted:
@@ -134,23 +138,51 @@ def create_chat_messages(attributes: Dict) -> List[Dict[str, str]]:
     Title: <ebay_title>
     Description: <ebay_description> =====
     """
-    messages.append({"role": "system", "content": system_content})
-
-    # Example Conversations
-    for example in examples:
-        ex_attributes = example["attributes"]
-        user_example_content = f"""Please generate listings for the following attributes:
-        Product: {ex_attributes['product']}
-        Gender: {ex_attributes['gender']}
-        Color: {ex_attributes['color']}
-        Vinted Category: {ex_attributes['category']['vinted']}
-        eBay Category: {ex_attributes['category']['ebay']}
-        Size: {ex_attributes['size']}
-        Condition: {ex_attributes['condition']}
+
+PLATFORMS = ('Vinted', 'eBay')  # Listing order on the review page
+PROMPT_VERSION = 2  # Bump on any prompt change, it invalidates the cached listings
+
+PLATFORM_INSTRUCTIONS = {
+    'Vinted': """- Titles: In Dutch, trendy and catchy.
+    - Descriptions: In Dutch, casual and engaging. Include product, color, size, and condition.""",
+    'eBay': """- Titles: In English, keyword-rich for searchability.
+    - Descriptions: In English, detailed with fit, material, care instructions, and usage scenarios. Include product, color, size, and condition.""",
+}
+
+# Single-platform prompt, so each selected platform is generated by its own (parallel) request
+PLATFORM_SYSTEM_PROMPT = """You are an expert at generating clothing and accessory listings for the second-hand marketplace {platform}.
+    Given attributes (product (short item description), gender (Men or Women), color, {platform} category, size (XS, S, M, L, XL), condition (1-3 stars, where 3=excellent, 2=good, 1=fair)), create a concise {platform} listing.
+
+    {instructions}
+
+    Always try to include all provided attributes in the output. If some attributes are missing or inaccurate, don't mention it in your output. Generate only the title and description, using this strict format below (NO EXCEPTIONS):
+    Title: <title>
+    Description: <description> =====
+    """
+
+def _user_content(attributes: Dict, request: str, platform: Optional[str] = None) -> str:
+    """Attribute block of a user message. Without a platform it lists both categories."""
+    if platform is None:
+        categories = f"""Vinted Category: {attributes['category']['vinted']}
+        eBay Category: {attributes['category']['ebay']}"""
+    else:
+        categories = f"{platform} Category: {attributes['category'][platform.lower()]}"
+    return f"""{request}
+        Product: {attributes['product']}
+        Gender: {attributes['gender']}
+        Color: {attributes['color']}
+        {categories}
+        Size: {attributes['size']}
+        Condition: {attributes['condition']}
         """
-        messages.append({"role": "user", "content": user_example_content})
 
-        assistant_example_content = f"""=== Vinted ===
+def _example_assistant_content(example: Dict, platform: Optional[str] = None) -> str:
+    if platform is not None:
+        key = platform.lower()
+        return f"""Title: {example[key]['title']}
+        Description: {example[key]['description']} =====
+        """
+    return f"""=== Vinted ===
         Title: {example['vinted']['title']}
         Description: {example['vinted']['description']} =====
 
@@ -158,23 +190,237 @@ def create_chat_messages(attributes: Dict) -> List[Dict[str, str]]:
         Title: {example['ebay']['title']}
         Description: {example['ebay']['description']} =====
         """
-        messages.append({"role": "assistant", "content": assistant_example_content})
 
+@lru_cache(maxsize=None)
+def static_prefix(platform: Optional[str] = None) -> Tuple[Dict[str, str], ...]:
+    """System prompt and few-shot conversations, the part of every chat that never changes. Built once per platform.
+
+    Sending byte-identical prefix messages every time lets Ollama reuse the prefix already evaluated in the
+    loaded model's KV cache, so only the final user message is prefilled. Without a platform, the prompt asks
+    for both listings in one answer.
+    """
+    if platform is None:
+        system_content = SYSTEM_PROMPT
+        request = "Please generate listings for the following attributes:"
+    else:
+        system_content = PLATFORM_SYSTEM_PROMPT.format(platform=platform, instructions=PLATFORM_INSTRUCTIONS[platform])
+        request = f"Please generate the {platform} listing for the following attributes:"
+    messages = [{"role": "system", "content": system_content}]
+    for example in FEW_SHOT_EXAMPLES:
+        messages.append({"role": "user", "content": _user_content(example["attributes"], request, platform)})
+        messages.append({"role": "assistant", "content": _example_assistant_content(example, platform)})
+    return tuple(messages)
+
+def create_chat_messages(attributes: Dict, platform: Optional[str] = None) -> List[Dict[str, str]]:
     # Final User Request
-    final_user_content = f"""Now, please generate listings for the following item:
-        Product: {attributes['product']}
-        Gender: {attributes['gender']}
-        Color: {attributes['color']}
-        Vinted Category: {attributes['category']['vinted']}
-        eBay Category: {attributes['category']['ebay']}
-        Size: {attributes['size']}
-        Condition: {attributes['condition']}
-        """
-    messages.append({"role": "user", "content": final_user_content})
+    if platform is None:
+        request = "Now, please generate listings for the following item:"
+    else:
+        request = f"Now, please generate the {platform} listing for the following item:"
+    return list(static_prefix(platform)) + [{"role": "user", "content": _user_content(attributes, request, platform)}]
+
+_client = None
+# Prompt prefill over this session. 'prefix_tokens' holds what warm_up() evaluated per platform, generations that
+# prefill fewer tokens than that reused the cached prefix
+prefill_stats = {'generations': 0, 'prompt_tokens': 0, 'reused': 0, 'prefix_tokens': {}}
+
+def get_client() -> ollama.Client:
+    """Shared Ollama client for OLLAMA_HOST, so streamed requests reuse one HTTP connection pool."""
+    global _client
+    if _client is None:
+        _client = ollama.Client(host=OLLAMA_HOST)
+    return _client
+
+def warm_up(platforms: Iterable[str] = PLATFORMS) -> Dict[str, int]:
+    """Loads the LLM in Ollama and evaluates each platform's static prefix, so the first listing only prefills
+    its own item. Ollama needs OLLAMA_NUM_PARALLEL >= 2 to keep both prefixes cached side by side.
+
+    Returns the number of prompt tokens Ollama evaluated per platform.
+    """
+    for platform in platforms:
+        response = get_client().chat(
+            model=LLM_MODEL, messages=list(static_prefix(platform)), options={'num_predict': 1},
+            keep_alive=LLM_KEEP_ALIVE
+        )
+        prefill_stats['prefix_tokens'][platform] = response.get('prompt_eval_count') or 0
+    return dict(prefill_stats['prefix_tokens'])
+
+def _record_prefill(platform: Optional[str], prompt_tokens: int):
+    prefill_stats['generations'] += 1
+    prefill_stats['prompt_tokens'] += prompt_tokens
+    if prompt_tokens < prefill_stats['prefix_tokens'].get(platform, 0):
+        prefill_stats['reused'] += 1
+
+def prefill_report() -> str:
+    generations = prefill_stats['generations']
+    if not generations:
+        return "no generations yet"
+    report = f"{prefill_stats['prompt_tokens'] / generations:.0f} prompt tokens prefilled per generation"
+    if prefill_stats['prefix_tokens']:
+        report += f", cached prefix reused in {prefill_stats['reused']}/{generations} ({prefill_stats['reused'] / generations:.0%})"
+    return report
+
+class _StreamTimer:
+    """Collects time to first token, prefill and decode statistics of one streamed generation into stats."""
+    def __init__(self, platform: Optional[str], stats: Dict):
+        self.platform = platform
+        self.stats = stats
+        self.start = time.perf_counter()
+        self.first_token_time = None
+        self.chunks = 0
+        self.eval_count = self.eval_duration = self.prompt_eval_duration = None
+
+    def content(self, chunk) -> str:
+        content = chunk['message']['content']
+        if content:
+            if self.first_token_time is None:
+                self.first_token_time = time.perf_counter()
+                self.stats['ttft'] = self.first_token_time - self.start
+            self.chunks += 1
+        if chunk.get('done'):
+            self.eval_count, self.eval_duration = chunk.get('eval_count'), chunk.get('eval_duration')
+            self.prompt_eval_duration = chunk.get('prompt_eval_duration')
+            if chunk.get('prompt_eval_count') is not None:
+                self.stats['prompt_tokens'] = chunk['prompt_eval_count']
+                _record_prefill(self.platform, chunk['prompt_eval_count'])
+        return content
+
+    def stopped_early(self):
+        """Marks a generation cut off once its listing was complete; Ollama's final statistics never arrive."""
+        self.stats['stopped_early'] = True
+        metrics.count('llm_early_stops', platform=self.platform or 'all')
+
+    def finish(self):
+        if self.eval_count and self.eval_duration:
+            decode_seconds = self.eval_duration / 1e9
+            self.stats['tokens'] = self.eval_count
+        else:
+            decode_seconds = time.perf_counter() - (self.first_token_time or self.start)
+            self.stats['tokens'] = self.chunks
+        self.stats['tokens_per_second'] = self.stats['tokens'] / decode_seconds if decode_seconds > 0 else 0.0
+        self.stats.setdefault('ttft', time.perf_counter() - self.start)
+        # Server-side durations when Ollama reports them, otherwise as seen by the client
+        platform = self.platform or 'all'
+        prefill_seconds = self.prompt_eval_duration / 1e9 if self.prompt_eval_duration else self.stats['ttft']
+        metrics.record('llm_prefill', prefill_seconds, platform=platform)
+        metrics.record('llm_decode', decode_seconds, platform=platform)
+        metrics.count('llm_prompt_tokens', self.stats.get('prompt_tokens', 0), platform=platform)
+        metrics.count('llm_generated_tokens', self.stats['tokens'], platform=platform)
+
+async def astream_text(client: ollama.AsyncClient, attributes: Dict, platform: Optional[str] = None,
+                       stats: Optional[Dict] = None, parser: Optional[ListingParser] = None) -> AsyncIterator[str]:
+    """Yields the listing text chunk by chunk as the LLM produces it on client, for one platform or (by default) both.
+
+    If given, stats is filled with 'ttft' (seconds to the first chunk), 'prompt_tokens' (tokens prefilled, a cached
+    prefix excluded), 'tokens' and 'tokens_per_second'. Token counts come from Ollama's final chunk when it
+    reports them, otherwise every chunk counts as one token.
+    Closing the generator early closes the connection, which stops generation on the server. The generator does
+    so itself when the model writes on past the listing's last '=====', rather than paying for the rambling.
+    Every chunk is fed to parser (by default a new ListingParser) before it is yielded.
+    """
+    timer = _StreamTimer(platform, stats if stats is not None else {})
+    parser = parser or ListingParser(platform, [platform] if platform else PLATFORMS)
+    response = await client.chat(
+        model=LLM_MODEL, messages=create_chat_messages(attributes, platform), stream=True, keep_alive=LLM_KEEP_ALIVE
+    )
+    try:
+        async for chunk in response:
+            content = timer.content(chunk)
+            if parser.complete and content.strip():
+                # Whitespace and the final statistics chunk may follow the last '=====', anything else is rambling
+                timer.stopped_early()
+                break
+            if content:
+                parser.feed(content)
+                yield content
+    finally:
+        await response.aclose()
+    timer.finish()
+
+def merge_listing_text(platform_texts: Dict[str, str]) -> str:
+    """Joins single-platform answers into the combined '=== Platform ===' format parse_listing_text reads."""
+    return '\n'.join(
+        f"=== {platform} ===\n" + re.sub(r'^\s*===[^\n]*===\s*\n', '', text.lstrip())  # Drop a header the model added itself
+        for platform, text in platform_texts.items()
+    )
+
+def _normalize(text) -> str:
+    return ' '.join(str(text).split()).casefold()
+
+def listing_cache_key(attributes: Dict, platform: str) -> str:
+    """Cache key of one platform's listing: the attributes its prompt uses (not the price), normalized, plus the
+    model and prompt version."""
+    prompt_attributes = {
+        name: _normalize(attributes[name]) for name in ('product', 'gender', 'color', 'size', 'condition')
+    }
+    prompt_attributes['category'] = _normalize(attributes['category'][platform.lower()])
+    key = json.dumps([LLM_MODEL, PROMPT_VERSION, platform, prompt_attributes], sort_keys=True)
+    return hashlib.sha256(key.encode()).hexdigest()
+
+async def agenerate_text(attributes: Dict, platforms: Iterable[str] = PLATFORMS,
+                         on_text: Optional[Callable[[Dict], None]] = None, stats: Optional[Dict] = None,
+                         client: Optional[ollama.AsyncClient] = None, cache=None, force: bool = False) -> str:
+    """Generates the listings of the given platforms concurrently, one smaller prompt each.
+
+    on_text(platform_listings) is called after every chunk with the listings parsed so far (see
+    ListingParser.sections), an exception it raises (e.g. on cancel) stops every generation. stats gets one
+    astream_text stats dict per platform, {'cached': True} for cache hits.
+    With a cache (e.g. DiskCache), listings are looked up per platform first and well-formed new ones stored;
+    force skips the lookup, regenerating and overwriting them.
+    """
+    client = client or ollama.AsyncClient(host=OLLAMA_HOST)
+    stats = stats if stats is not None else {}
+    platform_chunks = {platform: [] for platform in PLATFORMS if platform in platforms}
+    parsers = {platform: ListingParser(platform) for platform in platform_chunks}
+    keys = {platform: listing_cache_key(attributes, platform) for platform in platform_chunks} if cache is not None else {}
+
+    def listings() -> Dict[str, Dict[str, str]]:
+        return {platform: listing for parser in parsers.values() for platform, listing in parser.sections().items()}
+
+    missing = []
+    for platform in platform_chunks:
+        cached = cache.get(keys[platform]) if cache is not None and not force else None
+        if cache is not None and not force:
+            metrics.count('cache_misses' if cached is None else 'cache_hits', cache='listing')
+        if cached is None:
+            missing.append(platform)
+        else:
+            platform_chunks[platform].append(cached)
+            parsers[platform].feed(cached)
+            stats[platform] = {'cached': True}
+    if on_text is not None and len(missing) < len(platform_chunks):
+        on_text(listings())
+
+    async def generate(platform: str):
+        parser = parsers[platform]
+        async for content in astream_text(client, attributes, platform, stats.setdefault(platform, {}), parser):
+            platform_chunks[platform].append(content)
+            if on_text is not None:
+                on_text(listings())
+        if not parser.result():
+            metrics.count('parse_failures', platform=platform)
+        elif cache is not None:
+            cache.set(keys[platform], ''.join(platform_chunks[platform]))
+
+    tasks = [asyncio.ensure_future(generate(platform)) for platform in missing]
+    try:
+        await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()  # No-op for finished ones, stops the other streams if one failed
+    return merge_listing_text({platform: ''.join(chunks) for platform, chunks in platform_chunks.items()})
+
+def generate_text(attributes: Dict, platforms: Iterable[str] = PLATFORMS, on_text: Optional[Callable[[Dict], None]] = None,
+                  stats: Optional[Dict] = None, cache=None, force: bool = False) -> str:
+    """Blocking wrapper around agenerate_text, for threads without an event loop."""
+    return asyncio.run(agenerate_text(attributes, platforms, on_text, stats, cache=cache, force=force))
 
-    return messages
+def parse_listing_text(listing_text: str) -> Optional[Dict[str, Dict[str, str]]]:
+    """Parses a complete LLM answer into {platform: {'title', 'description'}}, or None if it is malformed."""
+    with metrics.span('parse_listing'):
+        return _parse_listing_text(listing_text)
 
-def generate_text(attributes: Dict) -> str:
-    chat_messages = create_chat_messages(attributes)
-    response = ollama.chat(model=LLM_MODEL, messages=chat_messages)
-    return response['message']['content']
\ No newline at end of file
+def _parse_listing_text(listing_text: str) -> Optional[Dict[str, Dict[str, str]]]:
+    parser = ListingParser()
+    parser.feed(listing_text)
+    return parser.result()
@@ -0,0 +1,152 @@
+import os
+import json
+import time
+import threading
+from contextlib import contextmanager
+from collections import defaultdict
+from typing import Dict, List, Optional
+from utils.config import METRICS_JSONL_PATH, METRICS_PROMETHEUS_PATH
+
+# Upper bounds in seconds of the span duration histogram buckets
+SPAN_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+def _label_key(labels: Dict) -> tuple:
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+def _format_labels(labels: tuple) -> str:
+    if not labels:
+        return ''
+    escape = lambda value: value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return '{' + ','.join(f'{name}="{escape(value)}"' for name, value in labels) + '}'
+
+class Metrics:
+    """Spans (timed operations) and counters of the pipeline, exported as JSON lines and Prometheus text.
+
+    Every span, counter increment and event is appended to jsonl_path as it happens. The aggregates, a duration
+    histogram per span name and labels and a total per counter, are written to prometheus_path by
+    write_prometheus() for a node_exporter textfile collector. Either path may be None. Thread-safe; worker
+    processes record into capture() and the parent merge()s what they return.
+    """
+    def __init__(self, jsonl_path: Optional[str] = METRICS_JSONL_PATH,
+                 prometheus_path: Optional[str] = METRICS_PROMETHEUS_PATH, prefix: str = 'listing_tool'):
+        self.jsonl_path = jsonl_path
+        self.prometheus_path = prometheus_path
+        self.prefix = prefix
+        self._spans = {}  # (name, labels) -> bucket counts followed by the sum and count of durations
+        self._counters = defaultdict(float)  # (name, labels) -> total
+        self._jsonl = None
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    @contextmanager
+    def span(self, name: str, **labels):
+        """Times the block as a span of name. A span left by an exception records the exception type."""
+        start, t0 = time.time(), time.perf_counter()
+        error = None
+        try:
+            yield
+        except BaseException as e:
+            error = type(e).__name__
+            raise
+        finally:
+            event = {'type': 'span', 'name': name, 'start': start, 'seconds': time.perf_counter() - t0, 'labels': labels}
+            if error:
+                event['error'] = error
+            self._emit(event)
+
+    def record(self, name: str, seconds: float, **labels):
+        """A span timed elsewhere, e.g. a duration reported by the LLM server, that ended just now."""
+        self._emit({'type': 'span', 'name': name, 'start': time.time() - seconds, 'seconds': seconds, 'labels': labels})
+
+    def count(self, name: str, value: float = 1, **labels):
+        if value:
+            self._emit({'type': 'counter', 'name': name, 'value': value, 'labels': labels})
+
+    def event(self, name: str, **fields):
+        """A JSON lines only record, for context such as the attributes of a listing."""
+        self._emit({'type': 'event', 'name': name, **fields})
+
+    @contextmanager
+    def capture(self):
+        """Collects what the current thread records in a list instead of exporting it, see traced_call."""
+        self._local.events = events = []
+        try:
+            yield events
+        finally:
+            del self._local.events
+
+    def merge(self, events: List[Dict]):
+        for event in events:
+            self._emit(event)
+
+    def _emit(self, event: Dict):
+        captured = getattr(self._local, 'events', None)
+        if captured is not None:
+            captured.append(event)
+            return
+        event.setdefault('time', time.time())
+        with self._lock:
+            key = (event['name'], _label_key(event.get('labels', {})))
+            if event['type'] == 'span':
+                self._observe(key, event['seconds'])
+            elif event['type'] == 'counter':
+                self._counters[key] += event['value']
+            if self.jsonl_path:
+                if self._jsonl is None:
+                    self._jsonl = open(self.jsonl_path, 'a', encoding='utf-8')
+                self._jsonl.write(json.dumps(event, default=str) + '\n')
+                self._jsonl.flush()
+
+    def _observe(self, key: tuple, seconds: float):
+        histogram = self._spans.setdefault(key, [0] * (len(SPAN_BUCKETS) + 2))
+        for i, bound in enumerate(SPAN_BUCKETS):
+            if seconds <= bound:
+                histogram[i] += 1
+        histogram[-2] += seconds
+        histogram[-1] += 1
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """Per span name, over all labels: the number of spans and their total seconds."""
+        summary = defaultdict(lambda: {'count': 0, 'seconds': 0.0})
+        with self._lock:
+            for (name, _), histogram in self._spans.items():
+                summary[name]['count'] += histogram[-1]
+                summary[name]['seconds'] += histogram[-2]
+        return dict(summary)
+
+    def prometheus_text(self) -> str:
+        metric = f'{self.prefix}_span_seconds'
+        lines = [f'# HELP {metric} Duration of pipeline spans.', f'# TYPE {metric} histogram']
+        with self._lock:
+            for (name, labels), histogram in sorted(self._spans.items()):
+                labels = (('span', name),) + labels
+                for bound, observations in zip(SPAN_BUCKETS, histogram):
+                    lines.append(f'{metric}_bucket{_format_labels(labels + (("le", str(bound)),))} {observations}')
+                lines.append(f'{metric}_bucket{_format_labels(labels + (("le", "+Inf"),))} {histogram[-1]}')
+                lines.append(f'{metric}_sum{_format_labels(labels)} {histogram[-2]}')
+                lines.append(f'{metric}_count{_format_labels(labels)} {histogram[-1]}')
+            names = sorted({name for name, _ in self._counters})
+            for name in names:
+                lines.append(f'# TYPE {self.prefix}_{name}_total counter')
+                for (counter, labels), total in sorted(self._counters.items()):
+                    if counter == name:
+                        lines.append(f'{self.prefix}_{name}_total{_format_labels(labels)} {total:g}')
+        return '\n'.join(lines) + '\n'
+
+    def write_prometheus(self, path: Optional[str] = None):
+        """Writes the aggregates in Prometheus text format, atomically so a scrape never sees half a file."""
+        path = path or self.prometheus_path
+        if not path:
+            return
+        with open(path + '.tmp', 'w', encoding='utf-8') as f:
+            f.write(self.prometheus_text())
+        os.replace(path + '.tmp', path)
+
+# The process-wide instance everything records into
+metrics = Metrics()
+
+def traced_call(fn, *args):
+    """Runs fn(*args) (in a worker process), returning its result and the metrics it recorded for merge()."""
+    with metrics.capture() as events:
+        result = fn(*args)
+    return result, events
@@ -0,0 +1,55 @@
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+# A stage is any hashable object with 'inputs' and 'outputs', sequences of the result names it reads and writes
+
+def run_stages(stages: Sequence, available: Iterable[str], run_stage: Callable,
+               max_workers: Optional[int] = None) -> Dict[object, Tuple[float, float]]:
+    """Runs every stage as soon as all of its inputs are available, independent stages concurrently on threads.
+
+    available names the inputs present from the start. Returns each stage's (start, end) in seconds since the run
+    began. The first stage error is re-raised once the stages still running have finished; stages that have not
+    started by then never do.
+    """
+    available = set(available)
+    pending = list(stages)
+    running = {}
+    timings = {}
+    origin = time.perf_counter()
+
+    def timed(stage):
+        start = time.perf_counter() - origin
+        run_stage(stage)
+        return start, time.perf_counter() - origin
+
+    with ThreadPoolExecutor(max_workers=max_workers or max(len(pending), 1), thread_name_prefix='stage') as executor:
+        while pending or running:
+            for stage in [stage for stage in pending if set(stage.inputs) <= available]:
+                pending.remove(stage)
+                running[executor.submit(timed, stage)] = stage
+            if not running:
+                missing = sorted({name for stage in pending for name in stage.inputs} - available)
+                raise ValueError(f"No stage produces the inputs {missing}")
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                stage = running.pop(future)
+                timings[stage] = future.result()
+                available.update(stage.outputs)
+    return timings
+
+def critical_path(timings: Dict[object, Tuple[float, float]]) -> List:
+    """The chain of stages that determined the total run time: from the last stage to finish, back through the
+    input dependency that finished last at each step."""
+    if not timings:
+        return []
+    producers = {output: stage for stage in timings for output in stage.outputs}
+    stage = max(timings, key=lambda stage: timings[stage][1])
+    path = [stage]
+    while True:
+        dependencies = {producers[name] for name in stage.inputs if name in producers}
+        if not dependencies:
+            break
+        stage = max(dependencies, key=lambda stage: timings[stage][1])
+        path.append(stage)
+    return path[::-1]